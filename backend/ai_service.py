@@ -1,10 +1,26 @@
 from sqlalchemy.orm import Session
-from typing import List
+from typing import TYPE_CHECKING, List, Callable, Iterator, Optional
+import asyncio
 import os
 import json
-from openai import OpenAI
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import AsyncOpenAI, OpenAI
 from dotenv import load_dotenv
-import models, schemas, crud
+import models, schemas, crud, crud_async, metrics
+from llm_cache import llm_cache, make_key
+from reference_cache import reference_cache
+from llm_client import ResilientLLM
+from prompt_budget import INPUT_TOKEN_BUDGET, compact, count_tokens, fit_requirements, prepare_requirements
+from scope_chunking import merge_tasks, split_requirements
+from similarity_index import similarity_index
+
+logger = logging.getLogger(__name__)
+
+if TYPE_CHECKING: # sqlalchemy.ext.asyncio is only imported when async mode is used
+    from sqlalchemy.ext.asyncio import AsyncSession
 
 # Load environment variables (.env)
 load_dotenv()
@@ -12,33 +28,34 @@ load_dotenv()
 # OpenAI Client Configuration (Compatible with OpenRouter)
 client = OpenAI(
     api_key=os.getenv("OPENAI_API_KEY"),
-    base_url=os.getenv("OPENAI_BASE_URL")  # Use https://openrouter.ai/api/v1 for OpenRouter
+    base_url=os.getenv("OPENAI_BASE_URL"),  # Use https://openrouter.ai/api/v1 for OpenRouter
+    max_retries=0 # Retries, timeouts and model fallback are handled by ResilientLLM
+)
+# Same settings for async mode (async_api.py), whose requests await the model on the event loop
+async_client = AsyncOpenAI(
+    api_key=os.getenv("OPENAI_API_KEY"),
+    base_url=os.getenv("OPENAI_BASE_URL"),
+    max_retries=0
 )
-DEFAULT_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+# Tries OPENAI_MODEL first, then OPENAI_FALLBACK_MODELS (see llm_client.py)
+llm = ResilientLLM(client, async_client=async_client)
+DEFAULT_MODEL = llm.primary_model
+# When every model fails: "1" saves a placeholder estimate per role, "0" fails the request
+STATIC_FALLBACK = os.getenv("AI_STATIC_FALLBACK", "1").lower() in ("1", "true", "yes")
 
-class AIService:
-    """
-    AI Service that generates quote scope based on requirements and selected roles
-    using OpenAI's GPT models.
-    """
+# Map-reduce mode for long documents: sections are estimated in parallel, then merged
+CHUNK_THRESHOLD_CHARS = int(os.getenv("AI_CHUNK_THRESHOLD_CHARS", "12000")) # "auto" switches above this
+CHUNK_MAX_CHARS = int(os.getenv("AI_CHUNK_MAX_CHARS", "8000"))
+CHUNK_CONCURRENCY = int(os.getenv("AI_CHUNK_CONCURRENCY", "4"))
+MAX_SCOPE_ITEMS = 12
 
-    @staticmethod
-    def generate_scope(db: Session, project: models.Project, quote_id: int, requirements: str, role_ids: List[int]) -> List[models.QuoteItem]:
-        print(f"DEBUG: Generating scope for Quote {quote_id} via OpenAI")
-        
-        # 1. Get all roles to match selected IDs
-        all_roles = crud.get_roles(db)
-        requested_ids = set(int(rid) for rid in role_ids)
-        selected_roles = [r for r in all_roles if r.id in requested_ids]
-        
-        if not selected_roles:
-            print("WARNING: No roles found matching requested IDs.")
-            return []
+# Finalized history (similarity_index.py): few-shot examples per prompt (0 = off) and the
+# project similarity above which its items are reused without calling the model (> 1 = off)
+HISTORY_EXAMPLES = int(os.getenv("AI_HISTORY_EXAMPLES", "5"))
+REUSE_THRESHOLD = float(os.getenv("AI_REUSE_THRESHOLD", "0.92"))
 
-        # Prepare context for the prompt
-        roles_info = [{"id": r.id, "name": r.name} for r in selected_roles]
-        
-        system_prompt = """
+# Prompts are compacted once at import: no indentation or blank-line runs are sent (see prompt_budget.py)
+SYSTEM_PROMPT = compact("""
         Eres un experto en arquitectura y estimación de software. Tu objetivo es transformar requerimientos detallados en un resumen ejecutivo de ALCANCE TÉCNICO.
         
         REGLAS DE ESTIMACIÓN (PUNTO MEDIO):
@@ -53,68 +70,694 @@ class AIService:
         5. No incluyas texto fuera del JSON.
         6. Usa el idioma Español para las descripciones.
         7. Máximo 10-12 items totales para mantener el resumen legible.
-        """
+        """)
+
+CHUNK_SYSTEM_PROMPT = compact("""
+        Eres un experto en estimación de software. Recibirás UNA SECCIÓN de un documento de requerimientos más grande.
+        Estima únicamente el trabajo descrito en esta sección (punto medio profesional, ni inflado ni mínimo teórico).
+        Agrupa los detalles en funcionalidades y asigna cada una al rol más adecuado.
         
-        user_prompt = f"""
-        PROYECTO: {project.name}
-        REQUERIMIENTOS DETALLADOS: 
-        {requirements}
+        FORMATO DE RESPUESTA (JSON):
+           {"items": [{"role_id": int, "description": "Funcionalidad", "hours": float}]}
         
-        ROLES DISPONIBLES (ID y Nombre): {json.dumps(roles_info)}
+        No incluyas texto fuera del JSON. Usa el idioma Español para las descripciones.
+        """)
+
+MERGE_SYSTEM_PROMPT = compact("""
+        Eres un experto en arquitectura y estimación de software. Recibirás estimaciones parciales, hechas por separado
+        para cada sección de un mismo documento de requerimientos.
+        
+        1. Elimina duplicados: una misma funcionalidad mencionada en varias secciones se cuenta una sola vez.
+        2. Agrupa funcionalidades relacionadas en "Funcionalidades Principales" o "Módulos" por rol.
+        3. Conserva el total de horas de las estimaciones parciales, salvo lo que elimines por duplicado.
+        4. Máximo 10-12 items totales.
+        
+        FORMATO DE RESPUESTA (JSON):
+           {"items": [{"role_id": int, "description": "Resumen de Funcionalidad", "hours": float}]}
+        
+        No incluyas texto fuera del JSON. Usa el idioma Español para las descripciones.
+        """)
+
+
+def _json(data) -> str:
+    # Compact separators and real accents: "\u00e9" and ", " cost tokens for nothing
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class UsageTally:
+    """Token usage of every completion made for one generation (map-reduce calls run on several threads)."""
+
+    def __init__(self):
+        self.model = None
+        self.calls = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, model: str, usage, prompt_text: str = "", content: str = ""):
+        # Providers that don't report usage are counted locally
+        input_tokens = getattr(usage, "prompt_tokens", None) or count_tokens(prompt_text)
+        output_tokens = getattr(usage, "completion_tokens", None) or count_tokens(content)
+        with self._lock:
+            self.model = self.model or model
+            self.calls += 1
+            self.input_tokens += input_tokens
+            self.output_tokens += output_tokens
+
+
+class ScopeItemParser:
+    """
+    Incremental parser for the {"items": [...]} payload of a streamed completion.
+    feed() takes the next text fragment and returns the item objects completed by it,
+    so each item can be used as soon as its closing brace arrives.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0 # Next character to scan
+        self.in_array = False
+        self.done = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+
+    def feed(self, text: str) -> List[dict]:
+        self.buffer += text
+        items = []
+        if not self.in_array:
+            key = self.buffer.find('"items"')
+            bracket = self.buffer.find("[", key) if key >= 0 else -1
+            if bracket < 0:
+                return items
+            self.in_array = True
+            self.pos = bracket + 1
+
+        while self.pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self.pos]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "{":
+                if self.depth == 0:
+                    self.item_start = self.pos
+                self.depth += 1
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    items.append(json.loads(self.buffer[self.item_start:self.pos + 1]))
+            elif ch == "]" and self.depth == 0:
+                self.done = True
+            self.pos += 1
+        return items
+
+
+class ScopeRun:
+    """State of one scope generation, shared by generate_scope and agenerate_scope."""
+
+    def __init__(self):
+        self.roles_by_id = {}
+        self.requested_ids = set()
+        self.selected_roles = []
+        self.roles_info: List[dict] = []
+        self.requirements = ""
+        self.chunked = False
+        self.system_prompt = SYSTEM_PROMPT
+        self.log: dict = {}
+        self.cache_key = None
+        self.cached: Optional[str] = None
+        self.reused = None # (match, tasks) from _reusable_scope
+        self.tally = UsageTally()
+
+
+class AIService:
+    """
+    AI Service that generates quote scope based on requirements and selected roles
+    using OpenAI's GPT models.
+    """
+
+    @staticmethod
+    def _select_roles(db: Session, role_ids: List[int]):
+        # Cached id -> role dict, see reference_cache.py
+        roles_by_id = reference_cache.roles_by_id(db)
+        requested_ids = set(int(rid) for rid in role_ids)
+        selected_roles = [roles_by_id[rid] for rid in sorted(requested_ids) if rid in roles_by_id]
+        return roles_by_id, requested_ids, selected_roles
+
+    @staticmethod
+    def _user_prompt(project: models.Project, requirements: str, roles_info: List[dict],
+                     examples: Optional[List[dict]] = None) -> str:
+        lines = [f"PROYECTO: {project.name}", "REQUERIMIENTOS DETALLADOS:", requirements, "",
+                 f"ROLES DISPONIBLES (ID y Nombre): {_json(roles_info)}"]
+        if examples:
+            lines += ["REFERENCIAS HISTÓRICAS (funcionalidades similares ya cotizadas, úsalas como guía de horas):",
+                      _json(examples)]
+        lines.append("Por favor, analiza todo el detalle anterior pero presenta un RESUMEN DE FUNCIONALIDADES clave "
+                     "con sus horas estimadas (punto medio).")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _fit_prompt(project: models.Project, requirements: str, roles_info: List[dict], examples: List[dict],
+                    system_prompt: str, report: Callable[[str], None]):
+        """(user_prompt, input_tokens, truncated) within INPUT_TOKEN_BUDGET: drops the examples first, then cuts sections."""
+        user_prompt = AIService._user_prompt(project, requirements, roles_info, examples)
+        tokens = count_tokens(system_prompt) + count_tokens(user_prompt)
+        if tokens <= INPUT_TOKEN_BUDGET:
+            return user_prompt, tokens, False
+        if examples:
+            report("Referencias históricas omitidas por límite de tokens")
+            return AIService._fit_prompt(project, requirements, roles_info, [], system_prompt, report)
+
+        fixed = tokens - count_tokens(requirements)
+        requirements, truncated = fit_requirements(requirements, max(INPUT_TOKEN_BUDGET - fixed, 0))
+        metrics.AI_PROMPT_TRUNCATIONS.inc()
+        report(f"Requerimientos recortados a {INPUT_TOKEN_BUDGET} tokens de entrada")
+        user_prompt = AIService._user_prompt(project, requirements, roles_info)
+        return user_prompt, count_tokens(system_prompt) + count_tokens(user_prompt), truncated
+
+    @staticmethod
+    def _history_examples(requirements: str, requested_ids) -> List[dict]:
+        if HISTORY_EXAMPLES <= 0:
+            return []
+        try:
+            matches = similarity_index.search(requirements, kind="item", role_ids=requested_ids, limit=HISTORY_EXAMPLES)
+        except Exception as e:
+            logger.warning("Similarity index unavailable: %s", e)
+            return []
+        return [{"role_id": m["role_id"], "description": m["text"], "hours": m["hours"]} for m in matches]
+
+    @staticmethod
+    def _reusable_scope(requirements: str, requested_ids):
+        """(match, tasks) from a finalized project with near-identical requirements, or None."""
+        if REUSE_THRESHOLD > 1:
+            return None
+        try:
+            for match in similarity_index.search(requirements, kind="project", limit=3, min_score=REUSE_THRESHOLD):
+                items = similarity_index.project_items(match["project_id"])
+                # Only when every past item maps onto a requested role, otherwise work would go missing
+                if items and all(i["role_id"] in requested_ids for i in items):
+                    return match, [{"role_id": i["role_id"], "description": i["text"], "hours": i["hours"]} for i in items]
+        except Exception as e:
+            logger.warning("Similarity index unavailable: %s", e)
+        return None
+
+    @staticmethod
+    def _chunk_prompt(project: models.Project, chunk: str, index: int, total: int, roles_info: List[dict]) -> str:
+        return "\n".join([f"PROYECTO: {project.name}", f"SECCIÓN {index + 1} DE {total} DE LOS REQUERIMIENTOS:", chunk, "",
+                          f"ROLES DISPONIBLES (ID y Nombre): {_json(roles_info)}"])
+
+    @staticmethod
+    def _merge_prompt(project: models.Project, tasks: List[dict], roles_info: List[dict]) -> str:
+        return "\n".join([f"PROYECTO: {project.name}", "ESTIMACIONES PARCIALES POR SECCIÓN:", _json(tasks), "",
+                          f"ROLES DISPONIBLES (ID y Nombre): {_json(roles_info)}"])
+
+    @staticmethod
+    def _complete_json(system_prompt: str, user_prompt: str, mode: str = "json",
+                       tally: Optional[UsageTally] = None) -> str:
+        """One JSON-mode chat completion; returns the raw message content. Safe to call from worker threads."""
+        model, response = llm.create(mode=mode, **AIService._json_request(system_prompt, user_prompt))
+        return AIService._json_content(model, response, system_prompt, user_prompt, tally)
+
+    @staticmethod
+    async def _acomplete_json(system_prompt: str, user_prompt: str, mode: str = "json",
+                              tally: Optional[UsageTally] = None) -> str:
+        """_complete_json on the async client (async mode)."""
+        model, response = await llm.acreate(mode=mode, **AIService._json_request(system_prompt, user_prompt))
+        return AIService._json_content(model, response, system_prompt, user_prompt, tally)
+
+    @staticmethod
+    def _json_request(system_prompt: str, user_prompt: str) -> dict:
+        return dict(
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            response_format={"type": "json_object"}
+        )
+
+    @staticmethod
+    def _json_content(model: str, response, system_prompt: str, user_prompt: str, tally: Optional[UsageTally]) -> str:
+        content = response.choices[0].message.content
+        if tally is not None:
+            tally.add(model, getattr(response, "usage", None), system_prompt + user_prompt, content)
+        return content
+
+    @staticmethod
+    def _cached_partials(db: Session, chunks: List[str], roles_info: List[dict], use_cache: bool):
+        """Per-section estimates already in the response cache: (partial, [(idx, cache key) still to estimate])."""
+        partial = [None] * len(chunks)
+        pending = []
+        for idx, chunk in enumerate(chunks):
+            key = make_key(DEFAULT_MODEL, CHUNK_SYSTEM_PROMPT, chunk, roles_info)
+            cached = llm_cache.get(db, key) if use_cache else None
+            if cached is not None:
+                partial[idx] = json.loads(cached).get("items", [])
+            else:
+                pending.append((idx, key))
+        return partial, pending
+
+    @staticmethod
+    def _merge_input(project: models.Project, partial: List[Optional[List[dict]]], roles_info: List[dict],
+                     report: Callable[[str], None]):
+        """(tasks, merge prompt) from the section estimates; the prompt is None when there is nothing to merge."""
+        estimated = [items for items in partial if items is not None]
+        if not estimated:
+            raise RuntimeError("No se pudo estimar ninguna sección de los requerimientos")
+        if len(estimated) < len(partial):
+            report(f"Secciones sin estimar: {len(partial) - len(estimated)}")
+        tasks = [task for items in estimated for task in items]
+        if len(partial) == 1:
+            return tasks, None
+
+        report("Consolidando estimaciones")
+        merge_prompt = AIService._merge_prompt(project, tasks, roles_info)
+        while count_tokens(MERGE_SYSTEM_PROMPT) + count_tokens(merge_prompt) > INPUT_TOKEN_BUDGET and len(tasks) > MAX_SCOPE_ITEMS:
+            # Too many partial items for one prompt: fold the smallest ones per role first
+            folded = merge_tasks(tasks, max(MAX_SCOPE_ITEMS, len(tasks) * 2 // 3))
+            if len(folded) == len(tasks):
+                break
+            tasks = folded
+            merge_prompt = AIService._merge_prompt(project, tasks, roles_info)
+        return tasks, merge_prompt
+
+    @staticmethod
+    def _map_reduce(db: Session, project: models.Project, requirements: str, roles_info: List[dict],
+                    use_cache: bool, report: Callable[[str], None], tally: Optional[UsageTally] = None) -> List[dict]:
+        """
+        Estimate each section of a long document concurrently (at most CHUNK_CONCURRENCY
+        completions in flight), then merge the partial estimates into one summarized scope.
+        """
+        chunks = split_requirements(requirements, CHUNK_MAX_CHARS)
+        report(f"Requerimientos divididos en {len(chunks)} secciones")
+
+        # Cache lookups/writes stay on this thread: the Session is not thread-safe
+        partial, pending = AIService._cached_partials(db, chunks, roles_info, use_cache)
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(CHUNK_CONCURRENCY, len(pending)), thread_name_prefix="ai-chunk") as pool:
+                futures = {
+                    pool.submit(AIService._complete_json, CHUNK_SYSTEM_PROMPT,
+                                AIService._chunk_prompt(project, chunks[idx], idx, len(chunks), roles_info), "map",
+                                tally): (idx, key)
+                    for idx, key in pending
+                }
+                for done, future in enumerate(as_completed(futures), start=1):
+                    idx, key = futures[future]
+                    try:
+                        content = future.result()
+                        partial[idx] = json.loads(content).get("items", [])
+                        llm_cache.put(db, key, DEFAULT_MODEL, content)
+                    except Exception as e:
+                        metrics.AI_SECTION_FAILURES.inc(stage="map")
+                        logger.error("Estimating section %d of %d failed: %s", idx + 1, len(chunks), e)
+                    report(f"Secciones estimadas: {done}/{len(pending)}")
+
+        tasks, merge_prompt = AIService._merge_input(project, partial, roles_info, report)
+        if merge_prompt is None:
+            return tasks
+        try:
+            merged = json.loads(AIService._complete_json(MERGE_SYSTEM_PROMPT, merge_prompt, "reduce", tally)).get("items", [])
+            if merged:
+                return merged
+        except Exception as e:
+            metrics.AI_SECTION_FAILURES.inc(stage="reduce")
+            logger.error("Merging %d sections failed, using the deterministic merge: %s", len(chunks), e)
+        # Deterministic merge when the reduce pass fails or comes back empty
+        return merge_tasks(tasks, MAX_SCOPE_ITEMS)
+
+    @staticmethod
+    async def _amap_reduce(db: "AsyncSession", project: models.Project, requirements: str, roles_info: List[dict],
+                           use_cache: bool, report: Callable[[str], None], tally: Optional[UsageTally] = None) -> List[dict]:
+        """_map_reduce with the sections estimated as coroutines on the event loop instead of a thread pool."""
+        chunks = split_requirements(requirements, CHUNK_MAX_CHARS)
+        report(f"Requerimientos divididos en {len(chunks)} secciones")
+
+        partial, pending = await db.run_sync(AIService._cached_partials, chunks, roles_info, use_cache)
+        if pending:
+            semaphore = asyncio.Semaphore(CHUNK_CONCURRENCY)
+
+            async def estimate(idx: int, key: str):
+                async with semaphore:
+                    try:
+                        return idx, key, await AIService._acomplete_json(
+                            CHUNK_SYSTEM_PROMPT, AIService._chunk_prompt(project, chunks[idx], idx, len(chunks), roles_info),
+                            "map", tally), None
+                    except Exception as e:
+                        return idx, key, None, e
+
+            for done, next_done in enumerate(asyncio.as_completed([estimate(idx, key) for idx, key in pending]), start=1):
+                idx, key, content, error = await next_done
+                if error is None:
+                    try:
+                        partial[idx] = json.loads(content).get("items", [])
+                        await db.run_sync(llm_cache.put, key, DEFAULT_MODEL, content)
+                    except Exception as e:
+                        error = e
+                if error is not None:
+                    metrics.AI_SECTION_FAILURES.inc(stage="map")
+                    logger.error("Estimating section %d of %d failed: %s", idx + 1, len(chunks), error)
+                report(f"Secciones estimadas: {done}/{len(pending)}")
+
+        tasks, merge_prompt = AIService._merge_input(project, partial, roles_info, report)
+        if merge_prompt is None:
+            return tasks
+        try:
+            content = await AIService._acomplete_json(MERGE_SYSTEM_PROMPT, merge_prompt, "reduce", tally)
+            merged = json.loads(content).get("items", [])
+            if merged:
+                return merged
+        except Exception as e:
+            metrics.AI_SECTION_FAILURES.inc(stage="reduce")
+            logger.error("Merging %d sections failed, using the deterministic merge: %s", len(chunks), e)
+        return merge_tasks(tasks, MAX_SCOPE_ITEMS)
+
+    @staticmethod
+    def _static_fallback(selected_roles, error: Exception, report: Callable[[str], None]) -> List[dict]:
+        # Last resort once ResilientLLM gave up: never let placeholder hours pass unnoticed
+        if not STATIC_FALLBACK:
+            raise error
+        metrics.LLM_FALLBACKS.inc(kind="static")
+        report(f"IA no disponible, se usó una estimación base por rol: {str(error)[:100]}")
+        return AIService._fallback_tasks(selected_roles, error)
+
+    @staticmethod
+    def _fallback_tasks(selected_roles, error: Exception) -> List[dict]:
+        # Fallback simple logic if OpenAI fails
+        return [{
+            "role_id": role.id,
+            "description": f"Estimación base para {role.name} (Error AI: {str(error)[:50]})",
+            "hours": 8.0
+        } for role in selected_roles]
+
+    @staticmethod
+    def _task_to_item(task: dict, idx: int, requested_ids, roles_by_id) -> Optional[schemas.QuoteItemCreate]:
+        # Basic validation to ensure role_id is valid
+        rid = int(task.get('role_id', -1))
+        if rid not in requested_ids:
+            return None
+
+        role = roles_by_id.get(rid)
+        rate = role.hourly_rate if role else 0.0
         
-        Por favor, analiza todo el detalle anterior pero presenta un RESUMEN DE FUNCIONALIDADES clave con sus horas estimadas (punto medio).
+        return schemas.QuoteItemCreate(
+            role_id=rid,
+            description=task.get('description', 'Tarea sin descripción'),
+            manual_hours=task.get('hours', 0.0),
+            hourly_rate=rate,
+            ai_suggested_hours=task.get('hours', 0.0),
+            sequence=idx
+        )
+
+    @staticmethod
+    def _prepare_scope(db: Session, project: models.Project, requirements: str, role_ids: List[int],
+                       report: Callable[[str], None], use_cache: bool, mode: str) -> Optional[ScopeRun]:
+        """Database and prompt work done before calling the model; None when no requested role exists."""
+        run = ScopeRun()
+
+        # 1. Get all roles to match selected IDs
+        run.roles_by_id, run.requested_ids, run.selected_roles = AIService._select_roles(db, role_ids)
+
+        if not run.selected_roles:
+            logger.warning("No roles found matching requested IDs %s", role_ids)
+            return None
+
+        # Prepare context for the prompt
+        run.roles_info = [{"id": r.id, "name": r.name} for r in run.selected_roles]
+        report(f"Roles cargados: {len(run.selected_roles)}")
+
+        # Whitespace and repeated passages cost tokens and add nothing (see prompt_budget.py)
+        run.requirements, removed = prepare_requirements(requirements)
+        if removed:
+            report(f"Pasajes repetidos omitidos: {removed}")
+
+        # "auto" also switches to map-reduce when a single prompt would not fit the input budget
+        run.chunked = mode == "chunked" or (mode == "auto" and (
+            len(run.requirements) > CHUNK_THRESHOLD_CHARS or
+            count_tokens(SYSTEM_PROMPT) + count_tokens(AIService._user_prompt(project, run.requirements, run.roles_info)) > INPUT_TOKEN_BUDGET
+        ))
+        run.system_prompt = CHUNK_SYSTEM_PROMPT + MERGE_SYSTEM_PROMPT if run.chunked else SYSTEM_PROMPT
+        run.log = {"mode": "chunked" if run.chunked else "single", "source": "llm", "removed_passages": removed,
+                   "estimated_input_tokens": 0, "truncated": 0}
+
+        # Identical prompts are served from the response cache (use_cache=False forces a refresh)
+        run.cache_key = make_key(DEFAULT_MODEL, run.system_prompt, run.requirements, run.roles_info)
+        run.cached = llm_cache.get(db, run.cache_key) if use_cache else None
+        return run
+
+    @staticmethod
+    def _stored_tasks(run: ScopeRun, report: Callable[[str], None]) -> Optional[List[dict]]:
+        """Tasks from the response cache or a reused finalized project; None when the model must be called."""
+        if run.cached is not None:
+            run.log["source"] = "cache"
+            report("Respuesta obtenida de caché")
+            return json.loads(run.cached).get("items", [])
+        if run.reused is not None:
+            run.log["source"] = "reuse"
+            match, tasks = run.reused
+            report(f"Reutilizando estimación del proyecto #{match['project_id']} (similitud {match['score']:.2f})")
+            return tasks
+        if not os.getenv("OPENAI_API_KEY"):
+             raise ValueError("Falta OPENAI_API_KEY en el archivo .env")
+        report("Consultando modelo de IA")
+        return None
+
+    @staticmethod
+    def _single_prompt(project: models.Project, run: ScopeRun, examples: List[dict], report: Callable[[str], None]) -> str:
+        user_prompt, run.log["estimated_input_tokens"], truncated = AIService._fit_prompt(
+            project, run.requirements, run.roles_info, examples, run.system_prompt, report)
+        run.log["truncated"] = int(truncated)
+        return user_prompt
+
+    @staticmethod
+    def _failed_tasks(run: ScopeRun, error: Exception, report: Callable[[str], None]) -> List[dict]:
+        logger.error("Calling OpenAI failed: %s", error)
+        run.log["source"] = "fallback"
+        return AIService._static_fallback(run.selected_roles, error, report)
+
+    @staticmethod
+    def _scope_items(run: ScopeRun, suggested_tasks: List[dict], report: Callable[[str], None]) -> List[schemas.QuoteItemCreate]:
+        # 2. Convert to QuoteItems
+        report(f"Guardando {len(suggested_tasks)} items")
+        new_items = []
+        for idx, task in enumerate(suggested_tasks):
+            item_in = AIService._task_to_item(task, idx, run.requested_ids, run.roles_by_id)
+            if item_in is not None:
+                new_items.append(item_in)
+        return new_items
+
+    @staticmethod
+    def generate_scope(db: Session, project: models.Project, quote_id: int, requirements: str, role_ids: List[int],
+                       progress: Optional[Callable[[str], None]] = None, use_cache: bool = True,
+                       mode: str = "auto") -> List[models.QuoteItem]:
+        """
+        mode: "single" sends the whole document in one prompt, "chunked" uses the
+        map-reduce path (_map_reduce), "auto" picks chunked above CHUNK_THRESHOLD_CHARS.
+        """
+        logger.debug("Generating scope for quote %s via OpenAI", quote_id)
+        # Optional progress hook, used by background jobs to report status
+        report = progress or (lambda message: None)
+        started = time.perf_counter()
+
+        run = AIService._prepare_scope(db, project, requirements, role_ids, report, use_cache, mode)
+        if run is None:
+            return []
+        if use_cache and run.cached is None:
+            run.reused = AIService._reusable_scope(run.requirements, run.requested_ids)
+
+        try:
+            suggested_tasks = AIService._stored_tasks(run, report)
+            if suggested_tasks is None:
+                if run.chunked:
+                    suggested_tasks = AIService._map_reduce(db, project, run.requirements, run.roles_info, use_cache,
+                                                            report, run.tally)
+                    content = json.dumps({"items": suggested_tasks}, ensure_ascii=False)
+                else:
+                    examples = AIService._history_examples(run.requirements, run.requested_ids)
+                    user_prompt = AIService._single_prompt(project, run, examples, report)
+                    content = AIService._complete_json(run.system_prompt, user_prompt, tally=run.tally)
+                    suggested_tasks = json.loads(content).get("items", [])
+                llm_cache.put(db, run.cache_key, DEFAULT_MODEL, content)
+
+                logger.debug("OpenAI generated %d tasks", len(suggested_tasks))
+
+        except Exception as e:
+            suggested_tasks = AIService._failed_tasks(run, e, report)
+
+        # Single bulk insert + commit for the whole scope
+        created = crud.add_quote_items(db, quote_id, AIService._scope_items(run, suggested_tasks, report))
+        AIService._log_generation(db, quote_id, run.tally, run.log, started)
+        return created
+
+    @staticmethod
+    async def agenerate_scope(db: "AsyncSession", project: models.Project, quote_id: int, requirements: str,
+                              role_ids: List[int], progress: Optional[Callable[[str], None]] = None,
+                              use_cache: bool = True, mode: str = "auto") -> List[models.QuoteItem]:
+        """
+        generate_scope for async mode (async_api.py): the completions go through the async
+        OpenAI client on the request's event loop, the database through an AsyncSession.
+        Same prompts, caches, fallback and usage log as the sync path.
         """
+        logger.debug("Generating scope for quote %s via OpenAI (async)", quote_id)
+        report = progress or (lambda message: None)
+        started = time.perf_counter()
+
+        # Reference/response caches are sync APIs: run_sync gives them the AsyncSession's connection
+        run = await db.run_sync(AIService._prepare_scope, project, requirements, role_ids, report, use_cache, mode)
+        if run is None:
+            return []
+        if use_cache and run.cached is None:
+            # Similarity search is CPU work: keep it off the event loop
+            run.reused = await asyncio.to_thread(AIService._reusable_scope, run.requirements, run.requested_ids)
 
+        try:
+            suggested_tasks = AIService._stored_tasks(run, report)
+            if suggested_tasks is None:
+                if run.chunked:
+                    suggested_tasks = await AIService._amap_reduce(db, project, run.requirements, run.roles_info,
+                                                                   use_cache, report, run.tally)
+                    content = json.dumps({"items": suggested_tasks}, ensure_ascii=False)
+                else:
+                    examples = await asyncio.to_thread(AIService._history_examples, run.requirements, run.requested_ids)
+                    user_prompt = AIService._single_prompt(project, run, examples, report)
+                    content = await AIService._acomplete_json(run.system_prompt, user_prompt, tally=run.tally)
+                    suggested_tasks = json.loads(content).get("items", [])
+                await db.run_sync(llm_cache.put, run.cache_key, DEFAULT_MODEL, content)
+
+                logger.debug("OpenAI generated %d tasks", len(suggested_tasks))
+
+        except Exception as e:
+            suggested_tasks = AIService._failed_tasks(run, e, report)
+
+        created = await crud_async.add_quote_items(db, quote_id, AIService._scope_items(run, suggested_tasks, report))
+        fields = AIService._generation_fields(quote_id, run.tally, run.log, started)
+        try:
+            await crud_async.log_ai_generation(db, quote_id, **fields)
+        except Exception as e:
+            await db.rollback()
+            logger.warning("Could not log AI generation for quote %s: %s", quote_id, e)
+        return created
+
+    @staticmethod
+    def _generation_fields(quote_id: int, tally: UsageTally, log: dict, started: float) -> dict:
+        if not log["estimated_input_tokens"] and tally.calls:
+            log["estimated_input_tokens"] = tally.input_tokens
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info("Quote %s generation (%s, %s): %d call(s), %d input / %d output tokens, %s ms", quote_id,
+                    log["mode"], log["source"], tally.calls, tally.input_tokens, tally.output_tokens, duration_ms)
+        return dict(model=tally.model or DEFAULT_MODEL, llm_calls=tally.calls, input_tokens=tally.input_tokens,
+                    output_tokens=tally.output_tokens, duration_ms=duration_ms, **log)
+
+    @staticmethod
+    def _log_generation(db: Session, quote_id: int, tally: UsageTally, log: dict, started: float):
+        fields = AIService._generation_fields(quote_id, tally, log, started)
+        try:
+            crud.log_ai_generation(db, quote_id, **fields)
+        except Exception as e:
+            # Accounting must never cost the user their generated scope
+            db.rollback()
+            logger.warning("Could not log AI generation for quote %s: %s", quote_id, e)
+
+    @staticmethod
+    def stream_scope(db: Session, project: models.Project, quote_id: int, requirements: str, role_ids: List[int],
+                     progress: Optional[Callable[[str], None]] = None, use_cache: bool = True) -> Iterator[models.QuoteItem]:
+        """
+        Streaming variant of generate_scope: yields each QuoteItem as soon as the model
+        has finished writing it, persisting it first. Same prompt, cache and fallback.
+        """
+        logger.debug("Streaming scope for quote %s via OpenAI", quote_id)
+        report = progress or (lambda message: None)
+        started = time.perf_counter()
+
+        roles_by_id, requested_ids, selected_roles = AIService._select_roles(db, role_ids)
+        if not selected_roles:
+            logger.warning("No roles found matching requested IDs %s", role_ids)
+            return
+
+        roles_info = [{"id": r.id, "name": r.name} for r in selected_roles]
+        report(f"Roles cargados: {len(selected_roles)}")
+
+        requirements, removed = prepare_requirements(requirements)
+        if removed:
+            report(f"Pasajes repetidos omitidos: {removed}")
+        tally = UsageTally()
+        log = {"mode": "stream", "source": "llm", "removed_passages": removed, "estimated_input_tokens": 0, "truncated": 0}
+
+        cache_key = make_key(DEFAULT_MODEL, SYSTEM_PROMPT, requirements, roles_info)
+        cached = llm_cache.get(db, cache_key) if use_cache else None
+        reused = AIService._reusable_scope(requirements, requested_ids) if use_cache and cached is None else None
+        if cached is not None or reused is not None:
+            if cached is not None:
+                log["source"] = "cache"
+                report("Respuesta obtenida de caché")
+                tasks = json.loads(cached).get("items", [])
+            else:
+                log["source"] = "reuse"
+                match, tasks = reused
+                report(f"Reutilizando estimación del proyecto #{match['project_id']} (similitud {match['score']:.2f})")
+            items = [AIService._task_to_item(task, idx, requested_ids, roles_by_id) for idx, task in enumerate(tasks)]
+            yield from crud.add_quote_items(db, quote_id, [i for i in items if i is not None])
+            AIService._log_generation(db, quote_id, tally, log, started)
+            return
+
+        parser = ScopeItemParser()
+        chunks = []
+        emitted = 0
+        task_count = 0
         try:
             if not os.getenv("OPENAI_API_KEY"):
                  raise ValueError("Falta OPENAI_API_KEY en el archivo .env")
 
-            response = client.chat.completions.create(
-                model=DEFAULT_MODEL,
+            report("Consultando modelo de IA")
+            examples = AIService._history_examples(requirements, requested_ids)
+            user_prompt, log["estimated_input_tokens"], truncated = AIService._fit_prompt(
+                project, requirements, roles_info, examples, SYSTEM_PROMPT, report)
+            log["truncated"] = int(truncated)
+            model, stream = llm.create(
                 messages=[
-                    {"role": "system", "content": system_prompt},
+                    {"role": "system", "content": SYSTEM_PROMPT},
                     {"role": "user", "content": user_prompt}
                 ],
-                response_format={"type": "json_object"}
+                response_format={"type": "json_object"},
+                stream=True,
+                stream_options={"include_usage": True} # Final chunk carries the token usage
             )
-            
-            content = response.choices[0].message.content
-            data = json.loads(content)
-            suggested_tasks = data.get("items", [])
-            
-            print(f"DEBUG: OpenAI generated {len(suggested_tasks)} tasks.")
+            usage = None
+            for chunk in stream:
+                if getattr(chunk, "usage", None) is not None:
+                    usage = chunk.usage
+                    metrics.record_llm_usage(model, usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                chunks.append(delta)
+                for task in parser.feed(delta):
+                    item_in = AIService._task_to_item(task, task_count, requested_ids, roles_by_id)
+                    task_count += 1
+                    if item_in is None:
+                        continue
+                    emitted += 1
+                    yield crud.add_quote_item(db, quote_id, item_in)
+
+            content = "".join(chunks)
+            tally.add(model, usage, SYSTEM_PROMPT + user_prompt, content)
+            json.loads(content) # Only cache complete, valid payloads
+            llm_cache.put(db, cache_key, DEFAULT_MODEL, content)
+            logger.debug("OpenAI streamed %d tasks", task_count)
 
         except Exception as e:
-            print(f"ERROR calling OpenAI: {e}")
-            # Fallback simple logic if OpenAI fails
-            suggested_tasks = []
-            for role in selected_roles:
-                suggested_tasks.append({
-                    "role_id": role.id,
-                    "description": f"Estimación base para {role.name} (Error AI: {str(e)[:50]})",
-                    "hours": 8.0
-                })
-
-        # 2. Convert to QuoteItems and Persist
-        created_items = []
-        for idx, task in enumerate(suggested_tasks):
-            # Basic validation to ensure role_id is valid
-            rid = int(task.get('role_id', -1))
-            if rid not in requested_ids:
-                continue
-
-            role = next((r for r in all_roles if r.id == rid), None)
-            rate = role.hourly_rate if role else 0.0
-            
-            item_in = schemas.QuoteItemCreate(
-                role_id=rid,
-                description=task.get('description', 'Tarea sin descripción'),
-                manual_hours=task.get('hours', 0.0),
-                hourly_rate=rate,
-                ai_suggested_hours=task.get('hours', 0.0),
-                sequence=idx
-            )
-            created_item = crud.add_quote_item(db, quote_id, item_in)
-            created_items.append(created_item)
-            
-        return created_items
+            logger.error("Calling OpenAI failed: %s", e)
+            if emitted:
+                # Keep what was already streamed and saved; just report the interruption
+                report(f"Generación interrumpida: {str(e)[:100]}")
+                AIService._log_generation(db, quote_id, tally, log, started)
+                return
+            log["source"] = "fallback"
+            tasks = AIService._static_fallback(selected_roles, e, report)
+            items = [AIService._task_to_item(task, idx, requested_ids, roles_by_id) for idx, task in enumerate(tasks)]
+            yield from crud.add_quote_items(db, quote_id, [i for i in items if i is not None])
+        AIService._log_generation(db, quote_id, tally, log, started)
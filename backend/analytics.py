@@ -0,0 +1,291 @@
+"""
+Precomputed analytics: hours, cost, revenue and AI estimate accuracy by role, client and status.
+
+Dashboards read analytics_summary, one row per role / client / status, so they
+cost the same whatever the number of quotes and items. Each project counts
+through its current quote (highest version); older versions are history.
+
+The summaries are kept up to date incrementally. crud marks the quotes and
+projects it changed (after the commit: no extra query on the write path) and a
+background thread refreshes them every ANALYTICS_REFRESH_SECONDS:
+
+    old contribution   analytics_projects / analytics_project_roles rows of the project
+    new contribution   recomputed from its current quote's items
+    analytics_summary  += new - old, with one INSERT ... ON CONFLICT DO UPDATE
+
+A refresh is idempotent, so a failed one is simply retried. Readers call flush()
+first to see their own writes. rebuild() (python manage.py rebuild-analytics)
+recomputes everything from scratch, e.g. after writes made outside crud.
+
+AI accuracy only counts items with an AI suggestion (ai_suggested_hours > 0):
+    ai_error_pct = Sum|manual - ai| / Sum(manual)        (weighted absolute error)
+    ai_bias_pct  = (Sum(ai) - Sum(manual)) / Sum(manual) (< 0: the AI underestimates)
+"""
+import os
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+from background_flusher import BackgroundFlusher
+from database import SessionLocal
+from pricing import total_price_sql
+
+ENABLED = os.getenv("ANALYTICS_ENABLED", "1").lower() in ("1", "true", "yes")
+REFRESH_SECONDS = float(os.getenv("ANALYTICS_REFRESH_SECONDS", "2.0"))
+BATCH_PROJECTS = int(os.getenv("ANALYTICS_BATCH_PROJECTS", "500"))
+MAX_PENDING = int(os.getenv("ANALYTICS_MAX_PENDING", "100000"))
+
+DIMENSIONS = ("role", "client", "status")
+MEASURES = ("items", "hours", "cost", "revenue", "ai_items", "ai_hours", "ai_manual_hours", "ai_abs_error")
+
+
+# --- Contributions ---
+
+def _current_quotes(project_ids: List[int]):
+    """(project_id, quote_id, total_price) of each project's current quote."""
+    Quote = models.Quote
+    ranked = (
+        select(Quote.project_id, Quote.id.label("quote_id"), Quote.total_price,
+               func.row_number().over(partition_by=Quote.project_id,
+                                      order_by=(func.coalesce(Quote.version, 1).desc(), Quote.id.desc())).label("rank"))
+        .where(Quote.project_id.in_(project_ids))
+        .subquery()
+    )
+    return select(ranked.c.project_id, ranked.c.quote_id, ranked.c.total_price).where(ranked.c.rank == 1).subquery()
+
+
+def _role_rows(db: Session, current) -> List[dict]:
+    Item, Quote = models.QuoteItem, models.Quote
+    hours = func.coalesce(Item.manual_hours, 0.0)
+    suggested = func.coalesce(Item.ai_suggested_hours, 0.0)
+    has_ai = suggested > 0
+    role_id = func.coalesce(Item.role_id, 0)
+    cost = func.sum(hours * func.coalesce(Item.hourly_rate, 0.0))
+    rows = db.execute(
+        select(current.c.project_id, role_id.label("role_id"),
+               func.count().label("items"),
+               func.sum(hours).label("hours"),
+               cost.label("cost"),
+               total_price_sql(cost, Quote.applied_risk, Quote.applied_margin, Quote.applied_tax).label("revenue"),
+               func.sum(case((has_ai, 1), else_=0)).label("ai_items"),
+               func.sum(case((has_ai, suggested), else_=0.0)).label("ai_hours"),
+               func.sum(case((has_ai, hours), else_=0.0)).label("ai_manual_hours"),
+               func.sum(case((has_ai, func.abs(hours - suggested)), else_=0.0)).label("ai_abs_error"))
+        .select_from(current)
+        .join(Item, Item.quote_id == current.c.quote_id)
+        .join(Quote, Quote.id == current.c.quote_id)
+        .group_by(current.c.project_id, role_id, Quote.applied_risk, Quote.applied_margin, Quote.applied_tax)
+    )
+    return [dict(row._mapping) for row in rows]
+
+
+def _add(deltas: Dict[tuple, Dict[str, float]], key: tuple, row: dict, sign: int):
+    delta = deltas[key]
+    delta["projects"] += sign
+    for measure in MEASURES:
+        delta[measure] += sign * (row[measure] or 0)
+
+
+def _snapshot(db: Session, model, project_ids: List[int]) -> List[dict]:
+    table = model.__table__
+    return [dict(row._mapping) for row in db.execute(select(table).where(table.c.project_id.in_(project_ids)))]
+
+
+def refresh_projects(db: Session, project_ids: Iterable[int]) -> int:
+    """Bring the projects' contribution to analytics_summary up to date. Does not commit."""
+    project_ids = sorted(set(project_ids))
+    if not project_ids:
+        return 0
+    Project = models.Project
+    # Locks the projects (PostgreSQL) so two workers refreshing the same one can't both apply its delta
+    projects = db.execute(select(Project.id, Project.client_name, Project.status)
+                          .where(Project.id.in_(project_ids)).with_for_update()).all()
+    current = _current_quotes(project_ids)
+    quotes = {row.project_id: row for row in db.execute(select(current))}
+    role_rows = _role_rows(db, current)
+
+    role_totals: Dict[int, Dict[str, float]] = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    for row in role_rows:
+        for measure in MEASURES:
+            role_totals[row["project_id"]][measure] += row[measure] or 0
+    new_projects = []
+    for project in projects:
+        totals = dict(role_totals[project.id])
+        quote = quotes.get(project.id)
+        totals["revenue"] = (quote.total_price or 0.0) if quote else 0.0
+        new_projects.append(dict(project_id=project.id, quote_id=quote.quote_id if quote else None,
+                                 client_name=project.client_name or "", status=project.status or "", **totals))
+
+    deltas: Dict[tuple, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+    for rows, sign in ((_snapshot(db, models.AnalyticsProject, project_ids), -1), (new_projects, 1)):
+        for row in rows:
+            _add(deltas, ("client", row["client_name"]), row, sign)
+            _add(deltas, ("status", row["status"]), row, sign)
+    for rows, sign in ((_snapshot(db, models.AnalyticsProjectRole, project_ids), -1), (role_rows, 1)):
+        for row in rows:
+            _add(deltas, ("role", str(row["role_id"])), row, sign)
+
+    for model in (models.AnalyticsProject, models.AnalyticsProjectRole):
+        db.execute(delete(model).where(model.project_id.in_(project_ids)))
+    if new_projects:
+        db.execute(models.AnalyticsProject.__table__.insert(), new_projects)
+    if role_rows:
+        db.execute(models.AnalyticsProjectRole.__table__.insert(), role_rows)
+
+    columns = ("projects",) + MEASURES
+    changed = [{"dimension": dimension, "key": key, **{c: delta[c] for c in columns}}
+               for (dimension, key), delta in deltas.items() if any(abs(value) > 1e-9 for value in delta.values())]
+    if changed:
+        Summary = models.AnalyticsSummary
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        stmt = insert(Summary)
+        stmt = stmt.on_conflict_do_update(index_elements=["dimension", "key"],
+                                          set_={c: getattr(Summary, c) + stmt.excluded[c] for c in columns})
+        db.execute(stmt, changed)
+    return len(project_ids)
+
+
+def refresh_quotes(db: Session, quote_ids: Iterable[int]) -> int:
+    project_ids = db.scalars(select(models.Quote.project_id).where(models.Quote.id.in_(list(quote_ids)))
+                             .distinct()).all()
+    return refresh_projects(db, [p for p in project_ids if p is not None])
+
+
+def rebuild(db: Session, progress: Optional[Callable[[str], None]] = None) -> int:
+    """Recompute every summary from scratch, committing per ANALYTICS_BATCH_PROJECTS projects."""
+    report = progress or (lambda message: None)
+    for model in (models.AnalyticsSummary, models.AnalyticsProjectRole, models.AnalyticsProject):
+        db.execute(delete(model))
+    db.commit()
+    project_ids = db.scalars(select(models.Project.id).order_by(models.Project.id)).all()
+    for start in range(0, len(project_ids), BATCH_PROJECTS):
+        refresh_projects(db, project_ids[start:start + BATCH_PROJECTS])
+        db.commit()
+        report(f"Proyectos procesados: {min(start + BATCH_PROJECTS, len(project_ids))}/{len(project_ids)}")
+    return len(project_ids)
+
+
+# --- Reading ---
+
+def _row(row, name: Optional[str] = None) -> dict:
+    values = {"key": row["key"], "name": name if name is not None else row["key"], "projects": row["projects"],
+              **{measure: round(row[measure] or 0, 2) for measure in MEASURES}}
+    values["items"], values["ai_items"] = int(values["items"]), int(values["ai_items"])
+    manual = row["ai_manual_hours"] or 0.0
+    values["ai_error_pct"] = round(100 * row["ai_abs_error"] / manual, 2) if manual else None
+    values["ai_bias_pct"] = round(100 * (row["ai_hours"] - manual) / manual, 2) if manual else None
+    return values
+
+
+def summary(db: Session, dimension: str, limit: int = 100) -> List[dict]:
+    """Rows of one dimension, highest revenue first."""
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Dimensión desconocida: {dimension} (use {', '.join(DIMENSIONS)})")
+    table = models.AnalyticsSummary.__table__
+    rows = [dict(row._mapping) for row in db.execute(
+        select(table).where(table.c.dimension == dimension, table.c.projects > 0)
+        .order_by(table.c.revenue.desc(), table.c.key).limit(limit))]
+    if dimension != "role":
+        return [_row(row) for row in rows]
+    from reference_cache import reference_cache
+
+    roles = reference_cache.roles_by_id(db)
+    return [_row(row, roles[int(row["key"])].name if int(row["key"]) in roles else None) for row in rows]
+
+
+def overview(db: Session) -> dict:
+    """Totals over all projects (every project has exactly one status)."""
+    Summary = models.AnalyticsSummary
+    row = db.execute(select(*(func.coalesce(func.sum(getattr(Summary, c)), 0).label(c) for c in ("projects",) + MEASURES))
+                     .where(Summary.dimension == "status")).one()
+    return _row({"key": "total", **row._mapping}, "Total")
+
+
+# --- Incremental refresh ---
+
+class SummaryRefresher(BackgroundFlusher):
+    """
+    Marked quotes/projects, refreshed in the background. Past ANALYTICS_MAX_PENDING
+    marks (e.g. the database has been failing for a while) it stops tracking ids and
+    does a full rebuild() on the next successful flush instead.
+    """
+    thread_name = "analytics-refresh"
+
+    def __init__(self, enabled: bool = ENABLED, refresh_seconds: float = REFRESH_SECONDS, max_pending: int = MAX_PENDING,
+                 session_factory=SessionLocal, flush_at_exit: bool = False):
+        super().__init__(enabled, refresh_seconds, flush_at_exit)
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+        self._quotes: Set[int] = set()
+        self._projects: Set[int] = set()
+        self._rebuild = False
+
+    def mark_quotes(self, quote_ids: Iterable[int]):
+        """Call after committing a change to these quotes' items or financials."""
+        self._mark(self._quotes, quote_ids)
+
+    def mark_projects(self, project_ids: Iterable[int]):
+        """Call after committing a change to these projects (status, client) or their list of quotes."""
+        self._mark(self._projects, project_ids)
+
+    def _mark(self, target: Set[int], ids: Iterable[int]):
+        if not self.enabled:
+            return
+        with self._lock:
+            if not self._rebuild: # A pending rebuild covers every change until it starts
+                target.update(i for i in ids if i is not None)
+                self._limit()
+        self._ensure_thread()
+
+    def _limit(self):
+        if len(self._quotes) + len(self._projects) > self.max_pending:
+            self._quotes, self._projects, self._rebuild = set(), set(), True
+
+    def _take(self):
+        if not (self._quotes or self._projects or self._rebuild):
+            return None
+        batch = (self._quotes, self._projects, self._rebuild)
+        self._quotes, self._projects, self._rebuild = set(), set(), False
+        return batch
+
+    def _write(self, batch) -> int:
+        quotes, projects, full = batch
+        with self.session_factory() as db:
+            if full:
+                return rebuild(db)
+            if quotes:
+                projects = projects | (set(db.scalars(select(models.Quote.project_id)
+                                                      .where(models.Quote.id.in_(quotes))).all()) - {None})
+            project_ids = sorted(projects)
+            for start in range(0, len(project_ids), BATCH_PROJECTS):
+                refresh_projects(db, project_ids[start:start + BATCH_PROJECTS])
+                db.commit()
+            return len(project_ids)
+
+    def _requeue(self, batch) -> int:
+        quotes, projects, full = batch
+        if full or self._rebuild:
+            self._quotes, self._projects, self._rebuild = set(), set(), True
+            return 0
+        self._quotes |= quotes
+        self._projects |= projects
+        before = len(self._quotes) + len(self._projects)
+        self._limit()
+        return before if self._rebuild else 0
+
+    def clear(self):
+        with self._lock:
+            self._quotes.clear()
+            self._projects.clear()
+            self._rebuild = False
+
+    @property
+    def pending(self) -> int:
+        return len(self._quotes) + len(self._projects) + int(self._rebuild)
+
+
+summaries = SummaryRefresher(flush_at_exit=True) # Scripts (manage.py, imports) exit without the app's shutdown hook
@@ -0,0 +1,59 @@
+"""
+Async mode (DB_ASYNC=1): async def versions of the hottest endpoints.
+
+    GET  /quotes/{quote_id}                  quote + items + project on an AsyncSession
+    POST /quotes/{quote_id}/generate-scope   completions on the async OpenAI client
+
+main.py registers this router before its own routes, so these handlers shadow
+the sync ones with the same paths and response models. Neither holds a
+threadpool thread while waiting on the database or the model, so one worker can
+keep far more quote reads and generations in flight (compare with
+`python benchmark.py --db-mode sync|async`). Every other endpoint stays sync.
+"""
+from typing import List
+
+from fastapi import APIRouter, Depends, HTTPException
+
+import crud_async, schemas
+from ai_service import AIService
+from database import async_session_factory
+from llm_client import LLMUnavailableError
+
+router = APIRouter()
+
+
+async def get_async_db():
+    async with async_session_factory()() as db:
+        yield db
+
+
+@router.get("/quotes/{quote_id}", response_model=schemas.Quote)
+async def read_quote(quote_id: int, db=Depends(get_async_db)):
+    db_quote = await crud_async.get_quote_detail(db, quote_id)
+    if not db_quote:
+        raise HTTPException(status_code=404, detail="Quote not found")
+
+    response = schemas.Quote.model_validate(db_quote)
+    if db_quote.project:
+        response.project_name = db_quote.project.name
+        response.client_name = db_quote.project.client_name
+    response.total_cost = round(db_quote.total_cost or 0.0, 2)
+    response.total_price = round(db_quote.total_price or 0.0, 2)
+    return response
+
+
+@router.post("/quotes/{quote_id}/generate-scope", response_model=List[schemas.QuoteItem])
+async def generate_scope(quote_id: int, request: schemas.ScopeGenerateRequest, db=Depends(get_async_db)):
+    db_quote = await crud_async.get_quote(db, quote_id)
+    if not db_quote:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    project = await crud_async.get_project(db, db_quote.project_id)
+    if not project:
+        raise HTTPException(status_code=404, detail="Project not found")
+
+    try:
+        items = await AIService.agenerate_scope(db, project, quote_id, request.requirements, request.role_ids,
+                                                use_cache=not request.bypass_cache, mode=request.mode)
+    except LLMUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return [schemas.QuoteItem.model_validate(i) for i in items]
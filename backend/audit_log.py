@@ -0,0 +1,153 @@
+"""
+Append-only event log of quote and item changes (quote_events table).
+
+crud records an event after every committed mutation:
+
+    quote.created      full financials of the new quote (also for clones)
+    quote.financials   {"applied_margin": [old, new], ...} for the fields that changed
+    item.created       full item values
+    item.updated       {"manual_hours": [old, new], ...} for the fields that changed
+    item.deleted       the item's last values
+
+record() only appends to an in-memory buffer, so writes pay no extra query. A
+background thread inserts the buffer in one executemany every
+AUDIT_FLUSH_SECONDS, or sooner once AUDIT_BATCH_SIZE events are waiting. Readers
+call flush() first to see their own writes. If the database rejects a flush the
+events stay buffered for the next one (up to AUDIT_MAX_BUFFER, then the oldest
+are dropped and counted in audit_events_total{outcome="dropped"}).
+
+The actor is the X-User request header (see main.py), or NULL.
+replay() rebuilds a quote from its events as of any past timestamp.
+"""
+import json
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import insert
+
+import metrics, models, pricing
+from background_flusher import BackgroundFlusher
+from database import SessionLocal
+
+ENABLED = os.getenv("AUDIT_ENABLED", "1").lower() in ("1", "true", "yes")
+FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1.0"))
+BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+MAX_BUFFER = int(os.getenv("AUDIT_MAX_BUFFER", "50000"))
+
+ITEM_FIELDS = ("role_id", "description", "manual_hours", "hourly_rate", "ai_suggested_hours", "sequence")
+FINANCIAL_FIELDS = ("applied_margin", "applied_risk", "applied_tax")
+
+current_actor: ContextVar[Optional[str]] = ContextVar("audit_actor", default=None)
+
+
+def item_values(item) -> Dict[str, object]:
+    """ITEM_FIELDS of a QuoteItem row, schema or dict."""
+    if isinstance(item, dict):
+        return {field: item.get(field) for field in ITEM_FIELDS}
+    return {field: getattr(item, field) for field in ITEM_FIELDS}
+
+
+def field_changes(old: dict, new: dict) -> Dict[str, list]:
+    """{field: [old, new]} for the fields whose value differs."""
+    return {field: [old.get(field), value] for field, value in new.items() if old.get(field) != value}
+
+
+class AuditLog(BackgroundFlusher):
+    thread_name = "audit-flush"
+
+    def __init__(self, enabled: bool = ENABLED, flush_seconds: float = FLUSH_SECONDS, batch_size: int = BATCH_SIZE,
+                 max_buffer: int = MAX_BUFFER, session_factory=SessionLocal, flush_at_exit: bool = False):
+        super().__init__(enabled, flush_seconds, flush_at_exit)
+        self.batch_size = batch_size
+        self.max_buffer = max_buffer
+        self.session_factory = session_factory
+        self._buffer: List[dict] = []
+
+    def record(self, event_type: str, quote_id: int, item_id: Optional[int] = None, data: Optional[dict] = None):
+        self.record_many([(event_type, quote_id, item_id, data)])
+
+    def record_many(self, events: Iterable[tuple]):
+        """events: (event_type, quote_id, item_id, data) tuples, e.g. one per item of a bulk insert."""
+        if not self.enabled:
+            return
+        actor, now = current_actor.get(), time.time()
+        rows = [{"quote_id": quote_id, "item_id": item_id, "event_type": event_type, "actor": actor,
+                 "data": json.dumps(data or {}, ensure_ascii=False, separators=(",", ":")), "created_at": now}
+                for event_type, quote_id, item_id, data in events]
+        if not rows:
+            return
+        with self._lock:
+            self._buffer.extend(rows)
+            pending = len(self._buffer)
+        self._ensure_thread()
+        if pending >= self.max_buffer:
+            self.flush() # The flusher is not keeping up: slow this writer down rather than grow without bound
+        elif pending >= self.batch_size:
+            self.wake()
+
+    def _take(self) -> List[dict]:
+        batch, self._buffer = self._buffer, []
+        return batch
+
+    def _write(self, batch: List[dict]) -> int:
+        with self.session_factory() as db:
+            db.execute(insert(models.QuoteEvent), batch)
+            db.commit()
+        metrics.AUDIT_EVENTS.inc(len(batch), outcome="written")
+        return len(batch)
+
+    def _requeue(self, batch: List[dict]) -> int:
+        self._buffer[:0] = batch
+        dropped = max(len(self._buffer) - self.max_buffer, 0)
+        if dropped:
+            del self._buffer[:dropped]
+            metrics.AUDIT_EVENTS.inc(dropped, outcome="dropped")
+        return dropped
+
+    def clear(self):
+        with self._lock:
+            self._buffer.clear()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+
+def replay(events: Iterable[models.QuoteEvent]) -> Optional[dict]:
+    """
+    State of a quote after applying `events` (ordered by id): financials, items and
+    totals. None if the quote.created event is not among them (created before the log).
+    """
+    state = None
+    applied = 0
+    for event in events:
+        data = json.loads(event.data or "{}")
+        if event.event_type == "quote.created":
+            state = {field: data.get(field) for field in FINANCIAL_FIELDS}
+            state["items"] = {}
+        elif state is None:
+            continue
+        elif event.event_type == "quote.financials":
+            state.update({field: new for field, (old, new) in data.items()})
+        elif event.event_type == "item.created":
+            state["items"][event.item_id] = data
+        elif event.event_type == "item.updated" and event.item_id in state["items"]:
+            state["items"][event.item_id].update({field: new for field, (old, new) in data.items()})
+        elif event.event_type == "item.deleted":
+            state["items"].pop(event.item_id, None)
+        applied += 1
+        state["at"] = event.created_at
+    if state is None:
+        return None
+
+    items = sorted(({"id": item_id, **values} for item_id, values in state["items"].items()),
+                   key=lambda i: (i["sequence"] or 0, i["id"]))
+    total_cost = sum((i["manual_hours"] or 0.0) * (i["hourly_rate"] or 0.0) for i in items)
+    total_price = pricing.quote_price(total_cost, state["applied_risk"], state["applied_margin"], state["applied_tax"])
+    return {**{field: state[field] for field in FINANCIAL_FIELDS}, "items": items, "events_applied": applied,
+            "last_event_at": state["at"], "total_cost": round(total_cost, 2), "total_price": round(total_price, 2)}
+
+
+event_log = AuditLog(flush_at_exit=True) # Scripts (manage.py, benchmarks) exit without the app's shutdown hook
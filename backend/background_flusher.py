@@ -0,0 +1,102 @@
+"""
+Write-behind buffers drained by a background thread (audit_log.AuditLog, analytics.SummaryRefresher).
+
+Writers add to the subclass's buffer under self._lock and call wake() when it is
+worth flushing early. A daemon thread calls flush() every `interval` seconds:
+
+    _take()          swap the buffer out (None/empty: nothing to do)
+    _write(batch)    persist it, return how many entries were written
+    _requeue(batch)  the write failed: put the batch back, bounded; return how many were dropped
+
+Readers call flush() to see their own writes, stop() drains the buffer on app
+shutdown, and flush_at_exit=True does the same for scripts that never run the
+app's lifespan. The thread is restarted in a forked worker (pid check).
+"""
+import atexit
+import logging
+import os
+import threading
+from abc import ABC, abstractmethod
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundFlusher(ABC):
+    thread_name = "background-flush"
+
+    def __init__(self, enabled: bool, interval: float, flush_at_exit: bool = False):
+        self.enabled = enabled
+        self.interval = interval
+        self._lock = threading.Lock() # Guards the subclass's buffer
+        self._flush_lock = threading.Lock() # One flush at a time keeps writes in buffer order
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid = None
+        if flush_at_exit:
+            atexit.register(self.flush)
+
+    @abstractmethod
+    def _take(self): ...
+
+    @abstractmethod
+    def _write(self, batch) -> int: ...
+
+    @abstractmethod
+    def _requeue(self, batch) -> int: ...
+
+    @abstractmethod
+    def clear(self): ...
+
+    @property
+    @abstractmethod
+    def pending(self) -> int: ...
+
+    def flush(self) -> int:
+        """Write the buffer now. Returns how many entries were written."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._take()
+            if not batch:
+                return 0
+            try:
+                return self._write(batch)
+            except Exception as e:
+                with self._lock:
+                    dropped = self._requeue(batch)
+                logger.warning("%s failed, kept for retry (%d dropped over the limit): %s", self.thread_name, dropped, e)
+                return 0
+
+    def wake(self):
+        self._wake.set()
+
+    def _ensure_thread(self):
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._stopping = False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=self.thread_name, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            self.flush()
+
+    def start(self):
+        if self.enabled:
+            self._ensure_thread()
+
+    def stop(self):
+        """Stop the thread and write whatever is still buffered (app shutdown)."""
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval + 5)
+        self._thread = None
+        self.flush()
@@ -0,0 +1,99 @@
+"""
+Benchmark: vectorized batch pricing vs the per-quote Python loop.
+
+    python bench_pricing.py --quotes 10000 --items 12 --scenarios 21
+
+Uses synthetic in-memory data so it measures the pricing math only (no DB).
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from pricing import price_batch, price_quotes_loop, quote_price, subtotals_by_quote
+
+
+def make_book(n_quotes: int, items_per_quote: int, n_roles: int = 8, seed: int = 7):
+    rng = np.random.default_rng(seed)
+    n_items = n_quotes * items_per_quote
+    quote_index = np.repeat(np.arange(n_quotes), items_per_quote)
+    role_ids = rng.integers(1, n_roles + 1, n_items)
+    hours = rng.uniform(2, 80, n_items).round(1)
+    rates = rng.uniform(20, 120, n_roles + 1)[role_ids].round(2)
+    risk = rng.uniform(0, 0.3, n_quotes)
+    margin = rng.uniform(0, 0.5, n_quotes)
+    tax = np.full(n_quotes, 0.16)
+    return quote_index, role_ids, hours, rates, risk, margin, tax
+
+
+def best_of(fn, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quotes", type=int, default=10000)
+    parser.add_argument("--items", type=int, default=12, help="Items per quote")
+    parser.add_argument("--scenarios", type=int, default=21, help="Margin sweep size (0%% to 50%%)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    args = parser.parse_args()
+
+    quote_index, role_ids, hours, rates, risk, margin, tax = make_book(args.quotes, args.items)
+    n = args.quotes
+    sweep = np.linspace(0, 0.5, args.scenarios)
+
+    # Python loop inputs, shaped like rows coming from the DB
+    quote_ids = list(range(n))
+    financials = {q: (risk[q], margin[q], tax[q]) for q in quote_ids}
+    items = list(zip(quote_index.tolist(), role_ids.tolist(), hours.tolist(), rates.tolist()))
+
+    def loop_book():
+        return price_quotes_loop(quote_ids, financials, items)
+
+    def loop_sweep():
+        subtotals = {q: cost for q, (cost, _) in loop_book().items()}
+        return [[quote_price(subtotals[q], risk[q], m, tax[q]) for q in quote_ids] for m in sweep]
+
+    def numpy_book():
+        subtotal = subtotals_by_quote(quote_index, hours, rates, n)
+        return price_batch(subtotal, risk, margin, tax)
+
+    def numpy_sweep():
+        subtotal = subtotals_by_quote(quote_index, hours, rates, n)
+        return price_batch(subtotal[None, :], risk[None, :], sweep[:, None], tax[None, :])
+
+    # Same answers before timing anything
+    expected = np.array([price for _, price in loop_book().values()])
+    assert np.allclose(numpy_book(), expected)
+    assert np.allclose(numpy_sweep(), np.array(loop_sweep()))
+
+    results = {
+        "quotes": n,
+        "items": n * args.items,
+        "scenarios": args.scenarios,
+        "book_loop_s": best_of(loop_book, args.repeat),
+        "book_numpy_s": best_of(numpy_book, args.repeat),
+        "sweep_loop_s": best_of(loop_sweep, args.repeat),
+        "sweep_numpy_s": best_of(numpy_sweep, args.repeat),
+    }
+    results["book_speedup"] = results["book_loop_s"] / results["book_numpy_s"]
+    results["sweep_speedup"] = results["sweep_loop_s"] / results["sweep_numpy_s"]
+
+    print(f"{n} quotes x {args.items} items, {args.scenarios} margin scenarios")
+    print(f"  whole book:   loop {results['book_loop_s'] * 1000:8.1f} ms | numpy {results['book_numpy_s'] * 1000:8.1f} ms | x{results['book_speedup']:.1f}")
+    print(f"  margin sweep: loop {results['sweep_loop_s'] * 1000:8.1f} ms | numpy {results['sweep_numpy_s'] * 1000:8.1f} ms | x{results['sweep_speedup']:.1f}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
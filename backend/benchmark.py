@@ -0,0 +1,278 @@
+"""
+Latency/throughput benchmark for the FastAPI backend.
+
+    python benchmark.py                                  # in-process (ASGI), default sizes
+    python benchmark.py --mode uvicorn --concurrency 32  # real uvicorn server on localhost
+    python benchmark.py --out bench.json --compare previous.json
+    python benchmark.py --mode uvicorn --db-mode async --concurrency 256 --scenarios read_quote generate_scope
+
+Seeds a throwaway SQLite database with roles, projects and quotes with many items,
+points the AI client at a local fake OpenAI server (no network, no API key) and
+drives the API with concurrent httpx requests. For every scenario it reports
+p50/p95/p99 latency and requests per second; --out saves the results as JSON and
+--compare prints the change against a previous run.
+
+--db-mode async runs the app with DB_ASYNC=1 (async_api.py). Run the same
+scenarios with --db-mode sync and --compare the two reports: with a slow model
+(--llm-delay) and high --concurrency the sync endpoints queue on the threadpool
+while the async ones keep every request in flight.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ["read_quote", "list_quotes", "item_crud", "generate_scope"]
+
+
+# --- Dataset ---
+
+def seed(session_factory, roles: int, projects: int, quotes_per_project: int, items_per_quote: int, seed_value: int = 42):
+    """Bulk-load a realistic book of quotes. Returns (role_ids, quote_ids)."""
+    from sqlalchemy import insert
+    import crud, models
+
+    rng = random.Random(seed_value)
+    with session_factory() as db:
+        role_ids = list(db.scalars(insert(models.Role).returning(models.Role.id), [
+            {"name": f"Rol {n}", "hourly_rate": float(rng.randint(20, 120))} for n in range(roles)
+        ]))
+        project_ids = list(db.scalars(insert(models.Project).returning(models.Project.id), [
+            {"name": f"Proyecto {n}", "client_name": f"Cliente {n % 50}", "status": rng.choice(["DRAFT", "SENT"]),
+             "raw_requirements": "Autenticación, panel de administración y reportes"}
+            for n in range(projects)
+        ]))
+        quote_ids = list(db.scalars(insert(models.Quote).returning(models.Quote.id), [
+            {"project_id": pid, "applied_margin": 0.2, "applied_risk": 0.1, "applied_tax": 0.16}
+            for pid in project_ids for _ in range(quotes_per_project)
+        ]))
+        db.execute(insert(models.QuoteItem), [
+            {"quote_id": qid, "role_id": rng.choice(role_ids), "description": f"Funcionalidad {n}",
+             "ai_suggested_hours": 8.0, "manual_hours": float(rng.randint(2, 40)), "hourly_rate": 50.0, "sequence": n}
+            for qid in quote_ids for n in range(items_per_quote)
+        ])
+        db.commit()
+        crud.recompute_quote_totals(db)
+    return role_ids, quote_ids
+
+
+# --- Scenarios: each performs one logical operation and returns the HTTP responses ---
+
+async def read_quote(client, ctx):
+    return [await client.get(f"/quotes/{random.choice(ctx['quote_ids'])}")]
+
+
+async def list_quotes(client, ctx):
+    return [await client.get("/quotes/", params={"sort": "total_price", "order": "desc", "limit": 50})]
+
+
+async def item_crud(client, ctx):
+    quote_id = random.choice(ctx["quote_ids"])
+    item = {"role_id": random.choice(ctx["role_ids"]), "description": "Bench", "manual_hours": 4.0, "hourly_rate": 50.0}
+    created = await client.post(f"/quotes/{quote_id}/items/", json=item)
+    if created.status_code != 200:
+        return [created]
+    item_id = created.json()["id"]
+    updated = await client.put(f"/quotes/items/{item_id}", json={**item, "manual_hours": 6.0, "sequence": 99})
+    deleted = await client.delete(f"/quotes/items/{item_id}")
+    return [created, updated, deleted]
+
+
+async def generate_scope(client, ctx):
+    quote_id = random.choice(ctx["quote_ids"])
+    return [await client.post(f"/quotes/{quote_id}/generate-scope", json={
+        "requirements": "Portal con autenticación y reportes",
+        "role_ids": ctx["role_ids"][:3],
+        "bypass_cache": True, # Measure the LLM path, not the response cache
+    })]
+
+
+async def run_scenario(client, name: str, ctx: dict, requests_total: int, concurrency: int) -> dict:
+    fn = globals()[name]
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for _ in range(requests_total):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            queue.get_nowait()
+            started = time.perf_counter()
+            try:
+                responses = await fn(client, ctx)
+                if any(r.status_code >= 400 for r in responses):
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    wall_started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - wall_started
+    return summarize(name, latencies, errors, wall)
+
+
+def percentile(sorted_values, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = (len(sorted_values) - 1) * pct / 100
+    lower, upper = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (k - lower)
+
+
+def summarize(name: str, latencies, errors: int, wall: float) -> dict:
+    ordered = sorted(latencies)
+    return {
+        "scenario": name,
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / wall, 1) if wall else 0.0,
+        "mean_ms": round(sum(ordered) / len(ordered), 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50), 2),
+        "p95_ms": round(percentile(ordered, 95), 2),
+        "p99_ms": round(percentile(ordered, 99), 2),
+    }
+
+
+# --- Drivers ---
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_until_up(base_url: str, proc, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(f"{base_url}/", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("uvicorn did not start in time")
+
+
+async def drive(base_url_or_app, args, ctx) -> list:
+    if isinstance(base_url_or_app, str):
+        client = httpx.AsyncClient(base_url=base_url_or_app, timeout=60.0,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=base_url_or_app), base_url="http://bench", timeout=60.0)
+    async with client:
+        results = []
+        for name in args.scenarios:
+            result = await run_scenario(client, name, ctx, args.requests, args.concurrency)
+            results.append(result)
+            print(f"{name:>15}: p50 {result['p50_ms']:8.2f} ms | p95 {result['p95_ms']:8.2f} ms | "
+                  f"p99 {result['p99_ms']:8.2f} ms | {result['rps']:8.1f} req/s | {result['errors']} errors")
+        return results
+
+
+def compare(results: list, previous_path: str):
+    with open(previous_path) as f:
+        previous = {r["scenario"]: r for r in json.load(f)["results"]}
+    print(f"\nChange vs {previous_path}:")
+    for result in results:
+        before = previous.get(result["scenario"])
+        if not before:
+            continue
+        delta = lambda key: (result[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{result['scenario']:>15}: p95 {delta('p95_ms'):+6.1f}% | p99 {delta('p99_ms'):+6.1f}% | rps {delta('rps'):+6.1f}%")
+
+
+def run(args, workdir: str) -> dict:
+    """Seed a database in workdir and drive the scenarios against it. Returns the results."""
+    db_url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+
+    from fake_openai_server import FakeOpenAIServer
+    fake = FakeOpenAIServer(delay=args.llm_delay).start()
+
+    # Configure before importing any app module: database.py and ai_service.py read these at import
+    os.environ.update({"DATABASE_URL": db_url, "OPENAI_API_KEY": "bench", "OPENAI_BASE_URL": fake.base_url,
+                       "DB_ASYNC": "1" if args.db_mode == "async" else "0"})
+    sys.path.insert(0, BACKEND_DIR)
+    from analytics import summaries
+    from audit_log import event_log
+    from database import SessionLocal, engine, init_db
+
+    init_db()
+    started = time.perf_counter()
+    role_ids, quote_ids = seed(SessionLocal, args.roles, args.projects, args.quotes_per_project, args.items_per_quote)
+    print(f"Seeded {len(quote_ids)} quotes x {args.items_per_quote} items in {time.perf_counter() - started:.1f}s ({args.mode}, {args.db_mode})")
+    fake.items = [{"role_id": rid, "description": f"Módulo {n}", "hours": 8.0} for n, rid in enumerate(role_ids[:3] * 4)]
+    ctx = {"role_ids": role_ids, "quote_ids": quote_ids}
+
+    server = None
+    try:
+        if args.mode == "uvicorn":
+            port = _free_port()
+            server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                                      cwd=BACKEND_DIR, env=os.environ.copy())
+            base_url = f"http://127.0.0.1:{port}"
+            _wait_until_up(base_url, server)
+            results = asyncio.run(drive(base_url, args, ctx))
+        else:
+            import main as app_module
+            results = asyncio.run(drive(app_module.app, args, ctx))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        fake.stop()
+        # Write what the app buffered (no lifespan runs in-process) before the database is deleted
+        event_log.flush()
+        summaries.flush()
+        engine.dispose()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=300, help="Operations per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--roles", type=int, default=10)
+    parser.add_argument("--projects", type=int, default=200)
+    parser.add_argument("--quotes-per-project", type=int, default=2)
+    parser.add_argument("--items-per-quote", type=int, default=40)
+    parser.add_argument("--llm-delay", type=float, default=0.05, help="Fake LLM latency in seconds")
+    parser.add_argument("--db-mode", choices=["sync", "async"], default="sync",
+                        help="async: DB_ASYNC=1 (needs sqlalchemy[asyncio] and aiosqlite)")
+    parser.add_argument("--out", help="Save results as JSON")
+    parser.add_argument("--compare", help="Previous JSON results to compare against")
+    args = parser.parse_args()
+
+    # The database lives in a temporary directory, removed when the run ends
+    with tempfile.TemporaryDirectory(prefix="cotizador-bench-") as workdir:
+        results = run(args, workdir)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Bulk import of roles, system config and projects from CSV or JSONL.
+
+    with open("roles.csv", "rb") as f:
+        result = bulk_import.import_file(db, "roles", f, "csv")
+
+Rows are read one at a time from the file object, validated with the same
+Pydantic schemas as the API (RoleCreate, SystemConfigCreate, ProjectImport) and
+written IMPORT_BATCH_SIZE at a time with a single INSERT ... ON CONFLICT DO UPDATE
+per batch, committed per batch. Memory stays constant whatever the file size;
+invalid rows are skipped and reported with their line number.
+
+Upsert keys: roles by name, configs by key, projects by external_ref (projects
+without one are always inserted).
+"""
+import codecs
+import csv
+import json
+import os
+from typing import IO, Dict, Iterator, List, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models, schemas
+from analytics import summaries
+from reference_cache import reference_cache
+
+BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+MAX_ERRORS = int(os.getenv("IMPORT_MAX_ERRORS", "100"))
+FORMATS = ("csv", "jsonl")
+
+
+class _Kind:
+    def __init__(self, model, schema, conflict_key: str, update_columns: List[str], invalidate=None, written=None):
+        self.model = model
+        self.schema = schema
+        self.conflict_key = conflict_key
+        self.update_columns = update_columns
+        self.invalidate = invalidate
+        self.written = written # Called with the ids of each committed batch
+
+
+KINDS: Dict[str, _Kind] = {
+    "roles": _Kind(models.Role, schemas.RoleCreate, "name", ["hourly_rate"], reference_cache.invalidate_roles),
+    "configs": _Kind(models.SystemConfig, schemas.SystemConfigCreate, "key", ["value_text", "value_float"],
+                     reference_cache.invalidate_configs),
+    "projects": _Kind(models.Project, schemas.ProjectImport, "external_ref",
+                      ["name", "client_name", "raw_requirements", "status"], written=summaries.mark_projects),
+}
+
+
+def iter_records(stream: IO[bytes], fmt: str) -> Iterator[Tuple[int, object]]:
+    """(line number, raw record) pairs, read incrementally. Bad JSON lines come back as the exception."""
+    text = codecs.getreader("utf-8-sig")(stream) # Tolerates the BOM Excel puts in CSV exports
+    if fmt == "csv":
+        reader = csv.DictReader(text)
+        for row in reader:
+            # Empty cells mean "not given", so optional fields keep their defaults
+            yield reader.line_num, {k.strip(): v for k, v in row.items() if k and v not in (None, "")}
+    elif fmt == "jsonl":
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, e
+    else:
+        raise ValueError(f"Formato no soportado: {fmt} (use {', '.join(FORMATS)})")
+
+
+def _execute(db: Session, kind: _Kind, stmt, rows: List[dict]) -> list:
+    if kind.written is None:
+        db.execute(stmt, rows)
+        return []
+    return list(db.scalars(stmt.returning(kind.model.id), rows))
+
+
+def _write_batch(db: Session, kind: _Kind, rows: List[dict]) -> int:
+    with_key = {}
+    without_key = []
+    for row in rows:
+        key = row.get(kind.conflict_key)
+        if key is None:
+            without_key.append(row)
+        else:
+            with_key[key] = row # Last occurrence wins: one statement can't update the same row twice
+
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    ids = []
+    if with_key:
+        stmt = insert(kind.model)
+        stmt = stmt.on_conflict_do_update(index_elements=[kind.conflict_key],
+                                          set_={c: stmt.excluded[c] for c in kind.update_columns})
+        ids += _execute(db, kind, stmt, list(with_key.values()))
+    if without_key:
+        ids += _execute(db, kind, insert(kind.model), without_key)
+    db.commit()
+    if kind.written:
+        kind.written(ids)
+    return len(with_key) + len(without_key)
+
+
+def import_records(db: Session, kind_name: str, records: Iterator[Tuple[int, object]],
+                   batch_size: int = BATCH_SIZE) -> schemas.ImportResult:
+    kind = KINDS[kind_name]
+    processed = imported = failed = 0
+    errors: List[schemas.ImportRowError] = []
+    batch: List[Tuple[int, dict]] = []
+
+    def fail(line: int, error: str):
+        nonlocal failed
+        failed += 1
+        if len(errors) < MAX_ERRORS:
+            errors.append(schemas.ImportRowError(line=line, error=error[:300]))
+
+    def flush():
+        nonlocal imported
+        if not batch:
+            return
+        try:
+            imported += _write_batch(db, kind, [row for _, row in batch])
+        except Exception as e:
+            # A database error fails only this batch; the committed ones stay
+            db.rollback()
+            for line, _ in batch:
+                fail(line, f"Error de base de datos en el lote: {e}")
+        batch.clear()
+
+    for line, record in records:
+        processed += 1
+        if isinstance(record, Exception):
+            fail(line, f"JSON inválido: {record}")
+            continue
+        try:
+            row = kind.schema.model_validate(record).model_dump()
+        except ValidationError as e:
+            fail(line, "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()))
+            continue
+        batch.append((line, row))
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    if imported and kind.invalidate:
+        kind.invalidate()
+    return schemas.ImportResult(kind=kind_name, processed=processed, imported=imported, failed=failed, errors=errors)
+
+
+def import_file(db: Session, kind_name: str, stream: IO[bytes], fmt: str,
+                batch_size: int = BATCH_SIZE) -> schemas.ImportResult:
+    if kind_name not in KINDS:
+        raise ValueError(f"Tipo de importación desconocido: {kind_name}")
+    return import_records(db, kind_name, iter_records(stream, fmt), batch_size)
+
+
+def detect_format(filename: str = "", content_type: str = "") -> str:
+    name, content_type = (filename or "").lower(), (content_type or "").lower()
+    if name.endswith((".jsonl", ".ndjson")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "jsonl"
+    return "csv"
@@ -0,0 +1,111 @@
+"""
+Key/value store for state that every worker process must agree on.
+
+    CACHE_URL=local://              in-process dict (default; tests, single worker)
+    CACHE_URL=redis://host:6379/0   shared by all workers (needs the `redis` package)
+
+Callers keep their data in process (reference_cache snapshots, running jobs)
+and use the backend only for small coordination values: version counters that
+invalidate every worker's copy, and job snapshots any worker can serve.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Optional, Tuple
+
+CACHE_URL = os.getenv("CACHE_URL", "local://")
+KEY_PREFIX = os.getenv("CACHE_KEY_PREFIX", "cotizador:")
+
+
+class CacheBackend(ABC):
+    shared = False # True when other processes see the same keys
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]: ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None): ...
+
+    @abstractmethod
+    def delete(self, key: str): ...
+
+    @abstractmethod
+    def incr(self, key: str) -> int: ...
+
+    @abstractmethod
+    def clear(self): ...
+
+
+class LocalCache(CacheBackend):
+    def __init__(self):
+        self._data: Dict[str, Tuple[str, Optional[float]]] = {} # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            with self._lock:
+                self._data.pop(key, None)
+            return None
+        return value
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def incr(self, key: str) -> int:
+        with self._lock:
+            value = int(self._data.get(key, ("0", None))[0]) + 1
+            self._data[key] = (str(value), None)
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache(CacheBackend):
+    shared = True
+
+    def __init__(self, url: str, prefix: str = KEY_PREFIX):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_URL usa Redis pero el paquete 'redis' no está instalado (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[str]:
+        return self._redis.get(self.prefix + key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        self._redis.set(self.prefix + key, value, px=int(ttl * 1000) if ttl else None)
+
+    def delete(self, key: str):
+        self._redis.delete(self.prefix + key)
+
+    def incr(self, key: str) -> int:
+        return int(self._redis.incr(self.prefix + key))
+
+    def clear(self):
+        for key in self._redis.scan_iter(f"{self.prefix}*"):
+            self._redis.delete(key)
+
+
+def build_backend(url: str = CACHE_URL) -> CacheBackend:
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisCache(url)
+    if url in ("", "local://"):
+        return LocalCache()
+    raise ValueError(f"Unsupported CACHE_URL: {url}")
+
+
+cache_backend = build_backend()
@@ -0,0 +1,74 @@
+import os
+import sys
+import tempfile
+
+# Isolate the test run: never touch sql_app.db or a real LLM provider.
+# Set before any app module is imported (database.py reads DATABASE_URL at import).
+_TEST_DIR = tempfile.mkdtemp(prefix="cotizador-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}"
+os.environ["OPENAI_API_KEY"] = "test-key"
+os.environ["OPENAI_BASE_URL"] = "http://127.0.0.1:9/v1"
+os.environ["SIMILARITY_INDEX_PATH"] = os.path.join(_TEST_DIR, "similarity_index.jsonl")
+os.environ["EXPORT_CACHE_DIR"] = os.path.join(_TEST_DIR, "export_cache")
+os.environ["AI_BACKOFF_BASE_SECONDS"] = "0.01" # Keep retries against the unreachable URL fast
+os.environ["AI_BACKOFF_MAX_SECONDS"] = "0.05"
+os.environ["ANALYTICS_REFRESH_SECONDS"] = "60" # Tests see summaries through the refresh-on-read, not the timer
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import pytest
+
+
+@pytest.fixture
+def client():
+    from fastapi.testclient import TestClient
+    from database import engine
+    from reference_cache import reference_cache
+    from similarity_index import similarity_index
+    from quote_export import exporter
+    from audit_log import event_log
+    from analytics import summaries
+    import main, models
+
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    reference_cache.clear()
+    similarity_index.clear()
+    exporter.cache.clear()
+    event_log.clear()
+    summaries.clear()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    from openai import AsyncOpenAI, OpenAI
+    from fake_openai_server import FakeOpenAIServer
+    import ai_service
+
+    from llm_client import ResilientLLM
+
+    with FakeOpenAIServer() as server:
+        client = OpenAI(api_key="test-key", base_url=server.base_url, max_retries=0)
+        async_client = AsyncOpenAI(api_key="test-key", base_url=server.base_url, max_retries=0)
+        monkeypatch.setattr(ai_service, "client", client)
+        monkeypatch.setattr(ai_service, "async_client", async_client)
+        monkeypatch.setattr(ai_service, "llm", ResilientLLM(client, models=[ai_service.DEFAULT_MODEL],
+                                                            async_client=async_client))
+        yield server
+
+
+@pytest.fixture
+def seeded_quote(client):
+    """A project + quote with two roles, returned as a dict of ids."""
+    backend = client.post("/roles/", json={"name": "Backend Developer", "hourly_rate": 50.0}).json()
+    qa = client.post("/roles/", json={"name": "QA Engineer", "hourly_rate": 40.0}).json()
+    project = client.post("/projects/", json={"name": "Portal Clientes", "client_name": "ACME", "raw_requirements": "Login y reportes"}).json()
+    quote = client.post("/quotes/", json={
+        "project_id": project["id"],
+        "applied_margin": 0.2,
+        "applied_risk": 0.1,
+        "applied_tax": 0.16,
+    }).json()
+    return {"role_ids": [backend["id"], qa["id"]], "project_id": project["id"], "quote_id": quote["id"]}
@@ -1,5 +1,14 @@
-from sqlalchemy.orm import Session
+import base64
+import json
+import time
+from sqlalchemy import delete, func, insert, literal, select, tuple_, update
+from sqlalchemy.orm import Session, joinedload
+from typing import Iterable, List, Optional
 import models, schemas
+from analytics import summaries
+from audit_log import FINANCIAL_FIELDS, ITEM_FIELDS as ITEM_DIFF_FIELDS, event_log, field_changes, item_values
+from pricing import total_price_sql
+from reference_cache import reference_cache
 
 # Role CRUD
 def get_role(db: Session, role_id: int):
@@ -12,6 +21,7 @@ def create_role(db: Session, role: schemas.RoleCreate):
     db_role = models.Role(name=role.name, hourly_rate=role.hourly_rate)
     db.add(db_role)
     db.commit()
+    reference_cache.invalidate_roles()
     db.refresh(db_role)
     return db_role
 
@@ -21,6 +31,7 @@ def update_role(db: Session, role_id: int, role: schemas.RoleCreate):
         db_role.name = role.name
         db_role.hourly_rate = role.hourly_rate
         db.commit()
+        reference_cache.invalidate_roles()
         db.refresh(db_role)
     return db_role
 
@@ -29,6 +40,7 @@ def delete_role(db: Session, role_id: int):
     if db_role:
         db.delete(db_role)
         db.commit()
+        reference_cache.invalidate_roles()
 
 # SystemConfig CRUD
 def get_config(db: Session, key: str):
@@ -41,12 +53,14 @@ def create_config(db: Session, config: schemas.SystemConfigCreate):
         existing.value_text = config.value_text
         existing.value_float = config.value_float
         db.commit()
+        reference_cache.invalidate_configs()
         db.refresh(existing)
         return existing
     
     db_config = models.SystemConfig(key=config.key, value_text=config.value_text, value_float=config.value_float)
     db.add(db_config)
     db.commit()
+    reference_cache.invalidate_configs()
     db.refresh(db_config)
     return db_config
 
@@ -64,6 +78,7 @@ def create_project(db: Session, project: schemas.ProjectCreate):
     db.add(db_project)
     db.commit()
     db.refresh(db_project)
+    summaries.mark_projects([db_project.id])
     return db_project
 
 def update_project(db: Session, project_id: int, project: schemas.ProjectCreate):
@@ -73,17 +88,97 @@ def update_project(db: Session, project_id: int, project: schemas.ProjectCreate)
         db_project.client_name = project.client_name
         db.commit()
         db.refresh(db_project)
+        summaries.mark_projects([project_id])
     return db_project
 
 def get_projects(db: Session, skip: int = 0, limit: int = 100):
     return db.query(models.Project).offset(skip).limit(limit).all()
 
+# --- Keyset (cursor) pagination ---
+# The cursor is the (sort value, id) of the last row returned. The next page is
+# "WHERE (sort, id) > cursor ORDER BY sort, id LIMIT n", which stays an index range
+# scan no matter how deep the client pages, unlike OFFSET.
+
+def encode_cursor(sort_value, row_id) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_value, row_id]).encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+def _keyset_page(query, sort_column, id_column, descending: bool, cursor: Optional[str], limit: int, sort_key,
+                 skip: int = 0):
+    """Returns (rows, next_cursor). sort_key(row) -> (sort value, id) of a result row."""
+    if cursor:
+        key = tuple_(sort_column, id_column)
+        after = tuple_(*decode_cursor(cursor))
+        query = query.filter(key < after if descending else key > after)
+    if descending:
+        query = query.order_by(sort_column.desc(), id_column.desc())
+    else:
+        query = query.order_by(sort_column, id_column)
+
+    if skip:
+        query = query.offset(skip) # Legacy offset paging: after the filters and ordering
+    rows = query.limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(*sort_key(rows[-1]))
+    return rows, next_cursor
+
+PROJECT_SORTS = {"id": models.Project.id, "name": models.Project.name, "client_name": models.Project.client_name}
+
+def list_projects(db: Session, status: Optional[str] = None, client_name: Optional[str] = None,
+                  sort: str = "id", descending: bool = False, cursor: Optional[str] = None, limit: int = 100,
+                  skip: int = 0):
+    """skip is the legacy offset paging; it can't be combined with a cursor (ValueError)."""
+    if skip and cursor:
+        raise ValueError("Use either skip or cursor, not both")
+    sort_column = PROJECT_SORTS[sort]
+    query = db.query(models.Project)
+    if status:
+        query = query.filter(models.Project.status == status)
+    if client_name:
+        query = query.filter(models.Project.client_name == client_name)
+    return _keyset_page(query, sort_column, models.Project.id, descending, cursor, limit,
+                        sort_key=lambda p: (getattr(p, sort_column.key), p.id), skip=skip)
+
+QUOTE_SORTS = {"id": models.Quote.id, "total_price": models.Quote.total_price, "total_cost": models.Quote.total_cost}
+
+def list_quotes(db: Session, status: Optional[str] = None, client_name: Optional[str] = None,
+                project_id: Optional[int] = None, min_total: Optional[float] = None, max_total: Optional[float] = None,
+                sort: str = "id", descending: bool = False, cursor: Optional[str] = None, limit: int = 100):
+    """Quotes with their project's name/client/status, as (Quote, name, client_name, status) rows."""
+    sort_column = QUOTE_SORTS[sort]
+    Quote, Project = models.Quote, models.Project
+    query = (
+        db.query(Quote, Project.name, Project.client_name, Project.status)
+        .outerjoin(Project, Quote.project_id == Project.id)
+    )
+    if status:
+        query = query.filter(Project.status == status)
+    if client_name:
+        query = query.filter(Project.client_name == client_name)
+    if project_id is not None:
+        query = query.filter(Quote.project_id == project_id)
+    if min_total is not None:
+        query = query.filter(Quote.total_price >= min_total)
+    if max_total is not None:
+        query = query.filter(Quote.total_price <= max_total)
+    return _keyset_page(query, sort_column, Quote.id, descending, cursor, limit,
+                        sort_key=lambda row: (getattr(row[0], sort_column.key), row[0].id))
+
 def update_project_status(db: Session, project_id: int, status: str):
     db_project = db.query(models.Project).filter(models.Project.id == project_id).first()
     if db_project:
         db_project.status = status
         db.commit()
         db.refresh(db_project)
+        summaries.mark_projects([project_id])
     return db_project
 
 def create_quote(db: Session, quote: schemas.QuoteCreate):
@@ -99,11 +194,26 @@ def create_quote(db: Session, quote: schemas.QuoteCreate):
     db.add(db_quote)
     db.commit()
     db.refresh(db_quote)
+    event_log.record("quote.created", db_quote.id, data=_quote_values(db_quote))
+    summaries.mark_projects([db_quote.project_id]) # Becomes the project's current quote if it is the latest version
     return db_quote
 
+def _quote_values(db_quote) -> dict:
+    return {"project_id": db_quote.project_id, "version": db_quote.version, "parent_quote_id": db_quote.parent_quote_id,
+            **{field: getattr(db_quote, field) for field in FINANCIAL_FIELDS}}
+
 def get_quote(db: Session, quote_id: int):
     return db.query(models.Quote).filter(models.Quote.id == quote_id).first()
 
+def get_quote_detail(db: Session, quote_id: int):
+    # Quote + ordered items + project in a single SELECT (read path of the quote screen)
+    return (
+        db.query(models.Quote)
+        .options(joinedload(models.Quote.project), joinedload(models.Quote.items))
+        .filter(models.Quote.id == quote_id)
+        .first()
+    )
+
 def add_quote_item(db: Session, quote_id: int, item: schemas.QuoteItemCreate):
     db_item = models.QuoteItem(
         quote_id=quote_id,
@@ -115,38 +225,318 @@ def add_quote_item(db: Session, quote_id: int, item: schemas.QuoteItemCreate):
         sequence=item.sequence or 0
     )
     db.add(db_item)
+    _shift_quote_totals(db, quote_id, _item_cost(db_item))
     db.commit()
     db.refresh(db_item)
+    event_log.record("item.created", quote_id, db_item.id, item_values(db_item))
+    summaries.mark_quotes([quote_id])
     return db_item
 
+def _item_values(item: schemas.QuoteItemBase, sequence: int) -> dict:
+    return dict(
+        role_id=item.role_id,
+        description=item.description,
+        manual_hours=item.manual_hours,
+        hourly_rate=item.hourly_rate,
+        ai_suggested_hours=item.ai_suggested_hours or 0.0,
+        sequence=sequence,
+    )
+
+def add_quote_items(db: Session, quote_id: int, items: List[schemas.QuoteItemCreate]):
+    # Bulk insert in one transaction (one executemany + one commit, instead of one per item)
+    if not items:
+        return []
+    rows = [dict(quote_id=quote_id, **_item_values(item, item.sequence or 0)) for item in items]
+    ids = list(db.scalars(insert(models.QuoteItem).returning(models.QuoteItem.id), rows))
+    _shift_quote_totals(db, quote_id, sum(_item_cost(row) for row in rows))
+    db.commit()
+    created = db.query(models.QuoteItem).filter(models.QuoteItem.id.in_(ids)).order_by(models.QuoteItem.sequence, models.QuoteItem.id).all()
+    # Events from the rows read back: executemany RETURNING is not guaranteed to follow the order of `rows`
+    event_log.record_many(("item.created", quote_id, item.id, item_values(item)) for item in created)
+    summaries.mark_quotes([quote_id])
+    return created
+
+def replace_quote_items(db: Session, quote_id: int, items: List[schemas.QuoteItemUpsert]):
+    """
+    Make the quote's items match `items` in a single transaction:
+    rows with an id are updated, rows without one are inserted, the rest are deleted.
+    Raises ValueError if an id does not belong to the quote.
+    """
+    Item = models.QuoteItem
+    existing = {row.id: item_values(dict(row._mapping)) for row in
+                db.execute(select(Item.id, *(getattr(Item, f) for f in ITEM_DIFF_FIELDS)).where(Item.quote_id == quote_id))}
+    existing_ids = set(existing)
+    updates, inserts = [], []
+    for sequence, item in enumerate(items):
+        values = _item_values(item, sequence)
+        if item.id is None:
+            inserts.append(dict(quote_id=quote_id, **values))
+            continue
+        if item.id not in existing_ids:
+            raise ValueError(f"Item {item.id} does not belong to quote {quote_id}")
+        if "ai_suggested_hours" not in item.model_fields_set:
+            values.pop("ai_suggested_hours") # Keep the AI's original suggestion
+        updates.append(dict(id=item.id, **values))
+
+    stale_ids = existing_ids - {u["id"] for u in updates}
+    if stale_ids:
+        db.execute(delete(models.QuoteItem).where(models.QuoteItem.id.in_(stale_ids)))
+    if updates:
+        db.execute(update(models.QuoteItem), updates)
+    inserted_ids = list(db.scalars(insert(Item).returning(Item.id), inserts)) if inserts else []
+    recompute_quote_totals(db, [quote_id], commit=False)
+    db.commit()
+
+    events = [("item.deleted", quote_id, item_id, existing[item_id]) for item_id in sorted(stale_ids)]
+    for values in updates:
+        diff = field_changes(existing[values["id"]], {k: v for k, v in values.items() if k != "id"})
+        if diff:
+            events.append(("item.updated", quote_id, values["id"], diff))
+    current = get_quote_items(db, quote_id)
+    # From the rows read back, not zip(inserted_ids, inserts): RETURNING order is not guaranteed for executemany
+    inserted = set(inserted_ids)
+    events += [("item.created", quote_id, item.id, item_values(item)) for item in current if item.id in inserted]
+    event_log.record_many(events)
+    summaries.mark_quotes([quote_id])
+    return current
+
 def get_quote_items(db: Session, quote_id: int):
     return db.query(models.QuoteItem).filter(models.QuoteItem.quote_id == quote_id).order_by(models.QuoteItem.sequence, models.QuoteItem.id).all()
 
 def update_quote_item(db: Session, item_id: int, item: schemas.QuoteItemCreate):
     db_item = db.query(models.QuoteItem).filter(models.QuoteItem.id == item_id).first()
     if db_item:
+        old_cost = _item_cost(db_item)
+        old_values = item_values(db_item)
         db_item.role_id = item.role_id
         db_item.description = item.description
         db_item.manual_hours = item.manual_hours
         db_item.hourly_rate = item.hourly_rate
         db_item.sequence = item.sequence
+        _shift_quote_totals(db, db_item.quote_id, _item_cost(db_item) - old_cost)
         db.commit()
         db.refresh(db_item)
+        diff = field_changes(old_values, item_values(db_item))
+        if diff:
+            event_log.record("item.updated", db_item.quote_id, db_item.id, diff)
+        summaries.mark_quotes([db_item.quote_id])
     return db_item
 
 def update_quote_financials(db: Session, quote_id: int, margin: float, risk: float, tax: float):
     db_quote = get_quote(db, quote_id)
     if db_quote:
+        old_values = {field: getattr(db_quote, field) for field in FINANCIAL_FIELDS}
         db_quote.applied_margin = margin
         db_quote.applied_risk = risk
         db_quote.applied_tax = tax
+        db.flush()
+        _shift_quote_totals(db, quote_id, 0.0) # Re-price with the new percentages
         db.commit()
         db.refresh(db_quote)
+        diff = field_changes(old_values, {field: getattr(db_quote, field) for field in FINANCIAL_FIELDS})
+        if diff:
+            event_log.record("quote.financials", quote_id, data=diff)
+        summaries.mark_quotes([quote_id])
     return db_quote
 
 def delete_quote_item(db: Session, item_id: int):
     db_item = db.query(models.QuoteItem).filter(models.QuoteItem.id == item_id).first()
     if db_item:
         db.delete(db_item)
+        _shift_quote_totals(db, db_item.quote_id, -_item_cost(db_item))
         db.commit()
+        event_log.record("item.deleted", db_item.quote_id, item_id, item_values(db_item))
+        summaries.mark_quotes([db_item.quote_id])
     return db_item
+
+# --- Stored quote totals ---
+# Quote.total_cost / total_price are denormalized so quotes can be listed and sorted
+# by value without loading items. Item writes shift them by the cost delta; the
+# price is recomputed in the same UPDATE with the pricing formula in SQL.
+
+def _item_cost(item) -> float:
+    if isinstance(item, dict):
+        return (item.get("manual_hours") or 0.0) * (item.get("hourly_rate") or 0.0)
+    return (item.manual_hours or 0.0) * (item.hourly_rate or 0.0)
+
+def _shift_quote_totals(db: Session, quote_id: int, cost_delta: float):
+    Quote = models.Quote
+    new_cost = func.coalesce(Quote.total_cost, 0.0) + cost_delta
+    db.execute(
+        update(Quote)
+        .where(Quote.id == quote_id)
+        .values(
+            total_cost=new_cost,
+            total_price=total_price_sql(new_cost, Quote.applied_risk, Quote.applied_margin, Quote.applied_tax),
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+def _items_cost_subquery():
+    Item = models.QuoteItem
+    return (
+        select(func.coalesce(func.sum(Item.manual_hours * Item.hourly_rate), 0.0))
+        .where(Item.quote_id == models.Quote.id)
+        .scalar_subquery()
+    )
+
+def recompute_quote_totals(db: Session, quote_ids: Optional[Iterable[int]] = None, commit: bool = True) -> int:
+    """Recompute stored totals from the items in one set-based UPDATE. Returns rows updated."""
+    Quote = models.Quote
+    cost = _items_cost_subquery()
+    stmt = update(Quote).values(
+        total_cost=cost,
+        total_price=total_price_sql(cost, Quote.applied_risk, Quote.applied_margin, Quote.applied_tax),
+    ).execution_options(synchronize_session=False)
+    if quote_ids is not None:
+        stmt = stmt.where(Quote.id.in_(list(quote_ids)))
+    updated = db.execute(stmt).rowcount
+    if commit:
+        db.commit()
+    return updated
+
+def find_inconsistent_quote_totals(db: Session, tolerance: float = 0.01):
+    """Quotes whose stored totals drifted from their items: [(quote_id, stored_cost, actual_cost, stored_price, actual_price)]."""
+    Quote = models.Quote
+    cost = _items_cost_subquery()
+    price = total_price_sql(cost, Quote.applied_risk, Quote.applied_margin, Quote.applied_tax)
+    stored_cost = func.coalesce(Quote.total_cost, 0.0)
+    stored_price = func.coalesce(Quote.total_price, 0.0)
+    rows = db.execute(
+        select(Quote.id, stored_cost, cost, stored_price, price)
+        .where((func.abs(stored_cost - cost) > tolerance) | (func.abs(stored_price - price) > tolerance))
+        .order_by(Quote.id)
+    )
+    return [tuple(row) for row in rows]
+
+# --- Quote versions ---
+# A new version is a full copy made server-side: one INSERT for the quote and one
+# INSERT ... SELECT for its items. Every copied item records origin_item_id (the
+# first item of its lineage), which is what diff_quotes() matches versions on.
+
+
+def clone_quote(db: Session, quote_id: int, overrides: Optional[dict] = None):
+    """Version N+1 of the project's quotes, copied from quote_id. overrides: new financial percentages."""
+    Quote, Item = models.Quote, models.QuoteItem
+    source = get_quote(db, quote_id)
+    if not source:
+        return None
+    overrides = {k: v for k, v in (overrides or {}).items() if k in FINANCIAL_FIELDS and v is not None}
+
+    latest = db.scalar(select(func.max(Quote.version)).where(Quote.project_id == source.project_id)) or 1
+    clone = Quote(
+        project_id=source.project_id,
+        ai_raw_input=source.ai_raw_input,
+        total_cost=source.total_cost,
+        total_price=source.total_price,
+        version=latest + 1,
+        parent_quote_id=source.id,
+        **{field: overrides.get(field, getattr(source, field)) for field in FINANCIAL_FIELDS},
+    )
+    db.add(clone)
+    db.flush()
+
+    db.execute(insert(Item).from_select(
+        ["quote_id", "role_id", "description", "ai_suggested_hours", "manual_hours", "hourly_rate", "sequence",
+         "origin_item_id"],
+        select(literal(clone.id), Item.role_id, Item.description, Item.ai_suggested_hours, Item.manual_hours,
+               Item.hourly_rate, Item.sequence, func.coalesce(Item.origin_item_id, Item.id))
+        .where(Item.quote_id == source.id)
+        .order_by(Item.sequence, Item.id),
+    ))
+    if overrides:
+        _shift_quote_totals(db, clone.id, 0.0) # Same items, new percentages: re-price
+    db.commit()
+    db.refresh(clone)
+    if event_log.enabled:
+        # The items were copied in SQL: read them back once so the clone's history starts complete
+        event_log.record_many([("quote.created", clone.id, None, _quote_values(clone))] + [
+            ("item.created", clone.id, item.id, item_values(item)) for item in get_quote_items(db, clone.id)
+        ])
+    summaries.mark_projects([clone.project_id]) # The new version is now the project's current quote
+    return clone
+
+def get_quote_versions(db: Session, quote_id: int):
+    """Every version of the quotes of quote_id's project, oldest first."""
+    source = get_quote(db, quote_id)
+    if not source:
+        return []
+    return (db.query(models.Quote).filter(models.Quote.project_id == source.project_id)
+            .order_by(models.Quote.version, models.Quote.id).all())
+
+def diff_quotes(db: Session, base_id: int, other_id: int):
+    """
+    What changed from quote base_id to quote other_id, matching items by lineage.
+    Returns a dict shaped like schemas.QuoteDiff, or None if a quote does not exist.
+    """
+    base, other = get_quote(db, base_id), get_quote(db, other_id)
+    if not base or not other:
+        return None
+
+    def by_lineage(quote_id):
+        return {item.origin_item_id or item.id: item for item in get_quote_items(db, quote_id)}
+
+    before, after = by_lineage(base_id), by_lineage(other_id)
+    changed, unchanged = [], 0
+    for key in before.keys() & after.keys():
+        old, new = before[key], after[key]
+        changes = {f: [getattr(old, f), getattr(new, f)] for f in ITEM_DIFF_FIELDS if getattr(old, f) != getattr(new, f)}
+        if changes:
+            changed.append({"base_item_id": old.id, "item_id": new.id, "changes": changes})
+        else:
+            unchanged += 1
+
+    return {
+        "base_quote_id": base_id,
+        "other_quote_id": other_id,
+        "added": sorted((after[k] for k in after.keys() - before.keys()), key=lambda i: (i.sequence or 0, i.id)),
+        "removed": sorted((before[k] for k in before.keys() - after.keys()), key=lambda i: (i.sequence or 0, i.id)),
+        "changed": sorted(changed, key=lambda c: c["item_id"]),
+        "unchanged": unchanged,
+        "financials": {f: [getattr(base, f), getattr(other, f)] for f in FINANCIAL_FIELDS
+                       if getattr(base, f) != getattr(other, f)},
+        "total_cost": [round(base.total_cost or 0.0, 2), round(other.total_cost or 0.0, 2)],
+        "total_price": [round(base.total_price or 0.0, 2), round(other.total_price or 0.0, 2)],
+    }
+
+# --- AI generation log ---
+
+def log_ai_generation(db: Session, quote_id: int, **fields):
+    db_log = models.AIGenerationLog(quote_id=quote_id, created_at=time.time(), **fields)
+    db.add(db_log)
+    db.commit()
+    return db_log
+
+def get_ai_generation_logs(db: Session, quote_id: int, limit: int = 100):
+    return (db.query(models.AIGenerationLog).filter(models.AIGenerationLog.quote_id == quote_id)
+            .order_by(models.AIGenerationLog.id.desc()).limit(limit).all())
+
+def get_ai_usage_summary(db: Session, since: Optional[float] = None):
+    log = models.AIGenerationLog
+    query = select(
+        log.model,
+        func.count().label("generations"),
+        func.coalesce(func.sum(log.llm_calls), 0).label("llm_calls"),
+        func.coalesce(func.sum(log.input_tokens), 0).label("input_tokens"),
+        func.coalesce(func.sum(log.output_tokens), 0).label("output_tokens"),
+        func.coalesce(func.avg(log.duration_ms), 0.0).label("avg_duration_ms"),
+    ).group_by(log.model).order_by(log.model)
+    if since is not None:
+        query = query.where(log.created_at >= since)
+    return [row._asdict() for row in db.execute(query)]
+
+# --- Audit log (audit_log.py) ---
+
+def list_quote_events(db: Session, quote_id: int, cursor: Optional[str] = None, limit: int = 100,
+                      until: Optional[float] = None):
+    """One page of the quote's events, oldest first. Returns (events, next_cursor)."""
+    Event = models.QuoteEvent
+    query = db.query(Event).filter(Event.quote_id == quote_id)
+    if until is not None:
+        query = query.filter(Event.created_at <= until)
+    return _keyset_page(query, Event.id, Event.id, False, cursor, limit, lambda e: (e.id, e.id))
+
+def get_quote_events_until(db: Session, quote_id: int, until: float):
+    Event = models.QuoteEvent
+    return (db.query(Event).filter(Event.quote_id == quote_id, Event.created_at <= until)
+            .order_by(Event.id).all())
@@ -0,0 +1,58 @@
+"""
+Async counterparts of the crud.py functions on the request path of async mode
+(async_api.py, DB_ASYNC=1). Same queries and totals bookkeeping, awaited on an
+AsyncSession; anything not here can still be reached with
+`await db.run_sync(crud.some_function, ...)`.
+"""
+import time
+from typing import TYPE_CHECKING, List
+
+from sqlalchemy import insert, select
+from sqlalchemy.orm import joinedload
+
+import models, schemas
+from analytics import summaries
+from audit_log import event_log, item_values
+from crud import _item_cost, _item_values, _shift_quote_totals
+
+if TYPE_CHECKING: # sqlalchemy.ext.asyncio is only imported when async mode is used
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+async def get_quote(db: "AsyncSession", quote_id: int):
+    return await db.get(models.Quote, quote_id)
+
+async def get_project(db: "AsyncSession", project_id: int):
+    return await db.get(models.Project, project_id)
+
+async def get_quote_detail(db: "AsyncSession", quote_id: int):
+    # Quote + ordered items + project in a single SELECT, like crud.get_quote_detail
+    result = await db.execute(
+        select(models.Quote)
+        .options(joinedload(models.Quote.project), joinedload(models.Quote.items))
+        .where(models.Quote.id == quote_id)
+    )
+    return result.unique().scalar_one_or_none()
+
+async def add_quote_items(db: "AsyncSession", quote_id: int, items: List[schemas.QuoteItemCreate]):
+    # One executemany + one totals UPDATE + one commit, like crud.add_quote_items
+    if not items:
+        return []
+    rows = [dict(quote_id=quote_id, **_item_values(item, item.sequence or 0)) for item in items]
+    ids = list(await db.scalars(insert(models.QuoteItem).returning(models.QuoteItem.id), rows))
+    await db.run_sync(_shift_quote_totals, quote_id, sum(_item_cost(row) for row in rows))
+    await db.commit()
+    created = list(await db.scalars(
+        select(models.QuoteItem).where(models.QuoteItem.id.in_(ids))
+        .order_by(models.QuoteItem.sequence, models.QuoteItem.id)
+    ))
+    # Events from the rows read back: executemany RETURNING is not guaranteed to follow the order of `rows`
+    event_log.record_many(("item.created", quote_id, item.id, item_values(item)) for item in created)
+    summaries.mark_quotes([quote_id])
+    return created
+
+async def log_ai_generation(db: "AsyncSession", quote_id: int, **fields):
+    db_log = models.AIGenerationLog(quote_id=quote_id, created_at=time.time(), **fields)
+    db.add(db_log)
+    await db.commit()
+    return db_log
@@ -1,12 +1,201 @@
-from sqlalchemy import create_engine
+import os
+from contextlib import contextmanager
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./sql_app.db"
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./sql_app.db")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# Engine profiles (DB_PROFILE):
+#   sqlite  - default for sqlite URLs: WAL, synchronous=NORMAL, busy_timeout, mmap
+#   pooled  - default for server databases (e.g. postgresql://): tunable QueuePool
+#   legacy  - plain create_engine() with no tuning, kept for comparisons (loadtest_writes.py)
+DB_PROFILE = os.getenv("DB_PROFILE")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800")) # Seconds; avoids server-side idle disconnects
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run while one writer commits; NORMAL is durable across app crashes in WAL mode
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    # Wait for the write lock instead of failing with "database is locked"
+    cursor.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+def _sqlite_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores the ForeignKeys declared in models.py unless enabled per connection
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+def build_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = None):
+    is_sqlite = url.startswith("sqlite")
+    profile = profile or ("sqlite" if is_sqlite else "pooled")
+
+    if profile == "legacy":
+        new_engine = create_engine(url, connect_args={"check_same_thread": False} if is_sqlite else {})
+        if is_sqlite:
+            event.listen(new_engine, "connect", _sqlite_foreign_keys)
+        return new_engine
+
+    if is_sqlite:
+        new_engine = create_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": DB_BUSY_TIMEOUT_MS / 1000},
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+        event.listen(new_engine, "connect", _sqlite_foreign_keys)
+        if profile == "sqlite" and ":memory:" not in url:
+            event.listen(new_engine, "connect", _sqlite_pragmas)
+        return new_engine
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+    )
+
+engine = build_engine(SQLALCHEMY_DATABASE_URL, DB_PROFILE)
+if hasattr(os, "register_at_fork"):
+    # Forked workers (e.g. gunicorn --preload) must open their own connections, not share the parent's
+    os.register_at_fork(after_in_child=lambda: engine.dispose(close=False))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
+
+# Async mode (DB_ASYNC=1): the quote read and scope generation endpoints run on an
+# AsyncSession (async_api.py). Needs `pip install sqlalchemy[asyncio]` plus the
+# async driver of the database: aiosqlite for sqlite URLs, asyncpg for postgresql.
+DB_ASYNC = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def async_url(url: str = SQLALCHEMY_DATABASE_URL) -> str:
+    """The same database with its async driver: sqlite:///x.db -> sqlite+aiosqlite:///x.db"""
+    scheme, separator, rest = url.partition("://")
+    dialect = scheme.split("+")[0]
+    if dialect not in ASYNC_DRIVERS:
+        raise ValueError(f"DB_ASYNC no soporta {dialect}:// (use {', '.join(ASYNC_DRIVERS)})")
+    return ASYNC_DRIVERS[dialect] + separator + rest
+
+def build_async_engine(url: str = SQLALCHEMY_DATABASE_URL, profile: str = None):
+    """build_engine() for async mode: same pool sizes and SQLite pragmas, async driver."""
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError as e:
+        raise RuntimeError("DB_ASYNC=1 requiere 'pip install sqlalchemy[asyncio] aiosqlite' (o asyncpg)") from e
+
+    is_sqlite = url.startswith("sqlite")
+    profile = profile or ("sqlite" if is_sqlite else "pooled")
+    kwargs = dict(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT)
+    if is_sqlite:
+        kwargs["connect_args"] = {"timeout": DB_BUSY_TIMEOUT_MS / 1000}
+    else:
+        kwargs.update(pool_recycle=DB_POOL_RECYCLE, pool_pre_ping=True)
+    new_engine = create_async_engine(async_url(url), **kwargs)
+    if is_sqlite:
+        event.listen(new_engine.sync_engine, "connect", _sqlite_foreign_keys)
+    if is_sqlite and profile == "sqlite" and ":memory:" not in url:
+        event.listen(new_engine.sync_engine, "connect", _sqlite_pragmas)
+    return new_engine
+
+_async_engine = None
+_AsyncSessionLocal = None
+
+def async_session_factory():
+    """AsyncSessionLocal, created on first use so sync-only deployments never import the async driver."""
+    global _async_engine, _AsyncSessionLocal
+    if _AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        import metrics
+
+        _async_engine = build_async_engine(SQLALCHEMY_DATABASE_URL, DB_PROFILE)
+        metrics.instrument_engine(_async_engine.sync_engine) # Query counts/time in Server-Timing and /metrics
+        # expire_on_commit=False: an async session cannot lazy-load attributes after a commit
+        _AsyncSessionLocal = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _AsyncSessionLocal
+
+async def dispose_async_engine():
+    global _async_engine, _AsyncSessionLocal
+    if _async_engine is not None:
+        await _async_engine.dispose()
+    _async_engine = _AsyncSessionLocal = None
+
+def upgrade_schema(bind=engine):
+    """
+    create_all() never alters tables that already exist (e.g. an older sql_app.db).
+    Add the columns and indexes declared in models.py that are missing from them.
+    Returns the added columns as "table.column".
+
+    Constraints can't be added this way: SQLite has no ALTER TABLE ... ADD CONSTRAINT,
+    so ForeignKeys declared after a table was created are not enforced on it (and
+    ADD COLUMN ... REFERENCES columns are only checked for new writes).
+    """
+    inspector = inspect(bind)
+    added = []
+    with bind.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    ddl += f" DEFAULT {column.default.arg!r}"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
+    return added
+
+def init_db(bind=engine):
+    """
+    Create/upgrade the schema. Called on app startup and by `python manage.py init-db`,
+    never at import time (so importing the app or running several workers has no side effects).
+    """
+    import models, crud, search # Imported here: they depend on this module
+
+    models.Base.metadata.create_all(bind=bind)
+    added = upgrade_schema(bind)
+    search.install(bind) # FTS5 indexes + sync triggers (SQLite)
+    if "quotes.total_cost" in added:
+        # Stored totals are new for this DB: fill them once from the items
+        with sessionmaker(bind=bind)() as db:
+            crud.recompute_quote_totals(db)
+    return added
+
+
+class QueryCounter:
+    """Collects the SQL statements executed while a count_queries() block is active."""
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+@contextmanager
+def count_queries(bind=engine):
+    # Usage (tests): with count_queries() as q: ...; assert q.count == 1
+    counter = QueryCounter()
+    event.listen(bind, "before_cursor_execute", counter)
+    try:
+        yield counter
+    finally:
+        event.remove(bind, "before_cursor_execute", counter)
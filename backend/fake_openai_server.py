@@ -0,0 +1,199 @@
+"""
+Local fake of the OpenAI-compatible chat completions API.
+
+Used by the tests and benchmarks so AIService can be exercised end-to-end
+without network access or API keys:
+
+    with FakeOpenAIServer(items=[...], delay=0.2) as server:
+        client = OpenAI(api_key="test", base_url=server.base_url)
+
+Requests with "stream": true get the same content as SSE chunks of chunk_size
+characters, chunk_delay seconds apart.
+
+Fault injection, for the retry/circuit breaker tests:
+
+    server.faults = [503, 429, "timeout", "disconnect"]  # consumed one per request
+    server.model_faults = {"gpt-4o-mini": 503}            # every request for that model
+
+An int answers with that HTTP status (retry_after sets the Retry-After header),
+"timeout" holds the request for hang_seconds before answering normally and
+"disconnect" closes the connection without a response.
+"""
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeOpenAIServer:
+    def __init__(self, items=None, delay: float = 0.0, host: str = "127.0.0.1", port: int = 0,
+                 chunk_size: int = 16, chunk_delay: float = 0.0):
+        # Canned scope returned by every completion: [{"role_id", "description", "hours"}]
+        self.items = items or []
+        self.delay = delay
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self.requests = []          # JSON payloads received, in order
+        self.faults = []            # One-shot faults, consumed in order
+        self.model_faults = {}      # model -> fault applied to every request
+        self.retry_after = None
+        self.hang_seconds = 5.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # --- Response builders ---
+    def completion_content(self, payload: dict) -> str:
+        return json.dumps({"items": self.items}, ensure_ascii=False)
+
+    def completion_body(self, payload: dict) -> dict:
+        content = self.completion_content(payload)
+        prompt_chars = sum(len(m.get("content") or "") for m in payload.get("messages", []))
+        prompt_tokens = max(1, prompt_chars // 4)
+        completion_tokens = max(1, len(content) // 4)
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def stream_chunks(self, payload: dict):
+        content = self.completion_content(payload)
+        base = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": payload.get("model", "fake-model")}
+        yield {**base, "choices": [{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}]}
+        for start in range(0, len(content), self.chunk_size):
+            piece = content[start:start + self.chunk_size]
+            yield {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+        yield {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+        if (payload.get("stream_options") or {}).get("include_usage"):
+            usage = self.completion_body(payload)["usage"]
+            yield {**base, "choices": [], "usage": usage}
+
+    def next_fault(self, payload: dict):
+        with self._lock:
+            if self.faults:
+                return self.faults.pop(0)
+        return self.model_faults.get(payload.get("model"))
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status: int, body: dict):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, payload: dict):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Cache-Control", "no-cache")
+                self.end_headers()
+                for chunk in server.stream_chunks(payload):
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    if server.chunk_delay:
+                        time.sleep(server.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+
+                if not self.path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": "not found"}})
+                    return
+
+                with server._lock:
+                    server.requests.append(payload)
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    fault = server.next_fault(payload)
+                    if fault == "disconnect":
+                        self.close_connection = True
+                        return
+                    if fault == "timeout":
+                        time.sleep(server.hang_seconds)
+                    elif isinstance(fault, int):
+                        data = json.dumps({"error": {"message": f"injected {fault}", "type": "fault"}}).encode("utf-8")
+                        self.send_response(fault)
+                        self.send_header("Content-Type", "application/json")
+                        self.send_header("Content-Length", str(len(data)))
+                        if server.retry_after is not None:
+                            self.send_header("Retry-After", str(server.retry_after))
+                        self.end_headers()
+                        self.wfile.write(data)
+                        return
+                    if server.delay:
+                        time.sleep(server.delay)
+                    if payload.get("stream"):
+                        self._send_stream(payload)
+                    else:
+                        self._send_json(200, server.completion_body(payload))
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+        return Handler
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a fake OpenAI-compatible server")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=0.5)
+    args = parser.parse_args()
+
+    demo_items = [{"role_id": 1, "description": "Módulo de ejemplo", "hours": 16.0}]
+    fake = FakeOpenAIServer(items=demo_items, delay=args.delay, port=args.port).start()
+    print(f"Fake OpenAI server listening on {fake.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.stop()
@@ -0,0 +1,106 @@
+"""
+Idempotency-Key support for write requests (POST/PUT/PATCH/DELETE).
+
+A client that may retry a write sends the same "Idempotency-Key" header on every
+attempt. The first request claims the key in the idempotency_keys table (an
+INSERT that only one worker can win) and its response is stored; retries get
+that stored response back instead of running the endpoint again. Meanwhile:
+
+- a retry while the first request is still running gets 409 (try again later);
+- reusing a key with a different method, path or body gets 422;
+- 5xx responses and streams (text/event-stream) release the key, so they can be retried;
+- bodies over IDEMPOTENCY_MAX_BODY_BYTES get 413 (the body is read in full to be hashed,
+  so large uploads such as /import should be sent without a key).
+
+Keys expire after IDEMPOTENCY_TTL_SECONDS. A claim whose request never finished
+(the worker died) can be taken over after IDEMPOTENCY_LOCK_SECONDS.
+"""
+import hashlib
+import os
+import time
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(24 * 3600)))
+LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300"))
+MAX_KEY_LENGTH = 255
+MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(1024 * 1024)))
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+
+# claim() results
+ACQUIRED = "acquired"
+REPLAY = "replay"
+IN_PROGRESS = "in_progress"
+MISMATCH = "mismatch"
+
+
+def fingerprint(method: str, path: str, query: str, body: bytes) -> str:
+    digest = hashlib.sha256(f"{method} {path}?{query}\n".encode("utf-8"))
+    digest.update(body or b"")
+    return digest.hexdigest()
+
+
+def claim(db: Session, key: str, request_hash: str, _attempts: int = 3) -> Tuple[str, Optional[models.IdempotencyKey]]:
+    """Try to own `key` for this request. Returns (ACQUIRED, None) or (REPLAY/IN_PROGRESS/MISMATCH, stored row)."""
+    now = time.time()
+    insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+    inserted = db.execute(
+        insert(models.IdempotencyKey).values(key=key, request_hash=request_hash, created_at=now)
+        .on_conflict_do_nothing(index_elements=["key"])
+    ).rowcount
+    db.commit()
+    if inserted:
+        return ACQUIRED, None
+
+    record = db.get(models.IdempotencyKey, key)
+    if record is None:
+        # Released between our INSERT and SELECT
+        return claim(db, key, request_hash, _attempts - 1) if _attempts > 1 else (IN_PROGRESS, None)
+
+    expired = record.created_at < now - TTL_SECONDS
+    abandoned = record.status_code is None and record.created_at < now - LOCK_SECONDS
+    if expired or abandoned:
+        # Take over the stale row; the created_at check makes this a compare-and-swap between workers
+        taken = db.execute(
+            update(models.IdempotencyKey)
+            .where(models.IdempotencyKey.key == key, models.IdempotencyKey.created_at == record.created_at)
+            .values(request_hash=request_hash, status_code=None, content_type=None, response_body=None, created_at=now)
+        ).rowcount
+        db.commit()
+        if taken:
+            return ACQUIRED, None
+        db.expire(record)
+        return claim(db, key, request_hash, _attempts - 1) if _attempts > 1 else (IN_PROGRESS, None)
+
+    if record.request_hash != request_hash:
+        return MISMATCH, record
+    if record.status_code is None:
+        return IN_PROGRESS, record
+    return REPLAY, record
+
+
+def complete(db: Session, key: str, status_code: int, content_type: Optional[str], body: bytes):
+    db.execute(
+        update(models.IdempotencyKey).where(models.IdempotencyKey.key == key)
+        .values(status_code=status_code, content_type=content_type, response_body=body.decode("utf-8", "replace"))
+    )
+    db.commit()
+
+
+def release(db: Session, key: str):
+    db.execute(delete(models.IdempotencyKey).where(models.IdempotencyKey.key == key))
+    db.commit()
+
+
+def purge_expired(db: Session) -> int:
+    deleted = db.execute(
+        delete(models.IdempotencyKey).where(models.IdempotencyKey.created_at < time.time() - TTL_SECONDS)
+    ).rowcount
+    db.commit()
+    return deleted
@@ -0,0 +1,215 @@
+"""
+Background job queue for slow AI work.
+
+Jobs run on a dedicated, bounded worker pool (AI_MAX_CONCURRENCY threads) so
+long LLM calls never hold one of Starlette's request threads. Clients submit a
+job, get its id back immediately, and then poll or stream its progress.
+
+Jobs live in the worker process that runs them. Their status is also published
+to cache_backend on every transition, so with several workers GET /jobs/{id}
+answers from any of them (progress events are only streamed by the owner).
+"""
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+from cache_backend import CacheBackend, cache_backend
+from database import SessionLocal
+import crud, models, schemas
+
+logger = logging.getLogger(__name__)
+
+MAX_CONCURRENCY = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+JOB_HISTORY_LIMIT = int(os.getenv("JOB_HISTORY_LIMIT", "500"))
+JOB_SNAPSHOT_TTL_SECONDS = float(os.getenv("JOB_SNAPSHOT_TTL_SECONDS", "3600"))
+
+# Job status values
+PENDING = "PENDING"
+RUNNING = "RUNNING"
+DONE = "DONE"
+FAILED = "FAILED"
+
+
+class Job:
+    def __init__(self, kind: str, quote_id: Optional[int] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.quote_id = quote_id
+        self.status = PENDING
+        self.progress: List[str] = []
+        self.events: List[tuple] = [] # (event, data) in order, streamed by JobManager.stream
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.exception: Optional[BaseException] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.future = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def report(self, message: str):
+        # Called from the worker thread; list.append is atomic under the GIL
+        self.progress.append(message)
+        self.events.append(("progress", message))
+
+    def emit(self, event: str, data: str):
+        self.events.append((event, data))
+
+    def to_schema(self) -> schemas.Job:
+        return schemas.Job(
+            id=self.id,
+            kind=self.kind,
+            status=self.status,
+            quote_id=self.quote_id,
+            progress=list(self.progress),
+            result=self.result,
+            error=self.error,
+        )
+
+
+class JobManager:
+    def __init__(self, max_workers: int = MAX_CONCURRENCY, history_limit: int = JOB_HISTORY_LIMIT,
+                 backend: CacheBackend = cache_backend):
+        self.max_workers = max_workers
+        self.history_limit = history_limit
+        self.backend = backend
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[[Job], Any], quote_id: Optional[int] = None) -> Job:
+        """Queue fn(job) on the worker pool. Its return value becomes job.result."""
+        job = Job(kind, quote_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        self._publish(job)
+        job.future = self._executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def snapshot(self, job_id: str) -> Optional[schemas.Job]:
+        """Status of a job run by any worker: the live job if it is ours, else its last published state."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_schema()
+        data = self.backend.get(f"job:{job_id}")
+        return schemas.Job.model_validate_json(data) if data else None
+
+    def _publish(self, job: Job):
+        try:
+            self.backend.set(f"job:{job.id}", job.to_schema().model_dump_json(), ttl=JOB_SNAPSHOT_TTL_SECONDS)
+        except Exception:
+            logger.warning("Could not publish job %s", job.id, exc_info=True)
+
+    async def wait(self, job: Job) -> Job:
+        """Await a job from async code without blocking the event loop."""
+        await asyncio.wrap_future(job.future)
+        return job
+
+    async def stream(self, job: Job, poll_interval: float = 0.1):
+        """Yield (event, data) tuples as the job makes progress, ending with done/failed."""
+        sent = 0
+        while True:
+            while sent < len(job.events):
+                yield job.events[sent]
+                sent += 1
+            if job.finished:
+                yield ("done" if job.status == DONE else "failed"), job.to_schema().model_dump_json()
+                return
+            await asyncio.sleep(poll_interval)
+
+    def _run(self, job: Job, fn):
+        job.status = RUNNING
+        self._publish(job)
+        try:
+            job.result = fn(job)
+            job.status = DONE
+        except Exception as e:
+            job.exception = e
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+            self._publish(job)
+        return job
+
+    def _prune(self):
+        # Keep memory bounded: forget the oldest finished jobs
+        finished = [j for j in self._jobs.values() if j.finished]
+        overflow = len(self._jobs) - self.history_limit
+        for old in sorted(finished, key=lambda j: j.created_at)[:max(0, overflow)]:
+            del self._jobs[old.id]
+
+
+job_manager = JobManager()
+
+
+def scope_job(quote_id: int, requirements: str, role_ids: List[int], use_cache: bool = True, mode: str = "auto"):
+    """Build the worker function for a generate-scope job."""
+    from ai_service import AIService
+
+    def run(job: Job):
+        db = SessionLocal()
+        try:
+            db_quote = crud.get_quote(db, quote_id)
+            if not db_quote:
+                raise LookupError("Quote not found")
+            project = db.query(models.Project).filter(models.Project.id == db_quote.project_id).first()
+            if not project:
+                raise LookupError("Project not found")
+
+            items = AIService.generate_scope(db, project, quote_id, requirements, role_ids,
+                                           progress=job.report, use_cache=use_cache, mode=mode)
+            return [schemas.QuoteItem.model_validate(i).model_dump() for i in items]
+        finally:
+            db.close()
+
+    return run
+
+
+def stream_scope_job(quote_id: int, requirements: str, role_ids: List[int], use_cache: bool = True):
+    """Like scope_job, but emits an "item" event per QuoteItem as the model streams it."""
+    from ai_service import AIService
+
+    def run(job: Job):
+        db = SessionLocal()
+        try:
+            db_quote = crud.get_quote(db, quote_id)
+            if not db_quote:
+                raise LookupError("Quote not found")
+            project = db.query(models.Project).filter(models.Project.id == db_quote.project_id).first()
+            if not project:
+                raise LookupError("Project not found")
+
+            results = []
+            for item in AIService.stream_scope(db, project, quote_id, requirements, role_ids,
+                                               progress=job.report, use_cache=use_cache):
+                data = schemas.QuoteItem.model_validate(item)
+                job.emit("item", data.model_dump_json())
+                results.append(data.model_dump())
+            return results
+        finally:
+            db.close()
+
+    return run
+
+
+def reprice_job(role_id: int, hourly_rate: Optional[float] = None, only_rate: Optional[float] = None):
+    """Build the worker function for a role repricing job (see repricing.py)."""
+    import repricing
+
+    def run(job: Job):
+        with SessionLocal() as db:
+            return repricing.apply(db, role_id, hourly_rate, only_rate, progress=job.report)
+
+    return run
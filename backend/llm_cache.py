@@ -0,0 +1,112 @@
+"""
+Persistent, content-addressed cache for LLM responses.
+
+Entries are keyed on a hash of everything that shapes the completion (model,
+system prompt, normalized requirements and selected roles), so re-running scope
+generation on an unchanged quote is served from SQLite instead of the provider.
+Expired entries (AI_CACHE_TTL_SECONDS) are dropped on read and the table is kept
+under AI_CACHE_MAX_ENTRIES by evicting the least recently used rows.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import List, Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+import models
+
+CACHE_TTL_SECONDS = float(os.getenv("AI_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("AI_CACHE_MAX_ENTRIES", "1000"))
+
+
+def normalize_requirements(text: str) -> str:
+    # Whitespace-only edits should not invalidate the cache
+    lines = (re.sub(r"\s+", " ", line).strip() for line in (text or "").splitlines())
+    return "\n".join(line for line in lines if line)
+
+
+def make_key(model: str, system_prompt: str, requirements: str, roles: List[dict]) -> str:
+    payload = json.dumps({
+        "model": model,
+        "system": system_prompt.strip(),
+        "requirements": normalize_requirements(requirements),
+        "roles": sorted((r["id"], r["name"]) for r in roles),
+    }, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, ttl_seconds: float = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, attr: str, n: int = 1):
+        with self._lock:
+            setattr(self, attr, getattr(self, attr) + n)
+
+    def get(self, db: Session, key: str) -> Optional[str]:
+        entry = db.get(models.LLMCacheEntry, key)
+        now = time.time()
+        if entry is None or now - entry.created_at > self.ttl_seconds:
+            if entry is not None:
+                db.delete(entry)
+                db.commit()
+            self._count("misses")
+            return None
+
+        entry.last_used_at = now
+        entry.hits = (entry.hits or 0) + 1
+        db.commit()
+        self._count("hits")
+        return entry.response
+
+    def put(self, db: Session, key: str, model: str, response: str):
+        now = time.time()
+        # Upsert: concurrent misses on the same key both end up writing it
+        insert = postgresql.insert if db.get_bind().dialect.name == "postgresql" else sqlite.insert
+        values = {"model": model, "response": response, "created_at": now, "last_used_at": now, "hits": 0}
+        db.execute(insert(models.LLMCacheEntry).values(key=key, **values)
+                   .on_conflict_do_update(index_elements=["key"], set_=values))
+        self._evict(db, now)
+        db.commit()
+
+    def _evict(self, db: Session, now: float):
+        expired = db.execute(
+            delete(models.LLMCacheEntry).where(models.LLMCacheEntry.created_at < now - self.ttl_seconds)
+        ).rowcount
+        overflow = db.scalar(select(func.count()).select_from(models.LLMCacheEntry)) - self.max_entries
+        lru = 0
+        if overflow > 0:
+            oldest = select(models.LLMCacheEntry.key).order_by(models.LLMCacheEntry.last_used_at).limit(overflow)
+            lru = db.execute(
+                delete(models.LLMCacheEntry).where(models.LLMCacheEntry.key.in_(oldest))
+            ).rowcount
+        if expired or lru:
+            self._count("evictions", expired + lru)
+
+    def clear(self, db: Session):
+        db.execute(delete(models.LLMCacheEntry))
+        db.commit()
+
+    def stats(self, db: Session) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": db.scalar(select(func.count()).select_from(models.LLMCacheEntry)),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+llm_cache = LLMCache()
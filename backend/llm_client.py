@@ -0,0 +1,272 @@
+"""
+Resilient wrapper around the OpenAI chat completions client.
+
+    llm = ResilientLLM(client, models=["gpt-4o-mini", "openai/gpt-4o"])
+    model, response = llm.create(messages=[...], response_format={"type": "json_object"})
+
+- Every attempt has a timeout (AI_TIMEOUT_SECONDS) and the whole call a deadline
+  (AI_DEADLINE_SECONDS); retries never sleep past it.
+- Transient errors (timeouts, connection errors, 408/409/429/5xx) are retried up to
+  AI_MAX_RETRIES times with jittered exponential backoff, honoring Retry-After.
+- Each model has a circuit breaker: after AI_CIRCUIT_FAILURES consecutive transient
+  failures it opens and calls skip the model for AI_CIRCUIT_RESET_SECONDS, then a
+  single trial call decides whether it closes again.
+- Models are tried in order (OPENAI_MODEL, then OPENAI_FALLBACK_MODELS). Errors that
+  are specific to a model (400/403/404/422) move on to the next one right away;
+  authentication errors are raised as-is.
+
+When every model is exhausted, LLMUnavailableError is raised. acreate() is the
+same policy for an AsyncOpenAI client (async mode, see async_api.py).
+"""
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import openai
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TIMEOUT_SECONDS = float(os.getenv("AI_TIMEOUT_SECONDS", "60"))
+DEADLINE_SECONDS = float(os.getenv("AI_DEADLINE_SECONDS", "120"))
+MAX_RETRIES = int(os.getenv("AI_MAX_RETRIES", "2"))
+BACKOFF_BASE_SECONDS = float(os.getenv("AI_BACKOFF_BASE_SECONDS", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("AI_BACKOFF_MAX_SECONDS", "8"))
+CIRCUIT_FAILURES = int(os.getenv("AI_CIRCUIT_FAILURES", "5"))
+CIRCUIT_RESET_SECONDS = float(os.getenv("AI_CIRCUIT_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUS = {408, 409, 429}
+MODEL_SPECIFIC_STATUS = {400, 403, 404, 422}
+
+
+class LLMUnavailableError(Exception):
+    """No configured model could answer (retries exhausted, circuits open or deadline hit)."""
+
+
+def configured_models() -> List[str]:
+    primary = os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+    alternates = [m.strip() for m in os.getenv("OPENAI_FALLBACK_MODELS", "").split(",") if m.strip()]
+    return [primary] + [m for m in alternates if m != primary]
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+    _GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURES, reset_timeout: float = CIRCUIT_RESET_SECONDS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        metrics.LLM_CIRCUIT_STATE.set(self._GAUGE[self.state], model=self.name)
+
+    def acquire(self) -> Optional[str]:
+        """CLOSED: call normally, HALF_OPEN: this call is the trial (release it with release_trial()), None: skip."""
+        with self._lock:
+            if self.state == self.OPEN and self.clock() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._publish()
+            if self.state == self.CLOSED:
+                return self.CLOSED
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                # Let exactly one call probe the provider
+                self._trial_in_flight = True
+                return self.HALF_OPEN
+            return None
+
+    def allow(self) -> bool:
+        return self.acquire() is not None
+
+    def release_trial(self):
+        """The trial ended without a verdict (auth error, deadline, cancellation): let the next call probe."""
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state, self.failures, self._trial_in_flight = self.CLOSED, 0, False
+            self._publish()
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state, self.opened_at = self.OPEN, self.clock()
+            self._trial_in_flight = False
+            self._publish()
+
+
+def _status(error: Exception) -> Optional[int]:
+    return getattr(error, "status_code", None)
+
+
+def is_transient(error: Exception) -> bool:
+    if isinstance(error, openai.APIConnectionError): # Includes APITimeoutError
+        return True
+    status = _status(error)
+    return status is not None and (status in RETRYABLE_STATUS or status >= 500)
+
+
+def _retry_after(error: Exception) -> float:
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers.get("retry-after", 0)) if response is not None else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class ResilientLLM:
+    def __init__(self, client, models: Optional[List[str]] = None, timeout: float = TIMEOUT_SECONDS,
+                 deadline: float = DEADLINE_SECONDS, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE_SECONDS, backoff_max: float = BACKOFF_MAX_SECONDS,
+                 failure_threshold: int = CIRCUIT_FAILURES, reset_timeout: float = CIRCUIT_RESET_SECONDS,
+                 sleep: Callable[[float], None] = time.sleep, async_client=None):
+        self.client = client
+        self.async_client = async_client
+        self.models = models or configured_models()
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.breakers = {m: CircuitBreaker(m, failure_threshold, reset_timeout) for m in self.models}
+
+    @property
+    def primary_model(self) -> str:
+        return self.models[0]
+
+    def reset(self):
+        for breaker in self.breakers.values():
+            breaker.record_success()
+
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        # Full jitter: uniform(0, base * 2^attempt), never below the server's Retry-After
+        # (create() gives up instead of sleeping past the deadline)
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        return max(delay, _retry_after(error))
+
+    def _next_delay(self, model: str, breaker: CircuitBreaker, attempt: int, error: Exception,
+                    expires: float) -> Optional[float]:
+        """After a failed attempt: seconds to wait before retrying `model`, None to move on to the next model."""
+        if isinstance(error, openai.AuthenticationError):
+            raise error
+        if not is_transient(error):
+            breaker.record_success() # The provider answered, it is just this request
+            if _status(error) in MODEL_SPECIFIC_STATUS:
+                logger.warning("Model %s rejected the request (%s), trying next model", model, _status(error))
+                return None
+            raise error
+        breaker.record_failure()
+        if attempt == self.max_retries or breaker.state == CircuitBreaker.OPEN:
+            return None
+        delay = self._backoff(attempt, error)
+        if time.monotonic() + delay >= expires:
+            return None
+        reason = "timeout" if isinstance(error, openai.APITimeoutError) else str(_status(error) or "connection")
+        metrics.LLM_RETRIES.inc(model=model, reason=reason)
+        return delay
+
+    def _candidates(self):
+        """(model, breaker, is_trial) for the models whose circuit lets a call through, in order; counts rejections and fallbacks."""
+        for position, model in enumerate(self.models):
+            breaker = self.breakers[model]
+            granted = breaker.acquire()
+            if granted is None:
+                metrics.LLM_CIRCUIT_REJECTIONS.inc(model=model)
+                continue
+            if position > 0:
+                metrics.LLM_FALLBACKS.inc(kind="model")
+            yield model, breaker, granted == CircuitBreaker.HALF_OPEN
+
+    def create(self, deadline: Optional[float] = None, mode: Optional[str] = None, **kwargs) -> Tuple[str, object]:
+        """
+        chat.completions.create(**kwargs) against the first model that answers; returns (model, response).
+        mode only labels the metrics ("json", "stream", "map"...). Streams are retried until they
+        start; an error in the middle of a stream reaches the caller.
+        """
+        streaming = bool(kwargs.get("stream"))
+        mode = mode or ("stream" if streaming else "json")
+        expires = time.monotonic() + (deadline or self.deadline)
+        last_error: Optional[Exception] = None
+
+        for model, breaker, trial in self._candidates():
+            try:
+                for attempt in range(self.max_retries + 1):
+                    remaining = expires - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMUnavailableError("Tiempo límite agotado consultando el modelo de IA") from last_error
+                    try:
+                        with metrics.llm_call(model, mode=mode) as call:
+                            response = self.client.with_options(timeout=min(self.timeout, remaining), max_retries=0) \
+                                .chat.completions.create(model=model, **kwargs)
+                            if not streaming:
+                                call.usage(response.usage)
+                        breaker.record_success()
+                        return model, response
+                    except openai.APIError as e:
+                        last_error = e
+                        delay = self._next_delay(model, breaker, attempt, e, expires)
+                        if delay is None:
+                            break
+                        self.sleep(delay)
+            finally:
+                if trial:
+                    # Ended without record_success/record_failure (auth error, deadline, cancellation):
+                    # must not keep the model rejected
+                    breaker.release_trial()
+
+        raise LLMUnavailableError(f"Ningún modelo disponible: {last_error or 'circuitos abiertos'}") from last_error
+
+    async def acreate(self, deadline: Optional[float] = None, mode: Optional[str] = None, **kwargs) -> Tuple[str, object]:
+        """create() on the async client: waits for the provider (and the backoff) without holding a thread."""
+        if self.async_client is None:
+            raise RuntimeError("ResilientLLM sin cliente asíncrono (async_client)")
+        streaming = bool(kwargs.get("stream"))
+        mode = mode or ("stream" if streaming else "json")
+        expires = time.monotonic() + (deadline or self.deadline)
+        last_error: Optional[Exception] = None
+
+        for model, breaker, trial in self._candidates():
+            try:
+                for attempt in range(self.max_retries + 1):
+                    remaining = expires - time.monotonic()
+                    if remaining <= 0:
+                        raise LLMUnavailableError("Tiempo límite agotado consultando el modelo de IA") from last_error
+                    try:
+                        with metrics.llm_call(model, mode=mode) as call:
+                            response = await self.async_client.with_options(timeout=min(self.timeout, remaining),
+                                                                            max_retries=0) \
+                                .chat.completions.create(model=model, **kwargs)
+                            if not streaming:
+                                call.usage(response.usage)
+                        breaker.record_success()
+                        return model, response
+                    except openai.APIError as e:
+                        last_error = e
+                        delay = self._next_delay(model, breaker, attempt, e, expires)
+                        if delay is None:
+                            break
+                        await asyncio.sleep(delay)
+            finally:
+                if trial:
+                    breaker.release_trial()
+
+        raise LLMUnavailableError(f"Ningún modelo disponible: {last_error or 'circuitos abiertos'}") from last_error
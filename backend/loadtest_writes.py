@@ -0,0 +1,95 @@
+"""
+Concurrent write load test for the database engine profiles.
+
+    python loadtest_writes.py --threads 16 --writes 200
+    python loadtest_writes.py --profiles legacy sqlite --json write_load.json
+
+Each profile gets a fresh SQLite file. N threads add quote items through crud
+(one transaction per write, like POST /quotes/{id}/items/) and we report
+throughput plus how many writes failed with "database is locked".
+"""
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from database import build_engine
+import crud, models, schemas
+
+
+def run_profile(profile: str, threads: int, writes: int, workdir: str) -> dict:
+    path = os.path.join(workdir, f"load_{profile}.db")
+    engine = build_engine(f"sqlite:///{path}", profile)
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    with Session() as db:
+        project = crud.create_project(db, schemas.ProjectCreate(name="Carga", client_name="Bench"))
+        quote_ids = [crud.create_quote(db, schemas.QuoteCreate(project_id=project.id)).id for _ in range(threads)]
+
+    item = schemas.QuoteItemCreate(role_id=1, description="Carga", manual_hours=1.0, hourly_rate=10.0)
+    locked = 0
+    lock = threading.Lock()
+
+    def worker(n: int):
+        nonlocal locked
+        with Session() as db:
+            for _ in range(writes):
+                try:
+                    crud.add_quote_item(db, quote_ids[n], item)
+                except OperationalError as e:
+                    db.rollback()
+                    if "locked" not in str(e):
+                        raise
+                    with lock:
+                        locked += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(worker, range(threads)))
+    elapsed = time.perf_counter() - started
+
+    with Session() as db:
+        committed = db.query(models.QuoteItem).count()
+    engine.dispose()
+    return {
+        "profile": profile,
+        "threads": threads,
+        "attempted": threads * writes,
+        "committed": committed,
+        "locked_errors": locked,
+        "seconds": round(elapsed, 3),
+        "writes_per_second": round(committed / elapsed, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--writes", type=int, default=100, help="Writes per thread")
+    parser.add_argument("--profiles", nargs="+", default=["legacy", "sqlite"])
+    parser.add_argument("--json", dest="json_path", help="Write results to this file")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="cotizador-load-") as workdir:
+        for profile in args.profiles:
+            result = run_profile(profile, args.threads, args.writes, workdir)
+            results.append(result)
+            print(f"{profile:>8}: {result['writes_per_second']:8.1f} writes/s | "
+                  f"{result['committed']}/{result['attempted']} committed | "
+                  f"{result['locked_errors']} 'database is locked' | {result['seconds']}s")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Literal, Optional
+import time
 
-import models, schemas, crud
-from database import SessionLocal, engine
+import models, schemas, crud, pricing, metrics, quote_export, idempotency, bulk_import, audit_log, repricing, analytics, search
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from database import DB_ASYNC, SessionLocal, dispose_async_engine, engine, init_db
+from reference_cache import reference_cache
+from similarity_index import similarity_index
 
-# Create tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create tables (and add columns introduced after the DB file was created).
+    # serve.py does it once before starting the workers and sets DB_INIT_ON_STARTUP=0.
+    if os.getenv("DB_INIT_ON_STARTUP", "1") != "0":
+        init_db()
+    audit_log.event_log.start()
+    analytics.summaries.start()
+    yield
+    audit_log.event_log.stop() # Writes the events still buffered
+    analytics.summaries.stop()
+    quote_export.exporter.shutdown()
+    await dispose_async_engine()
 
-app = FastAPI(title="Cotizador IA API")
+app = FastAPI(title="Cotizador IA API", lifespan=lifespan)
+app.router.route_class = metrics.ProfiledRoute # Lets X-Profile requests run their endpoint under cProfile
+metrics.instrument_engine(engine)
+if DB_ASYNC:
+    # Registered first, so its async endpoints shadow the sync ones with the same path (see async_api.py)
+    import async_api
+    app.include_router(async_api.router)
 
 app.add_middleware(
     CORSMiddleware,
@@ -17,8 +42,79 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing", "Content-Disposition", "Idempotent-Replayed"],
 )
 
+def _with_session(fn, *args):
+    with SessionLocal() as db:
+        return fn(db, *args)
+
+@app.middleware("http")
+async def idempotent_writes(request: Request, call_next):
+    # Retried writes carrying the same Idempotency-Key get the first response back (see idempotency.py)
+    key = request.headers.get("idempotency-key")
+    if not key or request.method not in idempotency.WRITE_METHODS:
+        return await call_next(request)
+    if len(key) > idempotency.MAX_KEY_LENGTH:
+        return JSONResponse({"detail": "Idempotency-Key demasiado larga"}, status_code=400)
+
+    # The body is read in full to be hashed: only bounded bodies with a declared length can carry a key
+    length = request.headers.get("content-length")
+    if length is None and request.headers.get("transfer-encoding"):
+        return JSONResponse({"detail": "Idempotency-Key requiere Content-Length"}, status_code=411)
+    if length is not None and (not length.isdigit() or int(length) > idempotency.MAX_BODY_BYTES):
+        return JSONResponse({"detail": f"Idempotency-Key no admitida con cuerpos de más de "
+                                       f"{idempotency.MAX_BODY_BYTES} bytes"}, status_code=413)
+
+    request_hash = idempotency.fingerprint(request.method, request.url.path, request.url.query, await request.body())
+    state, record = await run_in_threadpool(_with_session, idempotency.claim, key, request_hash)
+    if state == idempotency.REPLAY:
+        return Response(record.response_body, status_code=record.status_code, media_type=record.content_type,
+                        headers={"Idempotent-Replayed": "true"})
+    if state == idempotency.IN_PROGRESS:
+        return JSONResponse({"detail": "Una petición con esta Idempotency-Key sigue en curso"}, status_code=409,
+                            headers={"Retry-After": "1"})
+    if state == idempotency.MISMATCH:
+        return JSONResponse({"detail": "La Idempotency-Key ya se usó con otra petición"}, status_code=422)
+
+    try:
+        response = await call_next(request)
+    except BaseException:
+        await run_in_threadpool(_with_session, idempotency.release, key)
+        raise
+    content_type = response.headers.get("content-type")
+    if response.status_code >= 500 or (content_type or "").startswith("text/event-stream"):
+        await run_in_threadpool(_with_session, idempotency.release, key)
+        return response
+    body = b"".join([chunk async for chunk in response.body_iterator])
+    await run_in_threadpool(_with_session, idempotency.complete, key, response.status_code, content_type, body)
+    replay = Response(body, status_code=response.status_code)
+    replay.raw_headers = response.headers.raw # (name, value) pairs: repeated headers like set-cookie stay separate
+    return replay
+
+@app.middleware("http")
+async def audit_actor(request: Request, call_next):
+    # Who made the change, for the audit log (see audit_log.py); no auth in this app, so the client says
+    token = audit_log.current_actor.set(request.headers.get("x-user"))
+    try:
+        return await call_next(request)
+    finally:
+        audit_log.current_actor.reset(token)
+
+@app.middleware("http")
+async def observe_requests(request: Request, call_next):
+    profile = metrics.PROFILING_ENABLED and request.headers.get("x-profile") == "1"
+    with metrics.track_request(profile=profile) as stats:
+        started = time.perf_counter()
+        response = await call_next(request)
+        elapsed = time.perf_counter() - started # Streaming responses: time to headers
+    metrics.observe_request(request.method, metrics.route_label(request.scope), response.status_code, elapsed, stats)
+    response.headers["Server-Timing"] = (f'app;dur={elapsed * 1000:.1f}, '
+                                         f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries"')
+    if profile:
+        return PlainTextResponse(stats.profile_report(), headers={"X-Profiled-Status": str(response.status_code)})
+    return response
+
 # Dependency
 def get_db():
     db = SessionLocal()
@@ -27,10 +123,29 @@ def get_db():
     finally:
         db.close()
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or etag.removeprefix("W/") in candidates
+
+def _cached_response(request: Request, response: Response, etag: str):
+    """304 if the client already has this version, otherwise tag the response for revalidation."""
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return None
+
 @app.get("/")
 def read_root():
     return {"status": "ok", "app": "Cotizador IA v1"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def read_metrics():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 # --- Roles Endpoints ---
 @app.post("/roles/", response_model=schemas.Role)
 def create_role(role: schemas.RoleCreate, db: Session = Depends(get_db)):
@@ -41,9 +156,12 @@ def create_role(role: schemas.RoleCreate, db: Session = Depends(get_db)):
     return crud.create_role(db=db, role=role)
 
 @app.get("/roles/", response_model=List[schemas.Role])
-def read_roles(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    roles = crud.get_roles(db, skip=skip, limit=limit)
-    return roles
+def read_roles(request: Request, response: Response, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    # Served from the in-process reference cache (invalidated by role writes)
+    not_modified = _cached_response(request, response, reference_cache.roles_etag(db))
+    if not_modified:
+        return not_modified
+    return reference_cache.roles(db)[skip:skip + limit]
 
 @app.put("/roles/{role_id}", response_model=schemas.Role)
 def update_role_endpoint(role_id: int, role: schemas.RoleCreate, db: Session = Depends(get_db)):
@@ -66,8 +184,11 @@ def update_config(config: schemas.SystemConfigCreate, db: Session = Depends(get_
     return crud.create_config(db=db, config=config)
 
 @app.get("/config/", response_model=List[schemas.SystemConfig])
-def read_config(db: Session = Depends(get_db)):
-    return crud.get_all_configs(db)
+def read_config(request: Request, response: Response, db: Session = Depends(get_db)):
+    not_modified = _cached_response(request, response, reference_cache.configs_etag(db))
+    if not_modified:
+        return not_modified
+    return reference_cache.configs(db)
 
 # --- Core Endpoints ---
 
@@ -83,77 +204,163 @@ def update_project(project_id: int, project: schemas.ProjectCreate, db: Session
         raise HTTPException(status_code=404, detail="Project not found")
     return res
 
+@app.get("/search", response_model=schemas.SearchResults)
+def search_all(q: str = Query(..., min_length=1, max_length=200), kind: str = Query("all", pattern="^(all|projects|items)$"),
+               limit: int = Query(20, ge=1, le=100), db: Session = Depends(get_db)):
+    # Ranked full-text search: accent-insensitive, every word matched as a prefix (see search.py)
+    if search.match_expression(q) is None:
+        raise HTTPException(status_code=400, detail="La búsqueda no contiene palabras")
+    return schemas.SearchResults(
+        projects=search.search_projects(db, q, limit) if kind in ("all", "projects") else [],
+        items=search.search_items(db, q, limit) if kind in ("all", "items") else [],
+    )
+
+# Listings use keyset pagination: pass the X-Next-Cursor response header back as ?cursor=
 @app.get("/projects/", response_model=List[schemas.Project])
-def read_projects(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    return crud.get_projects(db, skip=skip, limit=limit)
+def read_projects(response: Response, skip: int = 0, limit: int = Query(100, ge=1, le=1000),
+                  status: Optional[str] = None, client_name: Optional[str] = None,
+                  sort: Literal["id", "name", "client_name"] = "id", order: Literal["asc", "desc"] = "asc",
+                  cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    try:
+        projects, next_cursor = crud.list_projects(db, status=status, client_name=client_name, sort=sort,
+                                                   descending=order == "desc", cursor=cursor, limit=limit, skip=skip)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return projects
 
 # Quotes
 @app.post("/quotes/", response_model=schemas.Quote)
 def create_quote(quote: schemas.QuoteCreate, db: Session = Depends(get_db)):
+    if not db.query(models.Project).filter(models.Project.id == quote.project_id).first():
+        raise HTTPException(status_code=404, detail="Project not found")
     return crud.create_quote(db, quote)
 
+@app.get("/quotes/", response_model=List[schemas.QuoteSummary])
+def read_quotes(response: Response, limit: int = Query(100, ge=1, le=1000),
+                status: Optional[str] = None, client_name: Optional[str] = None, project_id: Optional[int] = None,
+                min_total: Optional[float] = None, max_total: Optional[float] = None,
+                sort: Literal["id", "total_price", "total_cost"] = "id", order: Literal["asc", "desc"] = "asc",
+                cursor: Optional[str] = None, db: Session = Depends(get_db)):
+    try:
+        rows, next_cursor = crud.list_quotes(db, status=status, client_name=client_name, project_id=project_id,
+                                             min_total=min_total, max_total=max_total, sort=sort,
+                                             descending=order == "desc", cursor=cursor, limit=limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [
+        schemas.QuoteSummary(
+            id=q.id, project_id=q.project_id, project_name=name, client_name=client, status=project_status,
+            applied_margin=q.applied_margin, applied_risk=q.applied_risk, applied_tax=q.applied_tax,
+            total_cost=round(q.total_cost or 0.0, 2), total_price=round(q.total_price or 0.0, 2),
+        )
+        for q, name, client, project_status in rows
+    ]
+
+@app.post("/quotes/price-batch", response_model=schemas.PriceBatchResponse)
+def price_quotes_batch(request: schemas.PriceBatchRequest, db: Session = Depends(get_db)):
+    # Vectorized what-if pricing; nothing is persisted
+    result = pricing.price_quotes(
+        db,
+        quote_ids=request.quote_ids,
+        role_rates=request.role_rates,
+        scenarios=[s.model_dump() for s in request.scenarios],
+    )
+    total_cost = result["total_cost"].round(2)
+    total_price = result["total_price"].round(2)
+    scenario_prices = result["scenario_prices"].round(2)
+    return {"quotes": [
+        {
+            "quote_id": int(quote_id),
+            "total_cost": float(total_cost[i]),
+            "total_price": float(total_price[i]),
+            "scenario_prices": scenario_prices[:, i].tolist(),
+        }
+        for i, quote_id in enumerate(result["quote_ids"])
+    ]}
+
 @app.get("/quotes/{quote_id}", response_model=schemas.Quote)
 def read_quote(quote_id: int, db: Session = Depends(get_db)):
-    # Fetch raw quote
-    db_quote = crud.get_quote(db, quote_id)
+    # Fetch quote with its items and project in one query
+    db_quote = crud.get_quote_detail(db, quote_id)
     if not db_quote:
         raise HTTPException(status_code=404, detail="Quote not found")
     
-    # Fetch items
-    items = crud.get_quote_items(db, quote_id)
-    
-    # PERFORM CALCULATION LOGIC HERE (Source of Truth) for Response
-    # Total Cost = Sum(Item.manual_hours * Item.hourly_rate)
-    # Total Price = (Total Cost * (1 + risk)) / (1 - margin) ... OR Cost + Margin + Risk?
-    # User said: "Cálculos se basan en reglas". 
-    # Standard software pricing often: Cost + Contingency = Base. Base / (1-Margin) = Price.
-    # Let's use a simple additive model first, or verify user pref.
-    # User Request: "subtotal, porcentajes, colchón, total".
-    # Interpretation: 
-    #   Subtotal (Cost) = Sum(hours * rate)
-    #   Risk Amount = Subtotal * risk_percent
-    #   CostBase = Subtotal + Risk Amount
-    #   Price = CostBase / (1 - margin_percent)  <-- Standard Gross Margin formula
-    #   Tax = Price * tax_percent
-    #   Total with Tax = Price + Tax
-    
-    subtotal_cost = sum(item.manual_hours * item.hourly_rate for item in items)
-    
-    # Risk is typically a buffer on COST
-    risk_amount = subtotal_cost * db_quote.applied_risk
-    cost_base = subtotal_cost + risk_amount
-    
-    # Margin is typically Profit / Price.  Price = Cost / (1 - Margin)
-    # Ensure margin < 1.0
-    margin = db_quote.applied_margin
-    if margin >= 1.0: margin = 0.99 # Safety
-    
-    if margin < 1.0 and margin >= 0:
-        price_before_tax = cost_base / (1 - margin)
-    else:
-        price_before_tax = cost_base # No margin logic if invalid
-        
-    tax_amount = price_before_tax * db_quote.applied_tax
-    total_final = price_before_tax + tax_amount
+    items = db_quote.items
     
     response = schemas.Quote.model_validate(db_quote)
     response.items = items
     
     # Enrichment from Project
-    project = db.query(models.Project).filter(models.Project.id == db_quote.project_id).first()
+    project = db_quote.project
     if project:
         response.project_name = project.name
         response.client_name = project.client_name
 
-    response.total_cost = round(subtotal_cost, 2)
-    response.total_price = round(total_final, 2)
+    # Totals are stored on the quote and kept current by crud (see pricing.py for the rules)
+    response.total_cost = round(db_quote.total_cost or 0.0, 2)
+    response.total_price = round(db_quote.total_price or 0.0, 2)
     
     return response
 
+def _export_payload(quote_id: int) -> dict:
+    with SessionLocal() as db:
+        quote = read_quote(quote_id, db)
+        return quote_export.build_payload(quote, reference_cache.roles_by_id(db))
+
+@app.get("/quotes/{quote_id}/export")
+async def export_quote(quote_id: int, request: Request, format: Literal["pdf", "xlsx"] = "pdf"):
+    # Same data as GET /quotes/{id}; the document is rendered off the event loop and cached by content
+    payload = await run_in_threadpool(_export_payload, quote_id)
+    etag = f'"{quote_export.content_key(payload, format)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    path, _ = await quote_export.exporter.export(payload, format)
+    return FileResponse(path, media_type=quote_export.FORMATS[format],
+                        filename=quote_export.filename(payload, format), headers=headers)
+
+@app.post("/quotes/{quote_id}/versions", response_model=schemas.Quote)
+def clone_quote(quote_id: int, request: Optional[schemas.QuoteCloneRequest] = None, db: Session = Depends(get_db)):
+    # New revision with all items copied server-side (one INSERT ... SELECT)
+    overrides = request.model_dump(exclude_none=True) if request else None
+    db_quote = crud.clone_quote(db, quote_id, overrides)
+    if not db_quote:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    return read_quote(db_quote.id, db)
+
+@app.get("/quotes/{quote_id}/versions", response_model=List[schemas.QuoteVersion])
+def read_quote_versions(quote_id: int, db: Session = Depends(get_db)):
+    versions = crud.get_quote_versions(db, quote_id)
+    if not versions:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    return versions
+
+@app.get("/quotes/{quote_id}/diff/{other_id}", response_model=schemas.QuoteDiff)
+def diff_quotes(quote_id: int, other_id: int, db: Session = Depends(get_db)):
+    diff = crud.diff_quotes(db, quote_id, other_id)
+    if diff is None:
+        raise HTTPException(status_code=404, detail="Quote not found")
+    return diff
+
 @app.post("/quotes/{quote_id}/items/", response_model=schemas.QuoteItem)
 def create_quote_item(quote_id: int, item: schemas.QuoteItemCreate, db: Session = Depends(get_db)):
+    if not crud.get_quote(db, quote_id):
+        raise HTTPException(status_code=404, detail="Quote not found")
     return crud.add_quote_item(db, quote_id=quote_id, item=item)
 
+@app.put("/quotes/{quote_id}/items", response_model=List[schemas.QuoteItem])
+def replace_quote_items(quote_id: int, payload: schemas.QuoteItemsReplace, db: Session = Depends(get_db)):
+    if not crud.get_quote(db, quote_id):
+        raise HTTPException(status_code=404, detail="Quote not found")
+    try:
+        return crud.replace_quote_items(db, quote_id, payload.items)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.delete("/quotes/items/{item_id}")
 def delete_quote_item(item_id: int, db: Session = Depends(get_db)):
     crud.delete_quote_item(db, item_id)
@@ -166,25 +373,171 @@ def update_quote_item(item_id: int, item: schemas.QuoteItemCreate, db: Session =
         raise HTTPException(status_code=404, detail="Item not found")
     return res
 
+@app.get("/quotes/{quote_id}/events", response_model=List[schemas.QuoteEvent])
+def read_quote_events(quote_id: int, response: Response, limit: int = Query(100, ge=1, le=1000),
+                      cursor: Optional[str] = None, until: Optional[float] = None, db: Session = Depends(get_db)):
+    # Audit log of the quote, oldest first; keyset-paginated like the listings (X-Next-Cursor)
+    audit_log.event_log.flush() # Include events still buffered
+    try:
+        events, next_cursor = crud.list_quote_events(db, quote_id, cursor=cursor, limit=limit, until=until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return events
+
+@app.get("/quotes/{quote_id}/state", response_model=schemas.QuoteState)
+def read_quote_state(quote_id: int, at: Optional[float] = None, db: Session = Depends(get_db)):
+    # The quote as it was at Unix timestamp `at` (default: now), rebuilt by replaying its audit log
+    audit_log.event_log.flush()
+    at = at if at is not None else time.time()
+    state = audit_log.replay(crud.get_quote_events_until(db, quote_id, at))
+    if state is None:
+        raise HTTPException(status_code=404, detail="Sin historial para la cotización en esa fecha")
+    return schemas.QuoteState(quote_id=quote_id, at=at, **state)
+
+@app.post("/import/{kind}", response_model=schemas.ImportResult)
+async def import_records(kind: Literal["roles", "configs", "projects"], request: Request,
+                         format: Optional[Literal["csv", "jsonl"]] = None):
+    # CSV/JSONL body, upserted in batches (see bulk_import.py). The upload is spooled
+    # (memory up to 1 MB, then a temp file) and parsed off the event loop.
+    fmt = format or bulk_import.detect_format(content_type=request.headers.get("content-type", ""))
+    with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as spool:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        return await run_in_threadpool(_with_session, bulk_import.import_file, kind, spool, fmt)
+
 @app.post("/projects/{project_id}/finalize")
 def finalize_project(project_id: int, db: Session = Depends(get_db)):
-    crud.update_project_status(db, project_id, "SENT")
+    if crud.update_project_status(db, project_id, "SENT"):
+        # Finalized estimates feed the similarity index used by scope generation
+        similarity_index.add_project(db, project_id)
     return {"status": "SENT"}
 
 # --- AI Integration ---
+from fastapi.responses import StreamingResponse
 from ai_service import AIService
+from jobs import job_manager, reprice_job, scope_job, stream_scope_job
+from llm_cache import llm_cache
+from llm_client import LLMUnavailableError
 
-@app.post("/quotes/{quote_id}/generate-scope", response_model=List[schemas.QuoteItem])
-def generate_scope(quote_id: int, request: schemas.ScopeGenerateRequest, db: Session = Depends(get_db)):
-    # 1. Get Project info via Quote
+def _check_quote_project(db: Session, quote_id: int):
     db_quote = crud.get_quote(db, quote_id)
     if not db_quote:
         raise HTTPException(status_code=404, detail="Quote not found")
-    
     project = db.query(models.Project).filter(models.Project.id == db_quote.project_id).first()
     if not project:
          raise HTTPException(status_code=404, detail="Project not found")
 
-    # 2. Call AI Service
-    items = AIService.generate_scope(db, project, quote_id, request.requirements, request.role_ids)
-    return items
+@app.post("/quotes/{quote_id}/generate-scope", response_model=List[schemas.QuoteItem])
+async def generate_scope(quote_id: int, request: schemas.ScopeGenerateRequest):
+    # Runs on the AI worker pool; awaiting it keeps request threads free for CRUD traffic
+    run = scope_job(quote_id, request.requirements, request.role_ids, use_cache=not request.bypass_cache,
+                    mode=request.mode)
+    job = job_manager.submit("generate-scope", run, quote_id=quote_id)
+    await job_manager.wait(job)
+    if isinstance(job.exception, LookupError):
+        raise HTTPException(status_code=404, detail=job.error)
+    if isinstance(job.exception, LLMUnavailableError):
+        raise HTTPException(status_code=503, detail=job.error)
+    if job.exception:
+        raise HTTPException(status_code=500, detail=job.error)
+    return job.result
+
+@app.post("/quotes/{quote_id}/generate-scope/jobs", response_model=schemas.Job, status_code=202)
+def submit_generate_scope_job(quote_id: int, request: schemas.ScopeGenerateRequest, db: Session = Depends(get_db)):
+    _check_quote_project(db, quote_id)
+    run = scope_job(quote_id, request.requirements, request.role_ids, use_cache=not request.bypass_cache,
+                    mode=request.mode)
+    job = job_manager.submit("generate-scope", run, quote_id=quote_id)
+    return job.to_schema()
+
+def _sse(job):
+    async def event_source():
+        async for event, data in job_manager.stream(job):
+            lines = "".join(f"data: {line}\n" for line in str(data).splitlines() or [""])
+            yield f"event: {event}\n{lines}\n"
+    return StreamingResponse(event_source(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Job-Id": job.id})
+
+@app.post("/quotes/{quote_id}/generate-scope/stream")
+def stream_generate_scope(quote_id: int, request: schemas.ScopeGenerateRequest, db: Session = Depends(get_db)):
+    # Server-Sent Events: one "item" event per QuoteItem as soon as it is generated and saved.
+    # Always a single streamed completion: request.mode only applies to the non-streaming endpoints.
+    _check_quote_project(db, quote_id)
+    run = stream_scope_job(quote_id, request.requirements, request.role_ids, use_cache=not request.bypass_cache)
+    job = job_manager.submit("generate-scope-stream", run, quote_id=quote_id)
+    return _sse(job)
+
+# Role repricing: copy a role's rate into the items of DRAFT quotes (see repricing.py)
+@app.post("/roles/{role_id}/reprice/preview", response_model=schemas.RepriceReport)
+def preview_role_repricing(role_id: int, request: Optional[schemas.RepriceRequest] = None, db: Session = Depends(get_db)):
+    request = request or schemas.RepriceRequest()
+    try:
+        return repricing.preview(db, role_id, request.hourly_rate, request.only_rate)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+@app.post("/roles/{role_id}/reprice", response_model=schemas.Job, status_code=202)
+def reprice_role(role_id: int, request: Optional[schemas.RepriceRequest] = None, db: Session = Depends(get_db)):
+    # Large books take a while: runs as a job, poll /jobs/{id} for progress and the final report
+    if not crud.get_role(db, role_id):
+        raise HTTPException(status_code=404, detail="Role not found")
+    request = request or schemas.RepriceRequest()
+    job = job_manager.submit("reprice-role", reprice_job(role_id, request.hourly_rate, request.only_rate))
+    return job.to_schema()
+
+@app.get("/jobs/{job_id}", response_model=schemas.Job)
+def read_job(job_id: str):
+    # Any worker can answer: jobs started elsewhere are read from the shared cache backend
+    job = job_manager.snapshot(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    job = job_manager.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _sse(job)
+
+@app.post("/ai/similar-items", response_model=List[schemas.SimilarItem])
+def find_similar_items(request: schemas.SimilarItemsRequest):
+    kind = "item" if request.role_ids is not None else None
+    return similarity_index.search(request.requirements, kind=kind, role_ids=request.role_ids,
+                                   limit=min(max(request.limit, 1), 100))
+
+@app.get("/quotes/{quote_id}/ai-generations", response_model=List[schemas.AIGenerationLog])
+def read_ai_generations(quote_id: int, db: Session = Depends(get_db)):
+    # Token usage and latency of every scope generation for this quote, newest first
+    return crud.get_ai_generation_logs(db, quote_id)
+
+@app.get("/ai/usage", response_model=List[schemas.AIUsageSummary])
+def read_ai_usage(since: Optional[float] = None, db: Session = Depends(get_db)):
+    return crud.get_ai_usage_summary(db, since)
+
+# Dashboards: precomputed summaries, constant cost whatever the number of quotes (see analytics.py)
+ANALYTICS_DIMENSIONS = {"roles": "role", "clients": "client", "statuses": "status"}
+
+@app.get("/analytics/overview", response_model=schemas.AnalyticsRow)
+def read_analytics_overview(db: Session = Depends(get_db)):
+    analytics.summaries.flush() # Include changes not refreshed yet
+    return analytics.overview(db)
+
+@app.get("/analytics/{dimension}", response_model=List[schemas.AnalyticsRow])
+def read_analytics(dimension: str, limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_db)):
+    if dimension not in ANALYTICS_DIMENSIONS:
+        raise HTTPException(status_code=404, detail=f"Unknown analytics dimension, use one of: {', '.join(ANALYTICS_DIMENSIONS)}")
+    analytics.summaries.flush()
+    return analytics.summary(db, ANALYTICS_DIMENSIONS[dimension], limit)
+
+@app.get("/ai/cache/stats", response_model=schemas.LLMCacheStats)
+def read_llm_cache_stats(db: Session = Depends(get_db)):
+    return llm_cache.stats(db)
+
+@app.delete("/ai/cache")
+def clear_llm_cache(db: Session = Depends(get_db)):
+    llm_cache.clear(db)
+    return {"ok": True}
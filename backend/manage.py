@@ -0,0 +1,146 @@
+"""
+Maintenance commands for the Cotizador IA backend.
+
+    python manage.py init-db                  # create/upgrade the schema
+    python manage.py check-totals             # report quotes whose stored totals drifted
+    python manage.py recompute-totals         # recompute stored totals for every quote
+    python manage.py rebuild-index            # rebuild the similarity index from finalized projects
+    python manage.py purge-idempotency        # delete expired Idempotency-Key records
+    python manage.py import roles roles.csv   # bulk upsert roles/configs/projects from CSV or JSONL
+    python manage.py reprice-role 3 --dry-run # copy a role's rate into the items of DRAFT quotes
+    python manage.py rebuild-analytics        # recompute the analytics summaries from scratch
+"""
+import argparse
+import sys
+
+from database import SessionLocal, init_db
+import crud
+
+
+def init_database(args):
+    added = init_db()
+    print(f"Schema ready ({len(added)} column(s) added)")
+    return 0
+
+
+def check_totals(args):
+    with SessionLocal() as db:
+        drifted = crud.find_inconsistent_quote_totals(db, tolerance=args.tolerance)
+    for quote_id, stored_cost, cost, stored_price, price in drifted:
+        print(f"Quote {quote_id}: cost {stored_cost:.2f} != {cost:.2f}, price {stored_price:.2f} != {price:.2f}")
+    print(f"{len(drifted)} quote(s) with inconsistent totals")
+    return 1 if drifted else 0
+
+
+def recompute_totals(args):
+    with SessionLocal() as db:
+        updated = crud.recompute_quote_totals(db)
+    print(f"Recomputed totals for {updated} quote(s)")
+    return 0
+
+
+def rebuild_index(args):
+    from similarity_index import similarity_index
+
+    with SessionLocal() as db:
+        documents = similarity_index.rebuild(db)
+    print(f"Similarity index rebuilt: {documents} document(s) in {similarity_index.path}")
+    return 0
+
+
+def purge_idempotency(args):
+    import idempotency
+
+    with SessionLocal() as db:
+        deleted = idempotency.purge_expired(db)
+    print(f"Deleted {deleted} expired idempotency key(s)")
+    return 0
+
+
+def import_file(args):
+    import bulk_import
+
+    fmt = args.format or bulk_import.detect_format(args.path)
+    with SessionLocal() as db, open(args.path, "rb") as f:
+        result = bulk_import.import_file(db, args.kind, f, fmt, batch_size=args.batch_size or bulk_import.BATCH_SIZE)
+    for error in result.errors:
+        print(f"Line {error.line}: {error.error}")
+    print(f"{result.kind}: {result.imported} imported, {result.failed} failed, {result.processed} row(s) read")
+    return 1 if result.failed else 0
+
+
+def reprice_role(args):
+    import repricing
+
+    with SessionLocal() as db:
+        try:
+            if args.dry_run:
+                result = repricing.preview(db, args.role_id, args.rate, args.only_rate)
+            else:
+                result = repricing.apply(db, args.role_id, args.rate, args.only_rate, progress=print)
+        except LookupError as e:
+            print(e)
+            return 1
+    for q in result["quotes"]:
+        print(f"Quote {q['quote_id']}: {q['items']} item(s), cost {q['cost_delta']:+.2f}, "
+              f"price {q['total_price']:.2f} -> {q['new_total_price']:.2f}")
+    action = "would change" if args.dry_run else "changed"
+    print(f"Rate {result['hourly_rate']:.2f}: {action} {result['items']} item(s) in {len(result['quotes'])} quote(s), "
+          f"price {result['price_delta']:+.2f}")
+    return 0
+
+
+def rebuild_analytics(args):
+    import analytics
+
+    with SessionLocal() as db:
+        projects = analytics.rebuild(db, progress=print)
+    print(f"Analytics rebuilt from {projects} project(s)")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cotizador IA maintenance commands")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("init-db", help="Create or upgrade the database schema")
+    p.set_defaults(func=init_database)
+
+    p = sub.add_parser("check-totals", help="Report quotes whose stored totals differ from their items")
+    p.add_argument("--tolerance", type=float, default=0.01)
+    p.set_defaults(func=check_totals)
+
+    p = sub.add_parser("recompute-totals", help="Recompute stored totals for all quotes")
+    p.set_defaults(func=recompute_totals)
+
+    p = sub.add_parser("rebuild-index", help="Rebuild the similarity index from finalized projects")
+    p.set_defaults(func=rebuild_index)
+
+    p = sub.add_parser("purge-idempotency", help="Delete Idempotency-Key records older than IDEMPOTENCY_TTL_SECONDS")
+    p.set_defaults(func=purge_idempotency)
+
+    p = sub.add_parser("import", help="Bulk upsert roles, configs or projects from a CSV or JSONL file")
+    p.add_argument("kind", choices=["roles", "configs", "projects"])
+    p.add_argument("path")
+    p.add_argument("--format", choices=["csv", "jsonl"], help="Default: from the file extension")
+    p.add_argument("--batch-size", type=int, help="Rows per INSERT/commit (default: IMPORT_BATCH_SIZE)")
+    p.set_defaults(func=import_file)
+
+    p = sub.add_parser("reprice-role", help="Copy a role's hourly rate into the items of DRAFT quotes")
+    p.add_argument("role_id", type=int)
+    p.add_argument("--rate", type=float, help="Default: the role's current rate")
+    p.add_argument("--only-rate", type=float, help="Only items still at this rate")
+    p.add_argument("--dry-run", action="store_true", help="Report the affected quotes without changing them")
+    p.set_defaults(func=reprice_role)
+
+    p = sub.add_parser("rebuild-analytics", help="Recompute the analytics summaries from scratch")
+    p.set_defaults(func=rebuild_analytics)
+
+    args = parser.parse_args(argv)
+    if args.func is not init_database:
+        init_db()
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
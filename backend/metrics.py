@@ -0,0 +1,328 @@
+"""
+In-process metrics (Prometheus text format) and opt-in request profiling.
+
+    http_request_duration_seconds   latency per method/route/status (route = path template)
+    http_request_db_queries         SQL statements issued per request
+    db_query_duration_seconds       every SQL statement, by operation (SELECT, INSERT...)
+    llm_request_duration_seconds    chat completion calls, by model/mode/outcome
+    llm_tokens_total                prompt/completion tokens reported by the provider
+    quote_export_requests_total     PDF/XLSX downloads, by format and render cache hit/miss
+
+Metrics live in this process only; with several workers each one serves its own
+/metrics. When PROFILING_ENABLED=1, a request sent with "X-Profile: 1" gets a
+cProfile report of its endpoint instead of the normal body.
+"""
+import bisect
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Sequence, Tuple
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").lower() in ("1", "true", "yes")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "40"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(tuple(labels[n] for n in self.label_names), 0.0)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for key, value in sorted(self._values.items()):
+            yield f"{self.name}{_labels(self.label_names, key)} {value}"
+
+
+class Gauge(Counter):
+    def set(self, value: float, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self):
+        for line in super().render():
+            yield line.replace(" counter", " gauge") if line.startswith("# TYPE") else line
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, list] = {} # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        series = self._series.get(tuple(labels[n] for n in self.label_names))
+        return series[-1] if series else 0
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        for key, series in sorted(self._series.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, series):
+                cumulative += n
+                le = 'le="%s"' % bound
+                yield f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_labels(self.label_names, key, le)} {series[-1]}"
+            yield f"{self.name}_sum{_labels(self.label_names, key)} {series[-2]}"
+            yield f"{self.name}_count{_labels(self.label_names, key)} {series[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, *args, **kwargs) -> Gauge:
+        metric = Gauge(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for metric in self._metrics for line in metric.render()) + "\n"
+
+
+registry = Registry()
+
+HTTP_LATENCY = registry.histogram("http_request_duration_seconds", "Time until response headers, by route template",
+                                  ("method", "route", "status"))
+HTTP_DB_QUERIES = registry.histogram("http_request_db_queries", "SQL statements issued per request",
+                                     ("method", "route"), buckets=COUNT_BUCKETS)
+DB_QUERY_LATENCY = registry.histogram("db_query_duration_seconds", "SQL statement execution time",
+                                      ("operation",), buckets=QUERY_BUCKETS)
+LLM_LATENCY = registry.histogram("llm_request_duration_seconds", "Chat completion attempts (streams: until the response starts)",
+                                 ("model", "mode", "outcome"))
+LLM_TOKENS = registry.counter("llm_tokens_total", "Tokens reported by the LLM provider", ("model", "kind"))
+LLM_RETRIES = registry.counter("llm_retries_total", "Chat completion attempts retried after a transient error",
+                               ("model", "reason"))
+LLM_CIRCUIT_STATE = registry.gauge("llm_circuit_state", "Circuit breaker per model: 0 closed, 1 half-open, 2 open",
+                                   ("model",))
+LLM_CIRCUIT_REJECTIONS = registry.counter("llm_circuit_rejections_total", "Calls skipped because the circuit was open",
+                                          ("model",))
+LLM_FALLBACKS = registry.counter("llm_fallbacks_total", "Fallbacks to an alternate model or to the static estimate",
+                                 ("kind",))
+AI_PROMPT_TRUNCATIONS = registry.counter("ai_prompt_truncations_total",
+                                        "Scope prompts whose requirements were cut to fit AI_INPUT_TOKEN_BUDGET")
+AI_SECTION_FAILURES = registry.counter("ai_scope_section_failures_total",
+                                      "Long-document scope passes that failed: a section estimate (map) skipped, "
+                                      "or the merge (reduce) replaced by the deterministic merge", ("stage",))
+EXPORT_REQUESTS = registry.counter("quote_export_requests_total", "Quote document downloads, by format and render cache result",
+                                   ("format", "cache"))
+EXPORT_RENDER_LATENCY = registry.histogram("quote_export_render_seconds", "Time to render a quote document (cache misses)",
+                                           ("format",))
+AUDIT_EVENTS = registry.counter("audit_events_total", "Quote change events written to the audit log, or dropped",
+                                ("outcome",))
+
+
+# --- Per-request state ---
+
+class RequestStats:
+    def __init__(self, profile: bool = False):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.profilers = [] if profile else None
+        self._lock = threading.Lock()
+
+    @property
+    def profiling(self) -> bool:
+        return self.profilers is not None
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.queries += 1
+            self.db_seconds += seconds
+
+    def new_profiler(self) -> cProfile.Profile:
+        profiler = cProfile.Profile()
+        with self._lock:
+            self.profilers.append(profiler)
+        return profiler
+
+    def profile_report(self, top: int = PROFILE_TOP_N) -> str:
+        out = io.StringIO()
+        profilers = [p for p in self.profilers if p.getstats()]
+        if not profilers:
+            return "No profile data (endpoint did not run)\n"
+        stats = pstats.Stats(profilers[0], stream=out)
+        for profiler in profilers[1:]:
+            stats.add(profiler)
+        stats.sort_stats("cumulative").print_stats(top)
+        return out.getvalue()
+
+
+# Copied into Starlette's threadpool with the rest of the request context
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def track_request(profile: bool = False):
+    stats = RequestStats(profile=profile)
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def route_label(scope: dict) -> str:
+    # Path template ("/quotes/{quote_id}") keeps label cardinality bounded
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+
+def observe_request(method: str, route: str, status: int, seconds: float, stats: RequestStats):
+    HTTP_LATENCY.observe(seconds, method=method, route=route, status=str(status))
+    HTTP_DB_QUERIES.observe(stats.queries, method=method, route=route)
+
+
+# --- Database ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_QUERY_LATENCY.observe(elapsed, operation=operation)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.add_query(elapsed)
+
+
+def _handle_error(exception_context):
+    # after_cursor_execute never fires for a failed statement: drop its start time, or the
+    # next queries on this pooled connection would pop the wrong one
+    conn = exception_context.connection
+    if conn is not None and exception_context.execution_context is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument_engine(engine):
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(engine, "handle_error", _handle_error)
+
+
+# --- LLM ---
+
+def record_llm_usage(model: str, usage):
+    """Record token usage from an OpenAI response (or stream chunk) `usage` object, if any."""
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, model=model, kind="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, model=model, kind="completion")
+
+
+class _LLMCall:
+    def __init__(self, model: str):
+        self.model = model
+
+    def usage(self, usage):
+        record_llm_usage(self.model, usage)
+
+
+@contextmanager
+def llm_call(model: str, mode: str = "json"):
+    # Usage: with metrics.llm_call(model) as call: response = ...; call.usage(response.usage)
+    call = _LLMCall(model)
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield call
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        LLM_LATENCY.observe(time.perf_counter() - started, model=model, mode=mode, outcome=outcome)
+
+
+# --- Profiling ---
+
+def _profiled(endpoint):
+    """Wrap an endpoint so it runs under cProfile when the current request asked for it."""
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def wrapper(*args, **kwargs):
+            stats = _request_stats.get()
+            if stats is None or not stats.profiling:
+                return await endpoint(*args, **kwargs)
+            # Async endpoints share the event loop thread: other requests may show up in the report
+            profiler = stats.new_profiler()
+            profiler.enable()
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                profiler.disable()
+    else:
+        @functools.wraps(endpoint)
+        def wrapper(*args, **kwargs):
+            stats = _request_stats.get()
+            if stats is None or not stats.profiling:
+                return endpoint(*args, **kwargs)
+            # Runs in the threadpool worker, which is where cProfile has to be enabled
+            return stats.new_profiler().runcall(endpoint, *args, **kwargs)
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    # Endpoints are always wrapped; PROFILING_ENABLED is checked per request by the middleware
+    def __init__(self, path: str, endpoint, **kwargs):
+        super().__init__(path, _profiled(endpoint), **kwargs)
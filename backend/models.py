@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, Index
+from sqlalchemy.orm import relationship
 from database import Base
 
 class Role(Base):
@@ -23,12 +24,24 @@ class Project(Base):
     client_name = Column(String)
     status = Column(String, default="DRAFT") # DRAFT, SENT, ACCEPTED, REJECTED
     raw_requirements = Column(String, nullable=True)
+    # Client-side identifier from bulk imports: re-importing the same file updates instead of duplicating
+    external_ref = Column(String, nullable=True)
+
+    quotes = relationship("Quote", back_populates="project")
+
+    # Keyset pagination: (filter/sort column, id) so every page is an index range scan
+    __table_args__ = (
+        Index("ix_projects_status_id", "status", "id"),
+        Index("ix_projects_client_name_id", "client_name", "id"),
+        Index("ix_projects_name_id", "name", "id"),
+        Index("ux_projects_external_ref", "external_ref", unique=True),
+    )
     
 class Quote(Base):
     __tablename__ = "quotes"
 
     id = Column(Integer, primary_key=True, index=True)
-    project_id = Column(Integer, index=True) # Logic FK, SQLite no enforce by default unless configured
+    project_id = Column(Integer, ForeignKey("projects.id"), index=True) # SQLite no enforce by default unless configured
     
     # Financial Snapshots
     applied_margin = Column(Float, default=0.0)
@@ -38,11 +51,29 @@ class Quote(Base):
     # AI Context
     ai_raw_input = Column(String, nullable=True)
 
+    # Stored totals, kept up to date by crud on every item/financials change
+    total_cost = Column(Float, default=0.0) # Sum(hours * rate)
+    total_price = Column(Float, default=0.0) # With risk, margin and tax (see pricing.py)
+
+    # Revisions: crud.clone_quote creates version N+1 of the project's quotes from this one
+    version = Column(Integer, default=1)
+    parent_quote_id = Column(Integer, ForeignKey("quotes.id"), nullable=True, index=True)
+
+    project = relationship("Project", back_populates="quotes")
+    # Always ordered like the editable table in the frontend
+    items = relationship("QuoteItem", back_populates="quote", cascade="all, delete-orphan",
+                         order_by="[QuoteItem.sequence, QuoteItem.id]")
+
+    __table_args__ = (
+        Index("ix_quotes_total_price_id", "total_price", "id"),
+        Index("ix_quotes_total_cost_id", "total_cost", "id"),
+    )
+
 class QuoteItem(Base):
     __tablename__ = "quote_items"
 
     id = Column(Integer, primary_key=True, index=True)
-    quote_id = Column(Integer, index=True)
+    quote_id = Column(Integer, ForeignKey("quotes.id"), index=True)
     role_id = Column(Integer)
     
     description = Column(String)
@@ -58,3 +89,110 @@ class QuoteItem(Base):
     # So we MUST store the rate in the item to allow override.
     hourly_rate = Column(Float, default=0.0)
     sequence = Column(Integer, default=0)
+    # Lineage across quote versions: id of the first item this one was cloned from (NULL = original)
+    origin_item_id = Column(Integer, nullable=True, index=True)
+
+    quote = relationship("Quote", back_populates="items")
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+
+    key = Column(String, primary_key=True) # sha256 of model + prompts + roles
+    model = Column(String)
+    response = Column(String) # Raw JSON content returned by the model
+    created_at = Column(Float) # Unix timestamps, used for TTL and LRU eviction
+    last_used_at = Column(Float, index=True)
+    hits = Column(Integer, default=0)
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, primary_key=True) # Client's Idempotency-Key header
+    request_hash = Column(String) # sha256 of method + path + body: a key can't be reused for another request
+    status_code = Column(Integer, nullable=True) # NULL while the first request is still running
+    content_type = Column(String, nullable=True)
+    response_body = Column(String, nullable=True)
+    created_at = Column(Float, index=True) # Unix timestamp, for IDEMPOTENCY_TTL_SECONDS
+
+class AIGenerationLog(Base):
+    __tablename__ = "ai_generation_logs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    quote_id = Column(Integer, ForeignKey("quotes.id"), index=True)
+    created_at = Column(Float) # Unix timestamp
+    model = Column(String)
+    mode = Column(String) # single, chunked, stream
+    source = Column(String) # llm, cache, reuse, fallback
+    llm_calls = Column(Integer, default=0)
+    input_tokens = Column(Integer, default=0) # As reported by the provider (local count when it doesn't)
+    output_tokens = Column(Integer, default=0)
+    estimated_input_tokens = Column(Integer, default=0) # Local count of the prompt that was sent
+    removed_passages = Column(Integer, default=0) # Repeated requirement passages dropped before sending
+    truncated = Column(Integer, default=0) # 1 if the requirements were cut to fit AI_INPUT_TOKEN_BUDGET
+    duration_ms = Column(Float)
+
+class QuoteEvent(Base):
+    # Append-only audit log of quote/item changes, written in batches by audit_log.py
+    __tablename__ = "quote_events"
+
+    id = Column(Integer, primary_key=True)
+    quote_id = Column(Integer) # No FK: the history outlives the rows it describes
+    item_id = Column(Integer, nullable=True)
+    event_type = Column(String) # quote.created, quote.financials, item.created, item.updated, item.deleted
+    actor = Column(String, nullable=True) # X-User header of the request
+    data = Column(String) # JSON: full values on create/delete, {field: [old, new]} on update
+    created_at = Column(Float) # Unix timestamp of the change (not of the flush)
+
+    __table_args__ = (
+        Index("ix_quote_events_quote_id_id", "quote_id", "id"),
+    )
+
+# --- Analytics (analytics.py) ---
+# What each project currently contributes to the summaries (its current quote), so a
+# refresh can take the old contribution back out before adding the new one.
+
+class AnalyticsProject(Base):
+    __tablename__ = "analytics_projects"
+
+    project_id = Column(Integer, primary_key=True)
+    quote_id = Column(Integer, nullable=True) # Current quote: highest version (NULL = project without quotes)
+    client_name = Column(String)
+    status = Column(String)
+    items = Column(Integer, default=0)
+    hours = Column(Float, default=0.0)
+    cost = Column(Float, default=0.0)
+    revenue = Column(Float, default=0.0) # total_price of the current quote
+    ai_items = Column(Integer, default=0) # Items with an AI suggestion (ai_suggested_hours > 0)
+    ai_hours = Column(Float, default=0.0) # Sum of ai_suggested_hours of those items
+    ai_manual_hours = Column(Float, default=0.0) # Sum of their manual_hours
+    ai_abs_error = Column(Float, default=0.0) # Sum of |manual_hours - ai_suggested_hours|
+
+class AnalyticsProjectRole(Base):
+    __tablename__ = "analytics_project_roles"
+
+    project_id = Column(Integer, primary_key=True)
+    role_id = Column(Integer, primary_key=True) # 0 = items without a role
+    items = Column(Integer, default=0)
+    hours = Column(Float, default=0.0)
+    cost = Column(Float, default=0.0)
+    revenue = Column(Float, default=0.0) # The role's share of the price (pricing is linear in cost)
+    ai_items = Column(Integer, default=0)
+    ai_hours = Column(Float, default=0.0)
+    ai_manual_hours = Column(Float, default=0.0)
+    ai_abs_error = Column(Float, default=0.0)
+
+class AnalyticsSummary(Base):
+    # One row per role / client / status: what the dashboards read
+    __tablename__ = "analytics_summary"
+
+    dimension = Column(String, primary_key=True) # role, client, status
+    key = Column(String, primary_key=True) # role id, client name or status
+    projects = Column(Integer, default=0)
+    items = Column(Integer, default=0)
+    hours = Column(Float, default=0.0)
+    cost = Column(Float, default=0.0)
+    revenue = Column(Float, default=0.0)
+    ai_items = Column(Integer, default=0)
+    ai_hours = Column(Float, default=0.0)
+    ai_manual_hours = Column(Float, default=0.0)
+    ai_abs_error = Column(Float, default=0.0)
@@ -0,0 +1,156 @@
+"""
+Quote pricing rules (source of truth for every total shown to the user).
+
+    Subtotal (Cost)  = Sum(hours * rate)
+    Risk Amount      = Subtotal * risk_percent        (buffer on COST)
+    CostBase         = Subtotal + Risk Amount
+    Price            = CostBase / (1 - margin)        (standard gross margin formula)
+    Tax              = Price * tax_percent
+    Total with Tax   = Price + Tax
+
+quote_price() is the Python version; total_price_sql() builds the same formula
+as a SQL expression so stored totals can be updated set-based, in one statement;
+price_batch() applies it to NumPy arrays to price thousands of quotes or what-if
+scenarios (margin/risk sweeps, role rate changes) in one pass.
+"""
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import Session
+
+import models
+
+MAX_MARGIN = 0.99 # Safety: margin >= 100% would divide by zero
+
+
+def quote_price(subtotal_cost: float, risk: float, margin: float, tax: float) -> float:
+    subtotal_cost = subtotal_cost or 0.0
+    risk_amount = subtotal_cost * (risk or 0.0)
+    cost_base = subtotal_cost + risk_amount
+
+    # Margin is Profit / Price. Price = Cost / (1 - Margin)
+    margin = margin or 0.0
+    if margin >= 1.0: margin = MAX_MARGIN
+
+    if margin < 1.0 and margin >= 0:
+        price_before_tax = cost_base / (1 - margin)
+    else:
+        price_before_tax = cost_base # No margin logic if invalid
+
+    tax_amount = price_before_tax * (tax or 0.0)
+    return price_before_tax + tax_amount
+
+
+def price_breakdown(subtotal_cost: float, risk: float, margin: float, tax: float) -> Dict[str, float]:
+    """quote_price() line by line, for documents that show each step (same rules)."""
+    subtotal_cost = subtotal_cost or 0.0
+    risk_amount = subtotal_cost * (risk or 0.0)
+    cost_base = subtotal_cost + risk_amount
+    margin = min(margin or 0.0, MAX_MARGIN)
+    price_before_tax = cost_base / (1 - margin) if margin >= 0 else cost_base
+    tax_amount = price_before_tax * (tax or 0.0)
+    return {
+        "subtotal_cost": subtotal_cost,
+        "risk_amount": risk_amount,
+        "margin_amount": price_before_tax - cost_base,
+        "price_before_tax": price_before_tax,
+        "tax_amount": tax_amount,
+        "total_price": price_before_tax + tax_amount,
+    }
+
+
+def total_price_sql(subtotal_cost, risk, margin, tax):
+    """SQL twin of quote_price(). Arguments may be columns, expressions or plain floats."""
+    subtotal_cost = func.coalesce(subtotal_cost, 0.0)
+    cost_base = subtotal_cost + subtotal_cost * func.coalesce(risk, 0.0)
+    margin = func.coalesce(margin, 0.0)
+    price_before_tax = case(
+        (margin >= 1.0, cost_base / (1 - MAX_MARGIN)),
+        (margin >= 0, cost_base / (1 - margin)),
+        else_=cost_base,
+    )
+    return price_before_tax + price_before_tax * func.coalesce(tax, 0.0)
+
+
+# --- Vectorized pricing ---
+
+def price_batch(subtotal_cost, risk, margin, tax) -> np.ndarray:
+    """quote_price() over arrays. Inputs broadcast against each other; NaN/None count as 0."""
+    subtotal_cost, risk, margin, tax = (np.nan_to_num(np.asarray(a, dtype=float)) for a in (subtotal_cost, risk, margin, tax))
+    cost_base = subtotal_cost + subtotal_cost * risk
+    margin = np.where(margin >= 1.0, MAX_MARGIN, margin)
+    price_before_tax = np.where(margin >= 0, cost_base / (1 - margin), cost_base)
+    return price_before_tax + price_before_tax * tax
+
+
+def subtotals_by_quote(quote_index: np.ndarray, hours: np.ndarray, rates: np.ndarray, n_quotes: int) -> np.ndarray:
+    """Sum(hours * rate) per quote. quote_index maps every item row to its quote position (0..n_quotes-1)."""
+    return np.bincount(quote_index, weights=np.nan_to_num(hours) * np.nan_to_num(rates), minlength=n_quotes)
+
+
+def price_quotes_loop(quote_ids, financials, items, role_rates=None) -> Dict[int, tuple]:
+    """Reference per-quote Python loop (what read_quote used to do), kept for benchmarks and tests."""
+    role_rates = role_rates or {}
+    subtotals = {quote_id: 0.0 for quote_id in quote_ids}
+    for quote_id, role_id, hours, rate in items:
+        subtotals[quote_id] += (hours or 0.0) * role_rates.get(role_id, rate or 0.0)
+    return {
+        quote_id: (subtotals[quote_id], quote_price(subtotals[quote_id], *financials[quote_id]))
+        for quote_id in quote_ids
+    }
+
+
+def price_quotes(db: Session, quote_ids: Optional[Sequence[int]] = None,
+                 role_rates: Optional[Dict[int, float]] = None, scenarios: Optional[List[dict]] = None) -> dict:
+    """
+    Price many quotes at once from the database.
+
+    quote_ids:  quotes to price (None = the whole book)
+    role_rates: {role_id: hourly_rate} overriding the rate snapshot of matching items
+    scenarios:  [{"risk"?, "margin"?, "tax"?}], each applied to every quote; a missing
+                key keeps the quote's own value
+
+    Returns {"quote_ids", "total_cost", "total_price", "scenario_prices"} as NumPy arrays,
+    scenario_prices with shape (len(scenarios), len(quote_ids)).
+    """
+    Quote, Item = models.Quote, models.QuoteItem
+    quote_query = select(Quote.id, Quote.applied_risk, Quote.applied_margin, Quote.applied_tax).order_by(Quote.id)
+    item_query = select(Item.quote_id, Item.role_id, Item.manual_hours, Item.hourly_rate)
+    if quote_ids is not None:
+        quote_query = quote_query.where(Quote.id.in_(list(quote_ids)))
+        item_query = item_query.where(Item.quote_id.in_(list(quote_ids)))
+
+    quotes = np.array(db.execute(quote_query).all(), dtype=float).reshape(-1, 4)
+    items = np.array(db.execute(item_query).all(), dtype=float).reshape(-1, 4)
+    ids = quotes[:, 0].astype(np.int64)
+    risk, margin, tax = quotes[:, 1], quotes[:, 2], quotes[:, 3]
+
+    item_quote_ids = items[:, 0].astype(np.int64)
+    role_ids, hours, rates = items[:, 1], items[:, 2], items[:, 3].copy()
+    for role_id, rate in (role_rates or {}).items():
+        rates[role_ids == role_id] = rate
+
+    # Items of quotes that were not selected (or no longer exist) are dropped here
+    if len(ids):
+        position = np.minimum(np.searchsorted(ids, item_quote_ids), len(ids) - 1)
+        known = ids[position] == item_quote_ids
+    else:
+        position, known = np.zeros(len(items), dtype=np.int64), np.zeros(len(items), dtype=bool)
+    subtotal = subtotals_by_quote(position[known], hours[known], rates[known], len(ids))
+
+    scenario_prices = np.empty((len(scenarios or []), len(ids)))
+    for row, scenario in enumerate(scenarios or []):
+        scenario_prices[row] = price_batch(
+            subtotal,
+            risk if scenario.get("risk") is None else scenario["risk"],
+            margin if scenario.get("margin") is None else scenario["margin"],
+            tax if scenario.get("tax") is None else scenario["tax"],
+        )
+
+    return {
+        "quote_ids": ids,
+        "total_cost": subtotal,
+        "total_price": price_batch(subtotal, risk, margin, tax),
+        "scenario_prices": scenario_prices,
+    }
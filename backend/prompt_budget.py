@@ -0,0 +1,101 @@
+"""
+Prompt compaction and input-token budget for AIService.
+
+    count_tokens(text)                        local token count (tiktoken if installed, else an estimate)
+    compact(text)                             dedent, collapse whitespace runs and blank lines
+    dedupe_passages(text)                     drop paragraphs repeated verbatim (pasted twice, repeated boilerplate)
+    fit_requirements(text, budget_tokens)     keep whole sections, in order, until the budget is used
+
+Only the requirements are ever cut: the system prompt, roles and JSON format
+instructions always go out complete. generate_scope prefers the map-reduce path
+(scope_chunking.py) when a document does not fit AI_INPUT_TOKEN_BUDGET, so
+truncation is the last resort for single-prompt mode and streaming.
+"""
+import math
+import os
+import re
+import textwrap
+from typing import List, Tuple
+
+from scope_chunking import normalize_text, split_sections
+
+INPUT_TOKEN_BUDGET = int(os.getenv("AI_INPUT_TOKEN_BUDGET", "8000"))
+DEDUPE_MIN_CHARS = 40 # Shorter paragraphs ("Sí", "N/A", bullets) legitimately repeat
+
+TRUNCATION_NOTE = "[... {omitted} sección(es) omitidas por límite de tokens ...]"
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception: # Not installed, or no encoding files offline
+    _ENCODING = None
+
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Exact with tiktoken; otherwise ~4 characters per word piece plus one per symbol (slightly high for Spanish)."""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text, disallowed_special=()))
+    return sum(max(1, math.ceil(len(p) / 4)) if p[0].isalnum() or p[0] == "_" else 1 for p in _PIECES.findall(text))
+
+
+def compact(text: str) -> str:
+    """Remove the indentation of triple-quoted prompts, trailing spaces and repeated blank lines."""
+    text = textwrap.dedent((text or "").expandtabs(4))
+    # Runs of spaces inside a line become one; leading indentation (nested lists) is kept
+    lines = [re.sub(r"(?<=\S)[ \t\u00a0]{2,}", " ", line).rstrip() for line in text.splitlines()]
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def dedupe_passages(text: str) -> Tuple[str, int]:
+    """Drop paragraphs repeated verbatim (ignoring case, accents and punctuation). Returns (text, removed)."""
+    seen = set()
+    removed = 0
+    paragraphs = []
+    for paragraph in re.split(r"\n\s*\n", text or ""):
+        key = normalize_text(paragraph)
+        if not key:
+            continue
+        if key in seen and len(key) >= DEDUPE_MIN_CHARS:
+            # Whole paragraphs only: the same sentence under two different modules is still two pieces of work
+            removed += 1
+            continue
+        seen.add(key)
+        paragraphs.append(paragraph)
+    return "\n\n".join(paragraphs), removed
+
+
+def prepare_requirements(text: str) -> Tuple[str, int]:
+    """compact() + dedupe_passages(). Returns (text, passages removed)."""
+    return dedupe_passages(compact(text))
+
+
+def fit_requirements(text: str, budget_tokens: int) -> Tuple[str, bool]:
+    """Whole sections in document order until budget_tokens; returns (text, truncated)."""
+    if count_tokens(text) <= budget_tokens:
+        return text, False
+    sections = split_sections(text)
+    used = count_tokens(TRUNCATION_NOTE.format(omitted=len(sections)))
+    kept: List[str] = []
+    for section in sections:
+        cost = count_tokens(section)
+        if used + cost > budget_tokens:
+            break
+        kept.append(section)
+        used += cost
+    if not kept and sections:
+        # Even the first section is over budget: keep as many of its lines as fit
+        lines = []
+        for line in sections[0].splitlines():
+            used += count_tokens(line) + 1
+            if used > budget_tokens:
+                break
+            lines.append(line)
+        kept.append("\n".join(lines))
+        omitted = len(sections)
+    else:
+        omitted = len(sections) - len(kept)
+    return "\n\n".join(kept + [TRUNCATION_NOTE.format(omitted=omitted)]), True
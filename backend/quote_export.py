@@ -0,0 +1,505 @@
+"""
+Server-side quote documents (PDF and XLSX).
+
+    payload = quote_export.build_payload(quote, roles_by_id)   # read_quote data + role names + breakdown
+    path, key = await quote_export.exporter.export(payload, "pdf")
+
+Rendering is pure Python with no third-party dependency: a small PDF 1.4 writer
+(standard Helvetica fonts, WinAnsi text, Flate-compressed pages) and an Office
+Open XML workbook written with zipfile. Both are deterministic, so the same
+payload always produces the same bytes.
+
+Renders run in a process pool (EXPORT_WORKERS processes; 0 = thread pool) and are
+cached on disk (EXPORT_CACHE_DIR) under a sha256 of the payload, the format and
+RENDERER_VERSION. Any change to the quote, its items, its financials or a role
+name changes the key; the last EXPORT_CACHE_MAX_FILES documents are kept.
+"""
+import asyncio
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+from xml.sax.saxutils import escape
+
+import metrics
+import pricing
+
+EXPORT_WORKERS = int(os.getenv("EXPORT_WORKERS", "2"))
+CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "./export_cache")
+CACHE_MAX_FILES = int(os.getenv("EXPORT_CACHE_MAX_FILES", "500"))
+
+RENDERER_VERSION = "1" # Bump when the layout changes so cached documents are re-rendered
+
+FORMATS = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+# --- Payload ---
+
+def build_payload(quote, roles_by_id: Dict[int, object]) -> dict:
+    """Plain data for the renderers from a schemas.Quote (as returned by read_quote)."""
+    items = []
+    for item in quote.items:
+        role = roles_by_id.get(item.role_id)
+        hours, rate = item.manual_hours or 0.0, item.hourly_rate or 0.0
+        items.append({
+            "role": role.name if role else f"Rol {item.role_id}",
+            "description": item.description or "",
+            "hours": hours,
+            "hourly_rate": rate,
+            "subtotal": round(hours * rate, 2),
+        })
+    breakdown = pricing.price_breakdown(quote.total_cost, quote.applied_risk, quote.applied_margin, quote.applied_tax)
+    return {
+        "quote_id": quote.id,
+        "version": quote.version or 1,
+        "project_name": quote.project_name or "",
+        "client_name": quote.client_name or "",
+        "applied_margin": quote.applied_margin or 0.0,
+        "applied_risk": quote.applied_risk or 0.0,
+        "applied_tax": quote.applied_tax or 0.0,
+        "items": items,
+        "totals": {k: round(v, 2) for k, v in breakdown.items()},
+    }
+
+
+def content_key(payload: dict, fmt: str) -> str:
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(f"{RENDERER_VERSION}:{fmt}:{canonical}".encode("utf-8")).hexdigest()
+
+
+def filename(payload: dict, fmt: str) -> str:
+    return f"cotizacion-{payload['quote_id']}-v{payload['version']}.{fmt}"
+
+
+def _money(value: float) -> str:
+    return f"${value:,.2f}"
+
+
+def _percent(value: float) -> str:
+    return f"{value * 100:.0f}%"
+
+
+def _summary_rows(payload: dict) -> List[Tuple[str, float]]:
+    # Same lines as the summary step of the frontend
+    totals = payload["totals"]
+    return [
+        ("Costo Base", totals["subtotal_cost"]),
+        (f"Riesgo ({_percent(payload['applied_risk'])})", totals["risk_amount"]),
+        (f"Margen ({_percent(payload['applied_margin'])})", totals["margin_amount"]),
+        ("Total (sin IVA)", totals["price_before_tax"]),
+        (f"IVA ({_percent(payload['applied_tax'])})", totals["tax_amount"]),
+        ("TOTAL FINAL", totals["total_price"]),
+    ]
+
+
+# --- PDF ---
+
+# Helvetica advance widths (1/1000 em) for ASCII 32..126; digits, "$", "," and "." are the same in bold
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842 # A4 in points
+MARGIN = 50
+ROW_FONT_SIZE = 9
+LINE_HEIGHT = 12
+# (title, x, width, align); numeric columns are right-aligned at x + width
+COLUMNS = [
+    ("Rol", 50, 105, "left"),
+    ("Descripción", 160, 205, "left"),
+    ("Horas", 365, 45, "right"),
+    ("Tarifa", 410, 60, "right"),
+    ("Subtotal", 470, 75, "right"),
+]
+HEADER_FILL = (0.173, 0.243, 0.314) # #2c3e50, like the client-side document
+
+
+def _text_width(text: str, size: float) -> float:
+    return sum(_HELVETICA_WIDTHS[ord(c) - 32] if 32 <= ord(c) <= 126 else 556 for c in text) * size / 1000
+
+
+def _wrap(text: str, width: float, size: float = ROW_FONT_SIZE) -> List[str]:
+    lines = []
+    for paragraph in (text or "").splitlines() or [""]:
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if line and _text_width(candidate, size) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+            while _text_width(line, size) > width and len(line) > 1:
+                # A single word wider than the column: hard cut
+                cut = len(line)
+                while cut > 1 and _text_width(line[:cut], size) > width:
+                    cut -= 1
+                lines.append(line[:cut])
+                line = line[cut:]
+        lines.append(line)
+    return lines
+
+
+def _pdf_string(text: str) -> bytes:
+    raw = text.encode("cp1252", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+class _Page:
+    def __init__(self):
+        self.ops: List[bytes] = []
+
+    def text(self, x: float, y: float, text: str, size: float = ROW_FONT_SIZE, bold: bool = False,
+             align: str = "left", width: float = 0.0, color: Tuple[float, float, float] = (0, 0, 0)):
+        if align == "right":
+            x = x + width - _text_width(text, size)
+        font = b"/F2" if bold else b"/F1"
+        self.ops.append(b"%.3f %.3f %.3f rg BT %s %.1f Tf %.2f %.2f Td %s Tj ET" % (
+            *color, font, size, x, y, _pdf_string(text)))
+
+    def rect(self, x: float, y: float, width: float, height: float, color: Tuple[float, float, float]):
+        self.ops.append(b"%.3f %.3f %.3f rg %.2f %.2f %.2f %.2f re f" % (*color, x, y, width, height))
+
+    def line(self, x1: float, y1: float, x2: float, y2: float, gray: float = 0.6):
+        self.ops.append(b"%.2f G 0.5 w %.2f %.2f m %.2f %.2f l S" % (gray, x1, y1, x2, y2))
+
+
+def _table_header(page: _Page, y: float) -> float:
+    page.rect(MARGIN, y - 4, PAGE_WIDTH - 2 * MARGIN, LINE_HEIGHT + 4, HEADER_FILL)
+    for title, x, width, align in COLUMNS:
+        page.text(x + 2 if align == "left" else x - 2, y, title, bold=True, align=align, width=width, color=(1, 1, 1))
+    return y - LINE_HEIGHT - 6
+
+
+def _write_pdf(pages: List[_Page]) -> bytes:
+    objects: List[bytes] = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"", # Pages, filled in once the page objects are numbered
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>",
+    ]
+    page_refs = []
+    for page in pages:
+        stream = zlib.compress(b"\n".join(page.ops), 6)
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> >>" % (PAGE_WIDTH, PAGE_HEIGHT, content_ref))
+        page_refs.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % ref for ref in page_refs), len(page_refs))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def render_pdf(payload: dict) -> bytes:
+    bottom = MARGIN + 20 # Leave room for the page number
+    pages = [_Page()]
+    page = pages[0]
+    y = PAGE_HEIGHT - MARGIN - 10
+    page.text(MARGIN, y, "COTIZACIÓN DE SERVICIOS PROFESIONALES", size=16, bold=True, color=HEADER_FILL)
+    y -= 26
+    page.text(MARGIN, y, f"Proyecto: {payload['project_name']}", size=11, bold=True)
+    page.text(MARGIN, y, f"Cotización #{payload['quote_id']} (versión {payload['version']})",
+              size=9, align="right", width=PAGE_WIDTH - 2 * MARGIN)
+    y -= 16
+    page.text(MARGIN, y, f"Cliente: {payload['client_name']}", size=11, bold=True)
+    y -= 28
+    page.text(MARGIN, y, "ALCANCE Y ESTIMACIÓN", size=11, bold=True, color=HEADER_FILL)
+    y = _table_header(page, y - 18)
+
+    for item in payload["items"]:
+        description = _wrap(item["description"], COLUMNS[1][2] - 4)
+        role = _wrap(item["role"], COLUMNS[0][2] - 4)
+        height = max(len(description), len(role)) * LINE_HEIGHT
+        if y - height < bottom:
+            page = _Page()
+            pages.append(page)
+            y = _table_header(page, PAGE_HEIGHT - MARGIN - 10)
+        for i, line in enumerate(role):
+            page.text(COLUMNS[0][1] + 2, y - i * LINE_HEIGHT, line)
+        for i, line in enumerate(description):
+            page.text(COLUMNS[1][1] + 2, y - i * LINE_HEIGHT, line)
+        for (_, x, width, _), value in zip(COLUMNS[2:], (f"{item['hours']:,.2f}", _money(item["hourly_rate"]),
+                                                          _money(item["subtotal"]))):
+            page.text(x - 2, y, value, align="right", width=width)
+        y -= height
+        page.line(MARGIN, y + LINE_HEIGHT - 3, PAGE_WIDTH - MARGIN, y + LINE_HEIGHT - 3, gray=0.85)
+
+    summary = _summary_rows(payload)
+    if y - (len(summary) + 2) * 16 < bottom:
+        page = _Page()
+        pages.append(page)
+        y = PAGE_HEIGHT - MARGIN - 10
+    y -= 16
+    label_x, value_x, value_width = PAGE_WIDTH - MARGIN - 220, PAGE_WIDTH - MARGIN - 100, 100
+    for i, (label, value) in enumerate(summary):
+        final = i == len(summary) - 1
+        if label.startswith("Total"):
+            page.line(label_x, y + 13, PAGE_WIDTH - MARGIN, y + 13, gray=0.2)
+        size = 12 if final else 10
+        color = (0.161, 0.502, 0.725) if final else (0, 0, 0) # #2980b9
+        page.text(label_x, y, f"{label}:", size=size, bold=final or label.startswith("Total"), color=color)
+        page.text(value_x, y, _money(value), size=size, bold=final or label.startswith("Total"), align="right",
+                  width=value_width, color=color)
+        y -= 20 if final else 16
+
+    for number, page in enumerate(pages, start=1):
+        page.text(MARGIN, MARGIN - 10, f"Página {number} de {len(pages)}", size=8, align="right",
+                  width=PAGE_WIDTH - 2 * MARGIN, color=(0.4, 0.4, 0.4))
+    return _write_pdf(pages)
+
+
+# --- XLSX ---
+
+_ZIP_DATE = (1980, 1, 1, 0, 0, 0) # Fixed timestamps keep the archive byte-for-byte reproducible
+
+_CONTENT_TYPES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">
+<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>
+<Default Extension="xml" ContentType="application/xml"/>
+<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>
+<Override PartName="/xl/worksheets/sheet1.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>
+<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>
+</Types>"""
+
+_ROOT_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>
+</Relationships>"""
+
+_WORKBOOK = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+<sheets><sheet name="Cotización" sheetId="1" r:id="rId1"/></sheets>
+</workbook>"""
+
+_WORKBOOK_RELS = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>
+</Relationships>"""
+
+# Cell styles: 0 default, 1 bold, 2 money, 3 bold money, 4 percent, 5 hours
+_STYLES = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+<numFmts count="1"><numFmt numFmtId="164" formatCode="&quot;$&quot;#,##0.00"/></numFmts>
+<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font><font><b/><sz val="11"/><name val="Calibri"/></font></fonts>
+<fills count="2"><fill><patternFill patternType="none"/></fill><fill><patternFill patternType="gray125"/></fill></fills>
+<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>
+<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>
+<cellXfs count="6">
+<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>
+<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>
+<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="164" fontId="1" fillId="0" borderId="0" xfId="0" applyNumberFormat="1" applyFont="1"/>
+<xf numFmtId="9" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>
+</cellXfs>
+</styleSheet>"""
+
+BOLD, MONEY, BOLD_MONEY, PERCENT, HOURS = 1, 2, 3, 4, 5
+
+
+def _column(index: int) -> str:
+    name = ""
+    index += 1
+    while index:
+        index, rest = divmod(index - 1, 26)
+        name = chr(65 + rest) + name
+    return name
+
+
+def _cell(ref: str, value, style: int = 0) -> str:
+    style_attr = f' s="{style}"' if style else ""
+    if isinstance(value, str) and value.startswith("="):
+        return f'<c r="{ref}"{style_attr}><f>{escape(value[1:])}</f></c>'
+    if isinstance(value, (int, float)):
+        return f'<c r="{ref}"{style_attr}><v>{value!r}</v></c>'
+    return f'<c r="{ref}"{style_attr} t="inlineStr"><is><t xml:space="preserve">{escape(value or "")}</t></is></c>'
+
+
+def _sheet(payload: dict) -> str:
+    rows: List[List[Tuple[object, int]]] = [
+        [("COTIZACIÓN DE SERVICIOS PROFESIONALES", BOLD)],
+        [("Proyecto", BOLD), (payload["project_name"], 0)],
+        [("Cliente", BOLD), (payload["client_name"], 0)],
+        [("Cotización", BOLD), (f"#{payload['quote_id']} (versión {payload['version']})", 0)],
+        [],
+        [(title, BOLD) for title in ("Rol", "Descripción", "Horas", "Tarifa", "Subtotal")],
+    ]
+    first_item = len(rows) + 1
+    for item in payload["items"]:
+        row = len(rows) + 1
+        # Subtotal as a formula so edited hours/rates recalculate in Excel
+        rows.append([(item["role"], 0), (item["description"], 0), (item["hours"], HOURS),
+                     (item["hourly_rate"], MONEY), (f"=C{row}*D{row}", MONEY)])
+    last_item = len(rows)
+    rows.append([])
+    rows.append([("Riesgo", BOLD), (payload["applied_risk"], PERCENT)])
+    rows.append([("Margen", BOLD), (payload["applied_margin"], PERCENT)])
+    rows.append([("IVA", BOLD), (payload["applied_tax"], PERCENT)])
+    rows.append([])
+    for i, (label, value) in enumerate(_summary_rows(payload)):
+        if i == 0 and payload["items"]:
+            value = f"=SUM(E{first_item}:E{last_item})"
+        rows.append([(label, BOLD), ("", 0), ("", 0), ("", 0), (value, BOLD_MONEY if label.isupper() else MONEY)])
+
+    xml_rows = []
+    for r, cells in enumerate(rows, start=1):
+        xml_cells = "".join(_cell(f"{_column(c)}{r}", value, style) for c, (value, style) in enumerate(cells)
+                            if value != "")
+        xml_rows.append(f'<row r="{r}">{xml_cells}</row>')
+    return ('<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+            '<cols><col min="1" max="1" width="24" customWidth="1"/><col min="2" max="2" width="60" customWidth="1"/>'
+            '<col min="3" max="5" width="14" customWidth="1"/></cols>'
+            f'<sheetData>{"".join(xml_rows)}</sheetData></worksheet>')
+
+
+def render_xlsx(payload: dict) -> bytes:
+    out = io.BytesIO()
+    with zipfile.ZipFile(out, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, content in (("[Content_Types].xml", _CONTENT_TYPES), ("_rels/.rels", _ROOT_RELS),
+                              ("xl/workbook.xml", _WORKBOOK), ("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS),
+                              ("xl/styles.xml", _STYLES), ("xl/worksheets/sheet1.xml", _sheet(payload))):
+            info = zipfile.ZipInfo(name, date_time=_ZIP_DATE)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            archive.writestr(info, content.encode("utf-8"))
+    return out.getvalue()
+
+
+RENDERERS = {"pdf": render_pdf, "xlsx": render_xlsx}
+
+
+def render(payload: dict, fmt: str) -> bytes:
+    # Module-level so it can be pickled into the worker processes
+    return RENDERERS[fmt](payload)
+
+
+# --- Render cache ---
+
+class RenderCache:
+    """Rendered documents on disk, one file per content key; least recently served files are pruned."""
+
+    def __init__(self, directory: str = CACHE_DIR, max_files: int = CACHE_MAX_FILES):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def path(self, key: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{key}.{fmt}")
+
+    def get(self, key: str, fmt: str) -> Optional[str]:
+        path = self.path(key, fmt)
+        try:
+            os.utime(path) # mtime doubles as "last served" for pruning
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, fmt: str, data: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(key, fmt)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        self._prune()
+        return path
+
+    def _prune(self):
+        with self._lock:
+            try:
+                entries = [e for e in os.scandir(self.directory) if e.is_file() and not e.name.endswith(".tmp")]
+            except FileNotFoundError:
+                return
+            if len(entries) <= self.max_files:
+                return
+            entries.sort(key=lambda e: e.stat().st_mtime)
+            for entry in entries[:len(entries) - self.max_files]:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+    def clear(self):
+        with self._lock:
+            if os.path.isdir(self.directory):
+                for entry in os.scandir(self.directory):
+                    os.remove(entry.path)
+
+
+class QuoteExporter:
+    def __init__(self, cache: RenderCache, workers: int = EXPORT_WORKERS):
+        self.cache = cache
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.workers <= 0:
+            return None # Default thread pool of the event loop
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: forking a process that already runs threads (uvicorn, job pool) is unsafe
+                self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._pool
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown(cancel_futures=True)
+                self._pool = None
+
+    async def _render(self, key: str, payload: dict, fmt: str) -> str:
+        started = time.perf_counter()
+        data = await asyncio.get_running_loop().run_in_executor(self._executor(), render, payload, fmt)
+        metrics.EXPORT_RENDER_LATENCY.observe(time.perf_counter() - started, format=fmt)
+        return self.cache.put(key, fmt, data)
+
+    async def export(self, payload: dict, fmt: str) -> Tuple[str, str]:
+        """Path of the rendered document plus its content key; renders on a cache miss."""
+        key = content_key(payload, fmt)
+        path = self.cache.get(key, fmt)
+        if path is not None:
+            metrics.EXPORT_REQUESTS.inc(format=fmt, cache="hit")
+            return path, key
+
+        metrics.EXPORT_REQUESTS.inc(format=fmt, cache="miss")
+        pending = self._inflight.get(key)
+        if pending is None:
+            # Concurrent downloads of the same document share one render
+            pending = asyncio.ensure_future(self._render(key, payload, fmt))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(pending), key
+
+
+exporter = QuoteExporter(RenderCache())
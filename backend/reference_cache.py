@@ -0,0 +1,102 @@
+"""
+In-process cache of reference data: roles and system config.
+
+Both tables change rarely but are read on every screen and every AI generation.
+The cache keeps them as Pydantic snapshots (safe to share across sessions and
+threads) plus an id -> role dict. crud invalidates it on every write, and each
+rebuild gets a content-hash ETag used by GET /roles/ and GET /config/.
+
+Each snapshot is tagged with a version counter kept in cache_backend, so with a
+shared backend (CACHE_URL=redis://...) a write in one worker invalidates the
+snapshots of every other worker on their next read.
+"""
+import hashlib
+import json
+import threading
+from typing import Dict, List
+
+from sqlalchemy.orm import Session
+
+import models, schemas
+from cache_backend import CacheBackend, cache_backend
+
+
+class _Entry:
+    def __init__(self, data, etag: str, version: str):
+        self.data = data
+        self.etag = etag
+        self.version = version
+        self.by_id = None # Built on first lookup (roles only)
+
+
+class ReferenceCache:
+    KINDS = ("roles", "configs")
+
+    def __init__(self, backend: CacheBackend = cache_backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._entries: Dict[str, _Entry] = {}
+
+    def _version(self, kind: str) -> str:
+        return self.backend.get(f"refcache:{kind}:version") or "0"
+
+    # --- Loaders ---
+    @staticmethod
+    def _load_roles(db: Session) -> List[schemas.Role]:
+        return [schemas.Role.model_validate(r) for r in db.query(models.Role).order_by(models.Role.id).all()]
+
+    @staticmethod
+    def _load_configs(db: Session) -> List[schemas.SystemConfig]:
+        return [schemas.SystemConfig.model_validate(c) for c in db.query(models.SystemConfig).order_by(models.SystemConfig.key).all()]
+
+    def _get(self, kind: str, db: Session, loader) -> _Entry:
+        version = self._version(kind)
+        entry = self._entries.get(kind)
+        if entry is not None and entry.version == version:
+            return entry
+
+        data = loader(db)
+        payload = json.dumps([d.model_dump() for d in data], sort_keys=True, default=str)
+        entry = _Entry(data, f'W/"{kind}-{hashlib.sha1(payload.encode()).hexdigest()[:16]}"', version)
+        with self._lock:
+            # Don't publish a snapshot if a write invalidated it while we were loading
+            if self._version(kind) == version:
+                self._entries[kind] = entry
+        return entry
+
+    # --- Public API ---
+    def roles(self, db: Session) -> List[schemas.Role]:
+        return self._get("roles", db, self._load_roles).data
+
+    def roles_by_id(self, db: Session) -> Dict[int, schemas.Role]:
+        entry = self._get("roles", db, self._load_roles)
+        if entry.by_id is None:
+            entry.by_id = {r.id: r for r in entry.data}
+        return entry.by_id
+
+    def roles_etag(self, db: Session) -> str:
+        return self._get("roles", db, self._load_roles).etag
+
+    def configs(self, db: Session) -> List[schemas.SystemConfig]:
+        return self._get("configs", db, self._load_configs).data
+
+    def configs_etag(self, db: Session) -> str:
+        return self._get("configs", db, self._load_configs).etag
+
+    def invalidate(self, kind: str):
+        with self._lock:
+            self.backend.incr(f"refcache:{kind}:version")
+            self._entries.pop(kind, None)
+
+    def clear(self):
+        for kind in self.KINDS:
+            self.invalidate(kind)
+
+    def invalidate_roles(self):
+        self.invalidate("roles")
+
+    def invalidate_configs(self):
+        self.invalidate("configs")
+
+
+reference_cache = ReferenceCache()
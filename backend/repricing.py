@@ -0,0 +1,114 @@
+"""
+Bring the hourly_rate snapshots of open quotes in line with a role's rate.
+
+QuoteItem.hourly_rate is copied from the role when the item is created, so a
+role rate change does not reach existing quotes. For quotes whose project is
+still DRAFT (finalized projects are SENT or later and keep their rates):
+
+    preview(db, role_id)           dry run: affected quotes and their cost/price deltas
+    apply(db, role_id, progress)   the same change, written
+
+apply() runs one set-based UPDATE of quote_items per REPRICE_BATCH_QUOTES quotes
+(WHERE role_id = ? AND quote_id IN (...)), recomputes those quotes' stored totals
+in the same transaction and commits, so a large book reports progress and never
+holds the write lock for long. Each changed item is recorded in the audit log.
+
+only_rate limits the change to items still at that rate (e.g. the old role rate),
+leaving items whose rate was negotiated by hand untouched. Items with no rate at all
+(NULL hourly_rate, e.g. older rows) are repriced unless only_rate is given.
+"""
+import os
+from typing import Callable, List, Optional
+
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.orm import Session
+
+import crud, models, pricing
+from analytics import summaries
+from audit_log import event_log
+
+BATCH_QUOTES = int(os.getenv("REPRICE_BATCH_QUOTES", "500"))
+OPEN_STATUSES = ("DRAFT",)
+
+
+def _item_filter(role_id: int, new_rate: float, only_rate: Optional[float]):
+    Item, Quote, Project = models.QuoteItem, models.Quote, models.Project
+    open_quotes = select(Quote.id).join(Project, Project.id == Quote.project_id).where(Project.status.in_(OPEN_STATUSES))
+    # `!=` alone is NULL for items without a rate: those get the role's rate too
+    changed = or_(Item.hourly_rate.is_(None), Item.hourly_rate != new_rate)
+    conditions = [Item.role_id == role_id, changed, Item.quote_id.in_(open_quotes)]
+    if only_rate is not None:
+        conditions.append(Item.hourly_rate == only_rate)
+    return conditions
+
+
+def _target_rate(db: Session, role_id: int, hourly_rate: Optional[float]) -> float:
+    if hourly_rate is not None:
+        return hourly_rate
+    role = crud.get_role(db, role_id)
+    if role is None:
+        raise LookupError("Role not found")
+    return role.hourly_rate
+
+
+def preview(db: Session, role_id: int, hourly_rate: Optional[float] = None, only_rate: Optional[float] = None) -> dict:
+    """Dry run: what apply() would change, per quote. Nothing is written."""
+    new_rate = _target_rate(db, role_id, hourly_rate)
+    Item, Quote = models.QuoteItem, models.Quote
+    per_quote = (
+        select(Item.quote_id, func.count().label("item_count"),
+               func.sum(func.coalesce(Item.manual_hours, 0.0) * (new_rate - func.coalesce(Item.hourly_rate, 0.0))).label("cost_delta"))
+        .where(*_item_filter(role_id, new_rate, only_rate))
+        .group_by(Item.quote_id)
+        .subquery()
+    )
+    rows = db.execute(
+        select(Quote.id, Quote.project_id, Quote.total_cost, Quote.total_price, Quote.applied_risk,
+               Quote.applied_margin, Quote.applied_tax, per_quote.c.item_count, per_quote.c.cost_delta)
+        .join(per_quote, per_quote.c.quote_id == Quote.id)
+        .order_by(Quote.id)
+    ).all()
+
+    quotes = []
+    for row in rows:
+        new_cost = (row.total_cost or 0.0) + row.cost_delta
+        new_price = pricing.quote_price(new_cost, row.applied_risk, row.applied_margin, row.applied_tax)
+        quotes.append({
+            "quote_id": row.id, "project_id": row.project_id, "items": row.item_count,
+            "cost_delta": round(row.cost_delta, 2),
+            "total_price": round(row.total_price or 0.0, 2), "new_total_price": round(new_price, 2),
+            "price_delta": round(new_price - (row.total_price or 0.0), 2),
+        })
+    return {
+        "role_id": role_id, "hourly_rate": new_rate, "dry_run": True, "quotes": quotes,
+        "items": sum(q["items"] for q in quotes),
+        "cost_delta": round(sum(q["cost_delta"] for q in quotes), 2),
+        "price_delta": round(sum(q["price_delta"] for q in quotes), 2),
+    }
+
+
+def apply(db: Session, role_id: int, hourly_rate: Optional[float] = None, only_rate: Optional[float] = None,
+          progress: Optional[Callable[[str], None]] = None) -> dict:
+    """Reprice the items; returns the preview() report of what was changed (dry_run False)."""
+    report = progress or (lambda message: None)
+    summary = preview(db, role_id, hourly_rate, only_rate)
+    new_rate = summary["hourly_rate"]
+    quote_ids: List[int] = [q["quote_id"] for q in summary["quotes"]]
+    report(f"Cotizaciones a actualizar: {len(quote_ids)} ({summary['items']} items)")
+
+    Item = models.QuoteItem
+    for start in range(0, len(quote_ids), BATCH_QUOTES):
+        batch = quote_ids[start:start + BATCH_QUOTES]
+        conditions = _item_filter(role_id, new_rate, only_rate) + [Item.quote_id.in_(batch)]
+        # Old rates for the audit log, then one UPDATE for the whole batch
+        changed = db.execute(select(Item.id, Item.quote_id, Item.hourly_rate).where(*conditions)).all()
+        db.execute(update(Item).where(*conditions).values(hourly_rate=new_rate)
+                   .execution_options(synchronize_session=False))
+        crud.recompute_quote_totals(db, batch, commit=False)
+        db.commit()
+        event_log.record_many(("item.updated", quote_id, item_id, {"hourly_rate": [old_rate, new_rate]})
+                              for item_id, quote_id, old_rate in changed)
+        summaries.mark_quotes(batch)
+        report(f"Cotizaciones actualizadas: {min(start + BATCH_QUOTES, len(quote_ids))}/{len(quote_ids)}")
+
+    return {**summary, "dry_run": False}
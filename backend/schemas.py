@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, List
+import json
+from pydantic import BaseModel, field_validator
+from typing import Optional, List, Any, Dict, Literal
 
 # Role Schemas
 class RoleBase(BaseModel):
@@ -38,6 +39,10 @@ class ProjectBase(BaseModel):
 class ProjectCreate(ProjectBase):
     pass
 
+class ProjectImport(ProjectCreate):
+    external_ref: Optional[str] = None # Rows with the same external_ref update the existing project
+    status: Literal["DRAFT", "SENT", "ACCEPTED", "REJECTED"] = "DRAFT"
+
 class Project(ProjectBase):
     id: int
     status: str
@@ -57,9 +62,18 @@ class QuoteItemBase(BaseModel):
 class QuoteItemCreate(QuoteItemBase):
     pass
 
+class QuoteItemUpsert(QuoteItemBase):
+    id: Optional[int] = None # Existing item to update; omit to insert a new row
+
+class QuoteItemsReplace(BaseModel):
+    # Full desired item list: list order becomes `sequence`, missing ids are deleted
+    items: List[QuoteItemUpsert]
+
 class ScopeGenerateRequest(BaseModel):
     requirements: str
     role_ids: List[int]
+    bypass_cache: Optional[bool] = False # Skip the LLM response cache and refresh it
+    mode: Literal["auto", "single", "chunked"] = "auto" # "chunked": map-reduce over sections (long documents)
 
 class QuoteItem(QuoteItemBase):
     id: int
@@ -81,6 +95,8 @@ class QuoteCreate(QuoteBase):
 class Quote(QuoteBase):
     id: int
     items: List[QuoteItem] = []
+    version: Optional[int] = 1
+    parent_quote_id: Optional[int] = None
     
     project_name: Optional[str] = None
     client_name: Optional[str] = None
@@ -91,3 +107,230 @@ class Quote(QuoteBase):
     
     class Config:
         from_attributes = True
+
+# Listing row for GET /quotes/ (no items, stored totals only)
+class QuoteSummary(BaseModel):
+    id: int
+    project_id: int
+    project_name: Optional[str] = None
+    client_name: Optional[str] = None
+    status: Optional[str] = None
+    applied_margin: Optional[float] = 0.0
+    applied_risk: Optional[float] = 0.0
+    applied_tax: Optional[float] = 0.0
+    total_cost: Optional[float] = 0.0
+    total_price: Optional[float] = 0.0
+
+# Quote versions
+class QuoteCloneRequest(BaseModel):
+    # Optional new percentages for the new version; omitted values are copied
+    applied_margin: Optional[float] = None
+    applied_risk: Optional[float] = None
+    applied_tax: Optional[float] = None
+
+class QuoteVersion(BaseModel):
+    id: int
+    version: Optional[int] = 1
+    parent_quote_id: Optional[int] = None
+    applied_margin: Optional[float] = 0.0
+    applied_risk: Optional[float] = 0.0
+    applied_tax: Optional[float] = 0.0
+    total_cost: Optional[float] = 0.0
+    total_price: Optional[float] = 0.0
+    class Config:
+        from_attributes = True
+
+class QuoteItemChange(BaseModel):
+    base_item_id: int
+    item_id: int
+    changes: Dict[str, List[Any]] # field -> [before, after]
+
+class QuoteDiff(BaseModel):
+    base_quote_id: int
+    other_quote_id: int
+    added: List[QuoteItem]
+    removed: List[QuoteItem]
+    changed: List[QuoteItemChange]
+    unchanged: int
+    financials: Dict[str, List[Optional[float]]]
+    total_cost: List[float] # [base, other]
+    total_price: List[float]
+
+# Batch pricing (POST /quotes/price-batch)
+class PriceScenario(BaseModel):
+    # Omitted values keep each quote's own percentage
+    margin: Optional[float] = None
+    risk: Optional[float] = None
+    tax: Optional[float] = None
+
+class PriceBatchRequest(BaseModel):
+    quote_ids: Optional[List[int]] = None # None = whole book
+    role_rates: Dict[int, float] = {} # role_id -> hourly_rate what-if override
+    scenarios: List[PriceScenario] = []
+
+class QuotePriceResult(BaseModel):
+    quote_id: int
+    total_cost: float
+    total_price: float
+    scenario_prices: List[float] = [] # One per requested scenario, same order
+
+class PriceBatchResponse(BaseModel):
+    quotes: List[QuotePriceResult]
+
+# Background jobs
+class Job(BaseModel):
+    id: str
+    kind: str
+    status: str # PENDING, RUNNING, DONE, FAILED
+    quote_id: Optional[int] = None
+    progress: List[str] = []
+    result: Optional[Any] = None
+    error: Optional[str] = None
+
+class SimilarItemsRequest(BaseModel):
+    requirements: str
+    role_ids: Optional[List[int]] = None # Only items of these roles (None = any role)
+    limit: int = 10
+
+class SimilarItem(BaseModel):
+    kind: str # "item" or "project"
+    project_id: int
+    quote_id: Optional[int] = None
+    role_id: Optional[int] = None
+    text: str
+    hours: Optional[float] = None
+    score: float
+
+class LLMCacheStats(BaseModel):
+    entries: int
+    hits: int
+    misses: int
+    evictions: int
+    hit_rate: float
+
+class AIGenerationLog(BaseModel):
+    id: int
+    quote_id: int
+    created_at: float
+    model: Optional[str] = None
+    mode: Optional[str] = None
+    source: Optional[str] = None
+    llm_calls: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    estimated_input_tokens: int = 0
+    removed_passages: int = 0
+    truncated: bool = False
+    duration_ms: Optional[float] = None
+    class Config:
+        from_attributes = True
+
+# Token totals per model over GET /ai/usage's time window
+class AIUsageSummary(BaseModel):
+    model: Optional[str] = None
+    generations: int
+    llm_calls: int
+    input_tokens: int
+    output_tokens: int
+    avg_duration_ms: float
+
+class AnalyticsRow(BaseModel):
+    key: str # Role id, client name or status
+    name: Optional[str] = None # Role name; same as key for clients and statuses
+    projects: int
+    items: int
+    hours: float
+    cost: float
+    revenue: float
+    # AI accuracy, over the items with an AI suggestion
+    ai_items: int
+    ai_hours: float
+    ai_manual_hours: float
+    ai_abs_error: float
+    ai_error_pct: Optional[float] = None # Sum|manual - ai| / Sum(manual) * 100
+    ai_bias_pct: Optional[float] = None # (Sum(ai) - Sum(manual)) / Sum(manual) * 100; < 0 = underestimates
+
+class ImportRowError(BaseModel):
+    line: int
+    error: str
+
+class ImportResult(BaseModel):
+    kind: str
+    processed: int # Data rows read
+    imported: int # Rows inserted or updated
+    failed: int
+    errors: List[ImportRowError] = [] # First IMPORT_MAX_ERRORS failures
+
+class QuoteEvent(BaseModel):
+    id: int
+    quote_id: int
+    item_id: Optional[int] = None
+    event_type: str
+    actor: Optional[str] = None
+    data: Dict[str, Any]
+    created_at: float
+    class Config:
+        from_attributes = True
+
+    @field_validator("data", mode="before")
+    @classmethod
+    def _parse_data(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+class QuoteStateItem(QuoteItemBase):
+    id: int
+
+class QuoteState(BaseModel):
+    quote_id: int
+    at: float # Requested timestamp
+    last_event_at: float
+    events_applied: int
+    applied_margin: Optional[float] = 0.0
+    applied_risk: Optional[float] = 0.0
+    applied_tax: Optional[float] = 0.0
+    items: List[QuoteStateItem] = []
+    total_cost: float
+    total_price: float
+
+class RepriceRequest(BaseModel):
+    hourly_rate: Optional[float] = None # Default: the role's current rate
+    only_rate: Optional[float] = None # Only items still at this rate (leave hand-negotiated rates alone)
+
+class RepriceQuote(BaseModel):
+    quote_id: int
+    project_id: Optional[int] = None
+    items: int
+    cost_delta: float
+    total_price: float
+    new_total_price: float
+    price_delta: float
+
+class RepriceReport(BaseModel):
+    role_id: int
+    hourly_rate: float
+    dry_run: bool
+    items: int
+    cost_delta: float
+    price_delta: float
+    quotes: List[RepriceQuote] = []
+
+class ProjectSearchHit(BaseModel):
+    id: int
+    name: Optional[str] = None
+    client_name: Optional[str] = None
+    status: Optional[str] = None
+    snippet: str # HTML-escaped, matches wrapped in <mark>
+    score: float # Higher is more relevant
+
+class ItemSearchHit(BaseModel):
+    id: int
+    quote_id: int
+    project_id: Optional[int] = None
+    project_name: Optional[str] = None
+    role_id: Optional[int] = None
+    snippet: str
+    score: float
+
+class SearchResults(BaseModel):
+    projects: List[ProjectSearchHit] = []
+    items: List[ItemSearchHit] = []
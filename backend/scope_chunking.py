@@ -0,0 +1,99 @@
+"""
+Helpers for map-reduce scope generation over long requirement documents.
+
+split_requirements() cuts a document into chunks of whole sections (headings,
+numbered clauses, paragraphs) no longer than max_chars, so each chunk can be
+estimated by its own completion. merge_tasks() is the deterministic reduce step
+used when the LLM merge pass is unavailable: it drops duplicated items and folds
+the smallest items of a role together until the scope fits in max_items.
+"""
+import re
+import unicodedata
+from typing import List
+
+# Markdown headings, numbered clauses ("3.", "3.2", "4)") and short ALL-CAPS titles
+SECTION_START = re.compile(
+    r"^\s*(#{1,6}\s|\d+(\.\d+)*[.)]?\s+\S|[A-ZÁÉÍÓÚÑ][A-ZÁÉÍÓÚÑ0-9 ,/&()-]{3,80}:?\s*$)"
+)
+
+
+def split_sections(text: str) -> List[str]:
+    sections, current = [], []
+    for line in text.splitlines():
+        if SECTION_START.match(line) and any(l.strip() for l in current):
+            sections.append("\n".join(current).strip())
+            current = []
+        current.append(line)
+    if any(l.strip() for l in current):
+        sections.append("\n".join(current).strip())
+    return sections
+
+
+def _split_oversized(section: str, max_chars: int) -> List[str]:
+    # Paragraphs first, then lines, then a hard cut for single enormous lines
+    for separator in ("\n\n", "\n"):
+        parts = [p for p in section.split(separator) if p.strip()]
+        if len(parts) > 1:
+            return _pack(parts, max_chars, separator)
+    return [section[i:i + max_chars] for i in range(0, len(section), max_chars)]
+
+
+def _pack(parts: List[str], max_chars: int, separator: str = "\n\n") -> List[str]:
+    chunks, current = [], ""
+    for part in parts:
+        if len(part) > max_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            chunks.extend(_split_oversized(part, max_chars))
+        elif current and len(current) + len(separator) + len(part) > max_chars:
+            chunks.append(current)
+            current = part
+        else:
+            current = f"{current}{separator}{part}" if current else part
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def split_requirements(text: str, max_chars: int) -> List[str]:
+    """Chunks of consecutive sections, each at most max_chars long (in document order)."""
+    text = (text or "").strip()
+    if len(text) <= max_chars:
+        return [text] if text else []
+    return _pack(split_sections(text), max_chars)
+
+
+def normalize_text(description: str) -> str:
+    """Lowercase, accent-free, alphanumerics only: the key used to spot repeated text."""
+    text = unicodedata.normalize("NFKD", description or "").encode("ascii", "ignore").decode("ascii")
+    return re.sub(r"[^a-z0-9]+", " ", text.lower()).strip()
+
+
+def merge_tasks(tasks: List[dict], max_items: int) -> List[dict]:
+    """Deduplicate [{"role_id", "description", "hours"}] and fold items per role down to max_items."""
+    merged = {}
+    for task in tasks:
+        key = (task.get("role_id"), normalize_text(task.get("description", "")))
+        hours = float(task.get("hours") or 0.0)
+        if key in merged:
+            # Same feature estimated by two sections: count it once
+            merged[key]["hours"] = max(merged[key]["hours"], hours)
+        else:
+            merged[key] = {"role_id": task.get("role_id"), "description": task.get("description", ""), "hours": hours}
+
+    items = list(merged.values())
+    while len(items) > max_items:
+        by_role = {}
+        for item in items:
+            by_role.setdefault(item["role_id"], []).append(item)
+        candidates = [group for group in by_role.values() if len(group) > 1]
+        if not candidates:
+            break
+        # Fold the two smallest items of the role whose pair is cheapest
+        group = min(candidates, key=lambda g: sum(sorted(i["hours"] for i in g)[:2]))
+        first, second = sorted(group, key=lambda i: i["hours"])[:2]
+        items.remove(second)
+        first["description"] = f"{first['description']}; {second['description']}"
+        first["hours"] += second["hours"]
+    return items
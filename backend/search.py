@@ -0,0 +1,141 @@
+"""
+Full-text search over projects (name, client, requirements) and quote item descriptions.
+
+SQLite: two FTS5 indexes, projects_fts and quote_items_fts, created by init_db().
+They are external-content tables (the text stays in projects / quote_items) kept
+in sync by triggers, so every write path — crud, bulk imports, clones made in
+SQL — is indexed without application code. Tokenizer: unicode61 with
+remove_diacritics, so "cotizacion" finds "Cotización"; prefix indexes make
+"autent" find "autenticación" without scanning the vocabulary.
+
+    search_projects(db, "portal autent")   ranked by bm25 (name > client > requirements)
+    search_items(db, "login")              ranked by bm25
+
+Every query term is matched as a prefix and all terms must match. Snippets come
+back HTML-escaped with the matches wrapped in <mark>.
+
+Other databases (PostgreSQL) fall back to an unranked ILIKE scan.
+"""
+import html
+import re
+from typing import List, Optional
+
+from sqlalchemy import and_, or_, select, text
+from sqlalchemy.orm import Session
+
+import models
+
+MAX_TERMS = 8
+SNIPPET_TOKENS = 12
+
+_TERM = re.compile(r"\w+")
+_OPEN, _CLOSE = "\x02", "\x03" # Match markers, replaced after escaping the snippet
+
+_TOKENIZE = "tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'"
+# index: (content table, columns, bm25 column weights)
+_INDEXES = {
+    "projects_fts": ("projects", ("name", "client_name", "raw_requirements"), (10.0, 5.0, 1.0)),
+    "quote_items_fts": ("quote_items", ("description",), None),
+}
+
+
+def _schema(fts: str, table: str, columns) -> List[str]:
+    cols = ", ".join(columns)
+    new = ", ".join(f"new.{c}" for c in columns)
+    old = ", ".join(f"old.{c}" for c in columns)
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert_new = f"INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        # Only text changes touch the index (status or hours updates don't)
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def install(bind) -> List[str]:
+    """Create the FTS indexes and their triggers if missing. Returns the indexes (re)built from their table."""
+    if bind.dialect.name != "sqlite":
+        return []
+    rebuilt = []
+    with bind.begin() as conn:
+        existing = set(conn.scalars(text("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger')")))
+        for fts, (table, columns, weights) in _INDEXES.items():
+            if fts in existing and all(f"{fts}_{suffix}" in existing for suffix in ("ai", "ad", "au")):
+                continue
+            conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                              f"{', '.join(columns)}, content='{table}', content_rowid='id', {_TOKENIZE})"))
+            for statement in _schema(fts, table, columns):
+                conn.execute(text(statement))
+            if weights:
+                # Stored as the index's ranking, so ORDER BY rank (sorted inside FTS5) applies them
+                conn.execute(text(f"INSERT INTO {fts}({fts}, rank) VALUES ('rank', 'bm25({', '.join(map(str, weights))})')"))
+            # New index, or the table was written without triggers: index what is there now
+            conn.execute(text(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')"))
+            rebuilt.append(fts)
+    return rebuilt
+
+
+def match_expression(query: str) -> Optional[str]:
+    """FTS5 query for user input: every word as a quoted prefix, all required. None if there are no words."""
+    terms = _TERM.findall(query or "")[:MAX_TERMS]
+    if not terms:
+        return None
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def _snippet(raw: Optional[str]) -> str:
+    return html.escape(raw or "").replace(_OPEN, "<mark>").replace(_CLOSE, "</mark>")
+
+
+def _like_filters(query: str, columns):
+    terms = _TERM.findall(query or "")[:MAX_TERMS]
+    return and_(*(or_(*(column.ilike(f"%{term}%") for column in columns)) for term in terms))
+
+
+def search_projects(db: Session, query: str, limit: int = 20) -> List[dict]:
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    if db.get_bind().dialect.name != "sqlite":
+        Project = models.Project
+        rows = db.execute(select(Project).where(_like_filters(query, (Project.name, Project.client_name,
+                                                                      Project.raw_requirements)))
+                          .order_by(Project.id.desc()).limit(limit)).scalars()
+        return [{"id": p.id, "name": p.name, "client_name": p.client_name, "status": p.status,
+                 "snippet": html.escape((p.raw_requirements or "")[:200]), "score": 0.0} for p in rows]
+
+    # Rank and cut inside FTS5 first: snippets and joins only for the rows returned
+    rows = db.execute(text(
+        "SELECT p.id, p.name, p.client_name, p.status, f.snippet, f.rank FROM ("
+        f"  SELECT rowid, rank, snippet(projects_fts, -1, :open, :close, '…', {SNIPPET_TOKENS}) AS snippet"
+        "   FROM projects_fts WHERE projects_fts MATCH :expression ORDER BY rank LIMIT :limit"
+        ") f JOIN projects p ON p.id = f.rowid ORDER BY f.rank"
+    ), {"expression": expression, "open": _OPEN, "close": _CLOSE, "limit": limit})
+    return [{"id": r.id, "name": r.name, "client_name": r.client_name, "status": r.status,
+             "snippet": _snippet(r.snippet), "score": -r.rank} for r in rows]
+
+
+def search_items(db: Session, query: str, limit: int = 20) -> List[dict]:
+    expression = match_expression(query)
+    if expression is None:
+        return []
+    if db.get_bind().dialect.name != "sqlite":
+        Item, Quote, Project = models.QuoteItem, models.Quote, models.Project
+        rows = db.execute(
+            select(Item.id, Item.quote_id, Item.role_id, Item.description, Quote.project_id, Project.name)
+            .join(Quote, Quote.id == Item.quote_id).join(Project, Project.id == Quote.project_id)
+            .where(_like_filters(query, (Item.description,))).order_by(Item.id.desc()).limit(limit)
+        )
+        return [{"id": r.id, "quote_id": r.quote_id, "project_id": r.project_id, "project_name": r.name,
+                 "role_id": r.role_id, "snippet": html.escape(r.description or ""), "score": 0.0} for r in rows]
+
+    rows = db.execute(text(
+        "SELECT i.id, i.quote_id, i.role_id, q.project_id, p.name AS project_name, f.snippet, f.rank FROM ("
+        f"  SELECT rowid, rank, snippet(quote_items_fts, 0, :open, :close, '…', {SNIPPET_TOKENS}) AS snippet"
+        "   FROM quote_items_fts WHERE quote_items_fts MATCH :expression ORDER BY rank LIMIT :limit"
+        ") f JOIN quote_items i ON i.id = f.rowid "
+        "JOIN quotes q ON q.id = i.quote_id LEFT JOIN projects p ON p.id = q.project_id ORDER BY f.rank"
+    ), {"expression": expression, "open": _OPEN, "close": _CLOSE, "limit": limit})
+    return [{"id": r.id, "quote_id": r.quote_id, "project_id": r.project_id, "project_name": r.project_name,
+             "role_id": r.role_id, "snippet": _snippet(r.snippet), "score": -r.rank} for r in rows]
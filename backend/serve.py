@@ -0,0 +1,49 @@
+"""
+Production launcher: several uvicorn worker processes sharing one port.
+
+    python serve.py                          # WEB_CONCURRENCY workers (default: CPU count)
+    python serve.py --workers 4 --port 8000
+
+The schema is created/upgraded once here, before any worker starts, and the
+workers skip it (DB_INIT_ON_STARTUP=0) so they never race on ALTER TABLE.
+State that must be consistent across workers lives in the database (LLM cache,
+idempotency keys), in shared files (similarity index, export cache) or in the
+cache backend (CACHE_URL): use redis:// when running more than one worker.
+"""
+import argparse
+import os
+import sys
+
+import uvicorn
+
+from cache_backend import cache_backend
+from database import SQLALCHEMY_DATABASE_URL, init_db
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Cotizador IA API with several workers")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))))
+    parser.add_argument("--log-level", default=os.getenv("LOG_LEVEL", "info"))
+    parser.add_argument("--graceful-timeout", type=int, default=30,
+                        help="Seconds to let in-flight requests finish on shutdown")
+    args = parser.parse_args(argv)
+
+    added = init_db()
+    print(f"Schema ready ({len(added)} column(s) added)")
+    os.environ["DB_INIT_ON_STARTUP"] = "0" # Inherited by the worker processes
+
+    if args.workers > 1 and not cache_backend.shared:
+        print("WARNING: CACHE_URL is local://; role/config changes and job status are not shared between workers")
+    if args.workers > 1 and SQLALCHEMY_DATABASE_URL.startswith("sqlite") and os.getenv("DB_PROFILE") == "legacy":
+        print("WARNING: several workers on SQLite without WAL (DB_PROFILE=legacy) will hit 'database is locked'")
+
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level=args.log_level,
+                app_dir=os.path.dirname(os.path.abspath(__file__)), proxy_headers=True,
+                timeout_graceful_shutdown=args.graceful_timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
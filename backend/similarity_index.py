@@ -0,0 +1,229 @@
+"""
+Similarity index over finalized work: past quote item descriptions (with their
+hours and role) and project requirements.
+
+TF-IDF over accent-insensitive Spanish word unigrams + bigrams, with an inverted
+index so a query only touches documents that share a term with it. The index is
+an append-only JSONL file (SIMILARITY_INDEX_PATH): finalizing a project appends
+its documents, re-finalizing appends a tombstone plus the new version, and
+rebuild() rewrites the file from the database. Every read first applies the
+lines appended since the last one, so several worker processes sharing the
+file see each other's updates.
+
+AIService uses it two ways: the nearest past items become few-shot examples in
+the prompt, and requirements that almost exactly match a finalized project
+(score >= AI_REUSE_THRESHOLD) reuse that project's items without calling the LLM.
+"""
+import json
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy.orm import Session
+
+import models
+
+INDEX_PATH = os.getenv("SIMILARITY_INDEX_PATH", "./similarity_index.jsonl")
+
+STOPWORDS = set("""
+a al algo como con de del desde donde el ella en entre era es esta este esto estos for la las lo los mas mediante
+muy no o para pero por que se segun ser si sin sobre su sus tambien the to un una uno unos y ya and of
+""".split())
+
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "").encode("ascii", "ignore").decode("ascii")
+    return text.lower()
+
+
+def _stem(word: str) -> str:
+    # Plural folding is enough for short functional descriptions ("reportes" ~ "reporte")
+    if len(word) > 4 and word.endswith("es"):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s"):
+        return word[:-1]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    words = [_stem(w) for w in re.findall(r"[a-z0-9]+", _fold(text)) if len(w) > 2 and w not in STOPWORDS]
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class SimilarityIndex:
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.docs: List[Optional[dict]] = []  # None = removed
+        self.postings: Dict[str, Dict[int, int]] = {}  # term -> {doc index: term count}
+        self.by_project: Dict[int, List[int]] = {}
+        self._live = 0
+        self._norms: Dict[int, float] = {}
+        self._offset = 0 # Bytes of the file already applied
+        self._file_id = None # (inode, device): changes when rebuild() replaces the file
+
+    # --- Storage ---
+
+    def _sync(self):
+        """Apply the records appended to the file since the last call (by any process)."""
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                if self._offset:
+                    self._reset() # Cleared by another process
+                return
+            if (stat.st_ino, stat.st_dev) != self._file_id or stat.st_size < self._offset:
+                self._reset()
+                self._file_id = (stat.st_ino, stat.st_dev)
+            if stat.st_size == self._offset:
+                return
+            with open(self.path, "rb") as f:
+                f.seek(self._offset)
+                data = f.read(stat.st_size - self._offset)
+            end = data.rfind(b"\n") + 1 # A trailing partial line is still being written
+            for line in data[:end].decode("utf-8").splitlines():
+                if line.strip():
+                    self._apply(json.loads(line))
+            self._offset += end
+
+    def _append(self, records: Iterable[dict]):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+        # One O_APPEND write, so lines from concurrent writers never interleave
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, data)
+        finally:
+            os.close(fd)
+
+    def _apply(self, record: dict):
+        if "remove_project" in record:
+            for idx in self.by_project.pop(record["remove_project"], []):
+                doc = self.docs[idx]
+                for term in doc["terms"]:
+                    self.postings[term].pop(idx, None)
+                    if not self.postings[term]:
+                        del self.postings[term]
+                self.docs[idx] = None
+                self._live -= 1
+        else:
+            idx = len(self.docs)
+            doc = dict(record, terms=Counter(tokenize(record["text"])))
+            self.docs.append(doc)
+            for term, count in doc["terms"].items():
+                self.postings.setdefault(term, {})[idx] = count
+            self.by_project.setdefault(record["project_id"], []).append(idx)
+            self._live += 1
+        self._norms.clear() # idf changed
+
+    # --- Updates ---
+
+    @staticmethod
+    def project_records(db: Session, project: models.Project) -> List[dict]:
+        """Documents for a project: its requirements plus the items of its latest quote."""
+        quote = (db.query(models.Quote).filter(models.Quote.project_id == project.id)
+                 .order_by(models.Quote.id.desc()).first())
+        records = []
+        if project.raw_requirements:
+            records.append({"kind": "project", "project_id": project.id, "quote_id": quote.id if quote else None,
+                            "text": project.raw_requirements})
+        for item in (quote.items if quote else []):
+            if item.description:
+                records.append({"kind": "item", "project_id": project.id, "quote_id": quote.id, "role_id": item.role_id,
+                                "text": item.description, "hours": item.manual_hours or 0.0})
+        return records
+
+    def add_project(self, db: Session, project_id: int) -> int:
+        """Index (or re-index) a finalized project. Returns the number of documents added."""
+        project = db.get(models.Project, project_id)
+        if project is None:
+            return 0
+        records = self.project_records(db, project)
+        with self._lock:
+            # Always tombstone first: another worker may have indexed this project already
+            self._append([{"remove_project": project_id}] + records)
+            self._sync()
+        return len(records)
+
+    def rebuild(self, db: Session, statuses=("SENT", "ACCEPTED")) -> int:
+        """Rewrite the index from every project in the given statuses. Returns the document count."""
+        records = []
+        for project in db.query(models.Project).filter(models.Project.status.in_(statuses)).order_by(models.Project.id):
+            records.extend(self.project_records(db, project))
+        with self._lock:
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for record in records:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            os.replace(tmp, self.path)
+            self._reset()
+            self._sync()
+        return len(records)
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            self._reset()
+
+    # --- Queries ---
+
+    def _idf(self, term: str) -> float:
+        return math.log((1 + self._live) / (1 + len(self.postings.get(term, ())))) + 1.0
+
+    def _norm(self, idx: int) -> float:
+        norm = self._norms.get(idx)
+        if norm is None:
+            terms = self.docs[idx]["terms"]
+            norm = math.sqrt(sum(((1 + math.log(c)) * self._idf(t)) ** 2 for t, c in terms.items())) or 1.0
+            self._norms[idx] = norm
+        return norm
+
+    def search(self, text: str, kind: Optional[str] = None, role_ids: Optional[Iterable[int]] = None,
+               limit: int = 5, min_score: float = 0.1) -> List[dict]:
+        """Nearest documents by cosine similarity, best first, as dicts with a "score" key."""
+        self._sync()
+        query = Counter(tokenize(text))
+        roles = set(role_ids) if role_ids is not None else None
+        with self._lock:
+            weights = {t: (1 + math.log(c)) * self._idf(t) for t, c in query.items() if t in self.postings}
+            query_norm = math.sqrt(sum(((1 + math.log(c)) * self._idf(t)) ** 2 for t, c in query.items())) or 1.0
+            scores: Dict[int, float] = {}
+            for term, weight in weights.items():
+                idf = self._idf(term)
+                for idx, count in self.postings[term].items():
+                    scores[idx] = scores.get(idx, 0.0) + weight * (1 + math.log(count)) * idf
+
+            results = []
+            for idx, dot in scores.items():
+                doc = self.docs[idx]
+                if (kind and doc["kind"] != kind) or (roles is not None and doc.get("role_id") not in roles):
+                    continue
+                score = dot / (query_norm * self._norm(idx))
+                if score >= min_score:
+                    results.append((score, idx))
+            results.sort(key=lambda r: (-r[0], r[1]))
+            return [{**{k: v for k, v in self.docs[idx].items() if k != "terms"}, "score": round(min(score, 1.0), 4)}
+                    for score, idx in results[:limit]]
+
+    def project_items(self, project_id: int) -> List[dict]:
+        self._sync()
+        with self._lock:
+            return [{k: v for k, v in self.docs[idx].items() if k != "terms"}
+                    for idx in self.by_project.get(project_id, []) if self.docs[idx]["kind"] == "item"]
+
+    def stats(self) -> dict:
+        self._sync()
+        return {"documents": self._live, "projects": len(self.by_project), "terms": len(self.postings)}
+
+
+similarity_index = SimilarityIndex()
@@ -0,0 +1,93 @@
+import analytics
+import crud
+from database import SessionLocal, count_queries
+
+
+def _item(role_id, hours, rate, ai=0.0):
+    return {"role_id": role_id, "description": "Tarea", "manual_hours": hours, "hourly_rate": rate, "ai_suggested_hours": ai}
+
+
+def _rows(client, dimension):
+    return {row["key"]: row for row in client.get(f"/analytics/{dimension}").json()}
+
+
+def test_summaries_follow_item_and_status_changes(client, seeded_quote):
+    quote_id, project_id = seeded_quote["quote_id"], seeded_quote["project_id"]
+    backend_id, qa_id = seeded_quote["role_ids"]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(backend_id, 12.0, 50.0, ai=10.0))
+    item = client.post(f"/quotes/{quote_id}/items/", json=_item(qa_id, 5.0, 40.0)).json()
+
+    # Writes only mark the quote: the summaries are refreshed outside the request
+    with count_queries() as q:
+        client.put(f"/quotes/items/{item['id']}", json=_item(qa_id, 8.0, 40.0))
+    assert not any("analytics" in statement for statement in q.statements)
+
+    roles = _rows(client, "roles")
+    assert roles[str(backend_id)]["name"] == "Backend Developer"
+    assert (roles[str(backend_id)]["hours"], roles[str(backend_id)]["cost"]) == (12.0, 600.0)
+    assert roles[str(qa_id)]["hours"] == 8.0 and roles[str(qa_id)]["ai_error_pct"] is None
+    assert roles[str(backend_id)]["ai_error_pct"] == 16.67 and roles[str(backend_id)]["ai_bias_pct"] == -16.67
+
+    quote = client.get(f"/quotes/{quote_id}").json()
+    overview = client.get("/analytics/overview").json()
+    assert (overview["projects"], overview["items"], overview["hours"]) == (1, 2, 20.0)
+    assert overview["revenue"] == quote["total_price"]
+    assert round(sum(r["revenue"] for r in roles.values()), 2) == quote["total_price"]
+    assert _rows(client, "clients")["ACME"]["revenue"] == quote["total_price"]
+
+    client.post(f"/projects/{project_id}/finalize")
+    statuses = _rows(client, "statuses")
+    assert list(statuses) == ["SENT"] and statuses["SENT"]["hours"] == 20.0
+
+    client.delete(f"/quotes/items/{item['id']}")
+    assert str(qa_id) not in _rows(client, "roles")
+    assert client.get("/analytics/nope").status_code == 404
+
+
+def test_projects_count_through_their_latest_version(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, 10.0, 50.0))
+    clone = client.post(f"/quotes/{quote_id}/versions", json={"applied_margin": 0.5}).json()
+
+    overview = client.get("/analytics/overview").json()
+    assert (overview["projects"], overview["hours"]) == (1, 10.0) # Not counted twice
+    assert overview["revenue"] == clone["total_price"]
+
+    client.post("/projects/", json={"name": "Sin cotizar", "client_name": "Globex"})
+    clients = _rows(client, "clients")
+    assert clients["Globex"]["projects"] == 1 and clients["Globex"]["revenue"] == 0.0
+
+
+def test_rebuild_matches_incremental_state(client, seeded_quote):
+    quote_id, role_ids = seeded_quote["quote_id"], seeded_quote["role_ids"]
+    client.put(f"/quotes/{quote_id}/items", json={"items": [_item(role_ids[0], 7.0, 50.0, ai=6.0),
+                                                            _item(role_ids[1], 3.5, 40.0, ai=4.0)]})
+    with SessionLocal() as db:
+        crud.update_quote_financials(db, quote_id, margin=0.3, risk=0.1, tax=0.16)
+    incremental = {d: _rows(client, d) for d in ("roles", "clients", "statuses")}
+
+    with SessionLocal() as db:
+        assert analytics.rebuild(db) == 1
+    assert {d: _rows(client, d) for d in ("roles", "clients", "statuses")} == incremental
+
+
+def test_refresher_falls_back_to_rebuild_when_too_far_behind(client, seeded_quote):
+    state = {"broken": True}
+
+    def session_factory():
+        if state["broken"]:
+            raise RuntimeError("database is locked")
+        return SessionLocal()
+
+    refresher = analytics.SummaryRefresher(enabled=True, refresh_seconds=60, max_pending=2,
+                                           session_factory=session_factory)
+    refresher.mark_quotes([seeded_quote["quote_id"]])
+    assert refresher.flush() == 0 and refresher.pending == 1 # Kept for retry
+    refresher.mark_projects([seeded_quote["project_id"], 99])
+    assert refresher.pending == 1 # Over max_pending: ids dropped, a full rebuild is pending
+
+    state["broken"] = False
+    assert refresher.flush() == 1 and refresher.pending == 0
+    with SessionLocal() as db:
+        assert analytics.overview(db)["projects"] == 1
+    refresher.stop()
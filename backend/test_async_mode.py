@@ -0,0 +1,74 @@
+import asyncio
+import time
+
+import pytest
+from openai import AsyncOpenAI
+
+import database
+from fake_openai_server import FakeOpenAIServer
+from llm_client import LLMUnavailableError, ResilientLLM
+
+MESSAGES = [{"role": "user", "content": "hola"}]
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(items=[{"role_id": 1, "description": "API", "hours": 8.0}]) as fake:
+        yield fake
+
+
+def _llm(server, models=("primary",), **kwargs):
+    async_client = AsyncOpenAI(api_key="test-key", base_url=server.base_url, max_retries=0)
+    return ResilientLLM(None, models=list(models), async_client=async_client, **kwargs)
+
+
+def test_async_url():
+    assert database.async_url("sqlite:///./sql_app.db") == "sqlite+aiosqlite:///./sql_app.db"
+    assert database.async_url("postgresql+psycopg2://u:p@db/app") == "postgresql+asyncpg://u:p@db/app"
+    with pytest.raises(ValueError):
+        database.async_url("mysql://u:p@db/app")
+
+
+def test_acreate_retries_and_falls_back(server):
+    server.model_faults = {"primary": 503}
+    llm = _llm(server, models=("primary", "alternate"), max_retries=1, backoff_base=0.01)
+    model, response = asyncio.run(llm.acreate(messages=MESSAGES))
+    assert model == "alternate" and "API" in response.choices[0].message.content
+    assert [r["model"] for r in server.requests] == ["primary", "primary", "alternate"]
+
+    server.model_faults = {"primary": 503, "alternate": 503}
+    with pytest.raises(LLMUnavailableError):
+        asyncio.run(_llm(server, models=("primary", "alternate"), max_retries=0).acreate(messages=MESSAGES))
+
+
+def test_acreate_calls_overlap_on_one_thread(server):
+    # Eight 0.3 s completions awaited together take about one completion's time
+    server.delay = 0.3
+    llm = _llm(server)
+
+    async def burst():
+        return await asyncio.gather(*(llm.acreate(messages=MESSAGES) for _ in range(8)))
+
+    started = time.perf_counter()
+    results = asyncio.run(burst())
+    assert len(results) == 8
+    assert time.perf_counter() - started < 1.5
+
+
+def test_async_endpoints_match_sync(client, fake_llm, seeded_quote, monkeypatch):
+    import async_api
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    quote_id, role_ids = seeded_quote["quote_id"], seeded_quote["role_ids"]
+    fake_llm.items = [{"role_id": role_ids[0], "description": "Login", "hours": 8.0}]
+    app = FastAPI()
+    app.include_router(async_api.router)
+    with TestClient(app) as async_client:
+        items = async_client.post(f"/quotes/{quote_id}/generate-scope",
+                                  json={"requirements": "Login y reportes", "role_ids": role_ids}).json()
+        assert items and all(i["quote_id"] == quote_id for i in items)
+        assert async_client.get(f"/quotes/{quote_id}").json() == client.get(f"/quotes/{quote_id}").json()
+        assert async_client.get("/quotes/999999").status_code == 404
+    asyncio.run(database.dispose_async_engine())
+    assert client.get(f"/quotes/{quote_id}/ai-generations").json()[0]["source"] == "llm"
@@ -0,0 +1,89 @@
+import time
+
+import audit_log
+import crud
+from database import SessionLocal, count_queries
+
+
+def _item(role_id, hours=8.0, rate=50.0):
+    return {"role_id": role_id, "description": "API de login", "manual_hours": hours, "hourly_rate": rate}
+
+
+def test_item_changes_are_logged_with_actor(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    item_id = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id)).json()["id"]
+
+    # The write itself does not touch the event table: events are flushed in batches
+    with count_queries() as q:
+        client.put(f"/quotes/items/{item_id}", json=_item(role_id, hours=12.0), headers={"X-User": "ana"})
+    assert not any("quote_events" in statement for statement in q.statements)
+    assert audit_log.event_log.pending > 0
+
+    client.delete(f"/quotes/items/{item_id}", headers={"X-User": "luis"})
+    events = client.get(f"/quotes/{quote_id}/events").json()
+    assert [e["event_type"] for e in events] == ["quote.created", "item.created", "item.updated", "item.deleted"]
+    updated = events[2]
+    assert updated["actor"] == "ana" and updated["item_id"] == item_id
+    assert updated["data"] == {"manual_hours": [8.0, 12.0]}
+    assert events[3]["actor"] == "luis" and events[3]["data"]["manual_hours"] == 12.0
+
+
+def test_replay_rebuilds_past_state(client, seeded_quote):
+    quote_id, role_ids = seeded_quote["quote_id"], seeded_quote["role_ids"]
+    first = client.post(f"/quotes/{quote_id}/items/", json=_item(role_ids[0], hours=10.0)).json()
+    time.sleep(0.01)
+    before = time.time()
+    time.sleep(0.01)
+
+    client.put(f"/quotes/{quote_id}/items", json={"items": [
+        {**_item(role_ids[0], hours=20.0), "id": first["id"]},
+        _item(role_ids[1], hours=5.0, rate=40.0),
+    ]})
+    with SessionLocal() as db:
+        crud.update_quote_financials(db, quote_id, margin=0.3, risk=0.1, tax=0.16)
+
+    past = client.get(f"/quotes/{quote_id}/state", params={"at": before}).json()
+    assert [(i["id"], i["manual_hours"]) for i in past["items"]] == [(first["id"], 10.0)]
+    assert past["applied_margin"] == 0.2 and past["total_cost"] == 500.0
+
+    now = client.get(f"/quotes/{quote_id}/state").json()
+    current = client.get(f"/quotes/{quote_id}").json()
+    assert len(now["items"]) == 2 and now["applied_margin"] == 0.3
+    assert (now["total_cost"], now["total_price"]) == (current["total_cost"], current["total_price"])
+
+    assert client.get(f"/quotes/{quote_id}/state", params={"at": 0}).status_code == 404
+
+
+def test_bulk_created_events_match_their_items(client, seeded_quote):
+    quote_id, role_ids = seeded_quote["quote_id"], seeded_quote["role_ids"]
+    client.put(f"/quotes/{quote_id}/items", json={"items": [
+        _item(role_ids[n % 2], hours=float(n + 1)) for n in range(6)
+    ]})
+    items = {i["id"]: i["manual_hours"] for i in client.get(f"/quotes/{quote_id}").json()["items"]}
+
+    created = [e for e in client.get(f"/quotes/{quote_id}/events").json() if e["event_type"] == "item.created"]
+    assert {e["item_id"]: e["data"]["manual_hours"] for e in created} == items
+
+
+def test_events_are_paginated(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id))
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id))
+
+    page = client.get(f"/quotes/{quote_id}/events", params={"limit": 2})
+    rest = client.get(f"/quotes/{quote_id}/events", params={"limit": 2, "cursor": page.headers["x-next-cursor"]})
+    ids = [e["id"] for e in page.json() + rest.json()]
+    assert len(ids) == 3 and ids == sorted(ids) and "x-next-cursor" not in rest.headers
+
+
+def test_failed_flush_keeps_events():
+    def broken_session():
+        raise RuntimeError("database is locked")
+
+    log = audit_log.AuditLog(enabled=True, flush_seconds=60, max_buffer=3, session_factory=broken_session)
+    log.record_many(("item.updated", 1, n, {"manual_hours": [n, n + 1]}) for n in range(2))
+    assert log.flush() == 0 and log.pending == 2
+    log.record("item.deleted", 1, 5)
+    log.record("item.deleted", 1, 6) # Over max_buffer: flushed inline, fails, the oldest is dropped
+    assert log.pending == 3
+    log.stop()
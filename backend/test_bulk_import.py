@@ -0,0 +1,53 @@
+import io
+import json
+import time
+
+import bulk_import
+from database import SessionLocal
+import models
+
+
+def test_csv_roles_upsert_by_name(client):
+    client.post("/roles/", json={"name": "QA Engineer", "hourly_rate": 40})
+    client.get("/roles/") # Warm the reference cache
+
+    body = "\ufeffname,hourly_rate\nQA Engineer,45\nDevOps,60\nDevOps,65\n,10\nArquitecto,abc\n"
+    resp = client.post("/import/roles", content=body.encode("utf-8"), headers={"Content-Type": "text/csv"})
+    assert resp.status_code == 200
+    result = resp.json()
+    assert (result["processed"], result["imported"], result["failed"]) == (5, 2, 2)
+    assert [e["line"] for e in result["errors"]] == [5, 6]
+
+    rates = {r["name"]: r["hourly_rate"] for r in client.get("/roles/").json()}
+    assert rates == {"QA Engineer": 45, "DevOps": 65} # Last duplicate wins; cache was invalidated
+
+
+def test_jsonl_projects_upsert_by_external_ref(client):
+    lines = [
+        {"external_ref": "CRM-1", "name": "Portal", "client_name": "ACME", "raw_requirements": "Login"},
+        {"name": "Sin referencia", "client_name": "ACME"},
+    ]
+    payload = "\n".join(json.dumps(line) for line in lines) + "\n{roto\n"
+    resp = client.post("/import/projects?format=jsonl", content=payload)
+    assert resp.json()["imported"] == 2 and resp.json()["errors"][0]["line"] == 3
+
+    lines[0]["status"] = "SENT"
+    lines[0]["name"] = "Portal v2"
+    client.post("/import/projects", content="\n".join(json.dumps(line) for line in lines),
+                headers={"Content-Type": "application/x-ndjson"})
+    with SessionLocal() as db:
+        projects = db.query(models.Project).order_by(models.Project.id).all()
+    assert [(p.name, p.status, p.external_ref) for p in projects] == [
+        ("Portal v2", "SENT", "CRM-1"), ("Sin referencia", "DRAFT", None), ("Sin referencia", "DRAFT", None),
+    ]
+
+
+def test_large_import_is_batched(client):
+    rows = "".join(f"cfg_{i},,{i}\n" for i in range(20000))
+    stream = io.BytesIO(("key,value_text,value_float\n" + rows).encode("utf-8"))
+    start = time.perf_counter()
+    with SessionLocal() as db:
+        result = bulk_import.import_file(db, "configs", stream, "csv", batch_size=5000)
+        assert db.query(models.SystemConfig).count() == 20000
+    assert result.imported == 20000 and result.failed == 0
+    assert time.perf_counter() - start < 10
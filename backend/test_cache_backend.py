@@ -0,0 +1,71 @@
+import time
+
+import pytest
+
+import models
+from cache_backend import CacheBackend, LocalCache, build_backend
+from jobs import JobManager
+from reference_cache import ReferenceCache
+from similarity_index import SimilarityIndex
+
+
+def test_backend_must_implement_every_method():
+    class Partial(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        Partial()
+
+
+def test_local_cache():
+    cache = LocalCache()
+    assert cache.get("a") is None
+    cache.set("a", "1", ttl=0.05)
+    assert cache.get("a") == "1"
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.incr("n") == 1 and cache.incr("n") == 2
+    cache.delete("n")
+    assert cache.get("n") is None
+    with pytest.raises(ValueError):
+        build_backend("memcached://x")
+
+
+def test_role_write_in_one_worker_invalidates_the_others(client):
+    from database import SessionLocal
+
+    shared = LocalCache() # Stands in for Redis shared by two worker processes
+    worker_a, worker_b = ReferenceCache(shared), ReferenceCache(shared)
+    client.post("/roles/", json={"name": "Backend", "hourly_rate": 50.0})
+    with SessionLocal() as db:
+        assert [r.hourly_rate for r in worker_b.roles(db)] == [50.0]
+        db.query(models.Role).update({"hourly_rate": 60.0})
+        db.commit()
+        assert [r.hourly_rate for r in worker_b.roles(db)] == [50.0] # Still cached
+        worker_a.invalidate_roles()
+        assert [r.hourly_rate for r in worker_b.roles(db)] == [60.0]
+
+
+def test_job_status_is_visible_from_other_workers():
+    shared = LocalCache()
+    owner, other = JobManager(max_workers=1, backend=shared), JobManager(max_workers=1, backend=shared)
+    job = owner.submit("test", lambda job: {"ok": True})
+    job.future.result(timeout=5)
+    snapshot = other.snapshot(job.id)
+    assert snapshot.status == "DONE" and snapshot.result == {"ok": True}
+    assert other.snapshot("missing") is None
+
+
+def test_similarity_index_follows_appends_from_other_workers(tmp_path):
+    path = str(tmp_path / "index.jsonl")
+    writer, reader = SimilarityIndex(path), SimilarityIndex(path)
+    assert reader.stats()["documents"] == 0
+
+    record = {"kind": "item", "project_id": 1, "quote_id": 1, "role_id": 1, "text": "Login con OAuth", "hours": 8.0}
+    writer._append([{"remove_project": 1}, record])
+    assert [r["text"] for r in reader.search("login oauth")] == ["Login con OAuth"]
+
+    writer._append([{"remove_project": 1}, dict(record, text="Reporte de ventas")])
+    assert reader.stats()["documents"] == 1
+    assert reader.search("login oauth") == []
@@ -0,0 +1,66 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+
+import database
+
+
+def _pragma(engine, name):
+    with engine.connect() as conn:
+        return conn.execute(text(f"PRAGMA {name}")).scalar()
+
+
+def test_sqlite_profile_enables_wal_and_pragmas(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'tuned.db'}", "sqlite")
+    try:
+        assert _pragma(engine, "journal_mode") == "wal"
+        assert _pragma(engine, "synchronous") == 1  # NORMAL
+        assert _pragma(engine, "busy_timeout") == database.DB_BUSY_TIMEOUT_MS
+        assert _pragma(engine, "mmap_size") == database.DB_MMAP_SIZE
+        assert _pragma(engine, "foreign_keys") == 1
+        assert isinstance(engine.pool, QueuePool)
+        assert engine.pool.size() == database.DB_POOL_SIZE
+    finally:
+        engine.dispose()
+
+
+def test_legacy_profile_is_untuned(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'legacy.db'}", "legacy")
+    try:
+        assert _pragma(engine, "journal_mode") == "delete"
+        assert _pragma(engine, "foreign_keys") == 1  # Integrity is not a tuning knob
+    finally:
+        engine.dispose()
+
+
+def test_importing_the_app_does_not_touch_the_database(tmp_path):
+    db_file = tmp_path / "untouched.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_file}"}
+    subprocess.run([sys.executable, "-c", "import main"], cwd=os.path.dirname(database.__file__), env=env, check=True)
+    assert not db_file.exists()
+
+
+def test_init_db_creates_schema(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    try:
+        database.init_db(engine)
+        assert {"roles", "projects", "quotes", "quote_items"} <= set(inspect(engine).get_table_names())
+        assert database.init_db(engine) == []  # idempotent
+    finally:
+        engine.dispose()
+
+
+def test_foreign_keys_are_enforced(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'fk.db'}")
+    try:
+        database.init_db(engine)
+        with pytest.raises(IntegrityError):
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO quotes (project_id, version) VALUES (999, 1)"))
+    finally:
+        engine.dispose()
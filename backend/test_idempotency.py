@@ -0,0 +1,64 @@
+import idempotency
+from database import SessionLocal
+
+
+def _item(role_id, hours=8.0):
+    return {"role_id": role_id, "description": "API de login", "manual_hours": hours, "hourly_rate": 50.0}
+
+
+def test_retried_post_creates_one_item(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    headers = {"Idempotency-Key": "add-login-1"}
+
+    first = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers=headers)
+    retry = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers=headers)
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true" and "idempotent-replayed" not in first.headers
+    assert len(client.get(f"/quotes/{quote_id}").json()["items"]) == 1
+
+    # Without a key (or with a new one) the write runs again
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id))
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers={"Idempotency-Key": "add-login-2"})
+    assert len(client.get(f"/quotes/{quote_id}").json()["items"]) == 3
+
+
+def test_key_reused_for_another_request(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    headers = {"Idempotency-Key": "k1"}
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers=headers)
+    resp = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, hours=9.0), headers=headers)
+    assert resp.status_code == 422
+
+
+def test_concurrent_retry_gets_409_and_abandoned_claim_is_taken_over(client, seeded_quote, monkeypatch):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    # Simulate another worker still running the first attempt
+    body = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id)).request.content
+    request_hash = idempotency.fingerprint("POST", f"/quotes/{quote_id}/items/", "", body)
+    with SessionLocal() as db:
+        assert idempotency.claim(db, "busy", request_hash)[0] == idempotency.ACQUIRED
+
+    resp = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers={"Idempotency-Key": "busy"})
+    assert resp.status_code == 409
+
+    monkeypatch.setattr(idempotency, "LOCK_SECONDS", -1)
+    resp = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers={"Idempotency-Key": "busy"})
+    assert resp.status_code == 200 and "idempotent-replayed" not in resp.headers
+
+
+def test_expired_keys_are_purged(client, seeded_quote, monkeypatch):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id), headers={"Idempotency-Key": "old"})
+    monkeypatch.setattr(idempotency, "TTL_SECONDS", -1)
+    with SessionLocal() as db:
+        assert idempotency.purge_expired(db) == 1
+
+
+def test_large_bodies_are_not_buffered_for_a_key(client, monkeypatch):
+    monkeypatch.setattr(idempotency, "MAX_BODY_BYTES", 64)
+    body = "name,hourly_rate\n" + "".join(f"Rol {n},{n}\n" for n in range(20))
+    resp = client.post("/import/roles", content=body, headers={"Idempotency-Key": "big", "Content-Type": "text/csv"})
+    assert resp.status_code == 413
+    # Without a key the upload streams as usual
+    assert client.post("/import/roles", content=body, headers={"Content-Type": "text/csv"}).json()["imported"] == 20
@@ -0,0 +1,90 @@
+from sqlalchemy import text
+
+from database import engine
+
+
+def _pages(client, url, **params):
+    seen, cursor = [], None
+    while True:
+        resp = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert resp.status_code == 200
+        seen.append(resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            return seen
+
+
+def _seed_projects(client, n=25):
+    ids = []
+    for i in range(n):
+        project = client.post("/projects/", json={"name": f"Proyecto {i:02d}", "client_name": "ACME" if i % 2 else "Globex"}).json()
+        if i % 3 == 0:
+            client.post(f"/projects/{project['id']}/finalize")
+        ids.append(project["id"])
+    return ids
+
+
+def test_projects_keyset_pages_cover_everything_once(client):
+    ids = _seed_projects(client)
+    pages = _pages(client, "/projects/", limit=10)
+    assert [len(p) for p in pages] == [10, 10, 5]
+    assert [p["id"] for page in pages for p in page] == ids
+
+    desc = _pages(client, "/projects/", limit=7, sort="name", order="desc")
+    names = [p["name"] for page in desc for p in page]
+    assert names == sorted(names, reverse=True) and len(names) == 25
+
+
+def test_projects_filters(client):
+    _seed_projects(client)
+    sent = [p for page in _pages(client, "/projects/", status="SENT", limit=3) for p in page]
+    assert len(sent) == 9 and all(p["status"] == "SENT" for p in sent)
+    acme_drafts = client.get("/projects/", params={"status": "DRAFT", "client_name": "ACME"}).json()
+    assert acme_drafts and all(p["client_name"] == "ACME" and p["status"] == "DRAFT" for p in acme_drafts)
+
+
+def test_projects_legacy_skip(client):
+    ids = _seed_projects(client, n=10)
+    assert [p["id"] for p in client.get("/projects/", params={"skip": 1, "limit": 2}).json()] == ids[1:3]
+    # The offset applies after the filters, like the baseline skip
+    acme = [i for n, i in enumerate(ids) if n % 2]
+    resp = client.get("/projects/", params={"skip": 1, "client_name": "ACME"})
+    assert [p["id"] for p in resp.json()] == acme[1:]
+
+    cursor = client.get("/projects/", params={"limit": 2}).headers["X-Next-Cursor"]
+    assert client.get("/projects/", params={"skip": 1, "cursor": cursor}).status_code == 400
+
+
+def test_quotes_listing_sorted_by_total_with_range(client, seeded_quote):
+    role_id = seeded_quote["role_ids"][0]
+    project_id = seeded_quote["project_id"]
+    for hours in [1, 5, 3, 5, 8]:
+        quote = client.post("/quotes/", json={"project_id": project_id}).json()
+        client.post(f"/quotes/{quote['id']}/items/", json={
+            "role_id": role_id, "description": "x", "manual_hours": float(hours), "hourly_rate": 100.0,
+        })
+
+    rows = [q for page in _pages(client, "/quotes/", sort="total_price", order="desc", limit=2,
+                                  min_total=200, max_total=600) for q in page]
+    assert [q["total_price"] for q in rows] == [500.0, 500.0, 300.0]
+    assert rows[0]["id"] > rows[1]["id"]  # ties broken by id, same direction
+    assert rows[0]["project_name"] == "Portal Clientes"
+    assert rows[0]["client_name"] == "ACME"
+    assert "items" not in rows[0]
+
+    assert len(client.get("/quotes/", params={"client_name": "Nadie"}).json()) == 0
+
+
+def test_invalid_cursor_and_sort(client):
+    assert client.get("/projects/", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/quotes/", params={"sort": "description"}).status_code == 422
+
+
+def test_listing_queries_use_composite_indexes(client):
+    with engine.connect() as conn:
+        plan = " ".join(str(row) for row in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM projects WHERE status = 'DRAFT' AND id > 10 ORDER BY id LIMIT 50")))
+        assert "ix_projects_status_id" in plan
+        plan = " ".join(str(row) for row in conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM quotes WHERE (total_price, id) < (500, 10) ORDER BY total_price DESC, id DESC LIMIT 50")))
+        assert "ix_quotes_total_price_id" in plan
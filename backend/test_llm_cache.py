@@ -0,0 +1,98 @@
+import threading
+import time
+
+from database import SessionLocal
+from llm_cache import LLMCache, make_key
+
+
+def _generate(client, seeded_quote, requirements, **extra):
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": requirements, "role_ids": seeded_quote["role_ids"], **extra})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+def test_repeat_generation_is_served_from_cache(client, fake_llm, seeded_quote):
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "Backend", "hours": 12.0}]
+    client.delete("/ai/cache")
+    before = client.get("/ai/cache/stats").json()
+
+    first = _generate(client, seeded_quote, "API de pagos\n\n  con   reportes")
+    # Whitespace-only differences hit the same entry
+    second = _generate(client, seeded_quote, "API de pagos\ncon reportes")
+
+    assert len(fake_llm.requests) == 1
+    assert first[0]["description"] == second[0]["description"]
+    stats = client.get("/ai/cache/stats").json()
+    assert stats["entries"] == 1
+    assert stats["hits"] - before["hits"] == 1
+    assert stats["misses"] - before["misses"] == 1
+
+
+def test_bypass_flag_skips_lookup_and_refreshes(client, fake_llm, seeded_quote):
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "v1", "hours": 4.0}]
+    client.delete("/ai/cache")
+    _generate(client, seeded_quote, "Login")
+
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "v2", "hours": 5.0}]
+    assert _generate(client, seeded_quote, "Login", bypass_cache=True)[0]["description"] == "v2"
+    assert _generate(client, seeded_quote, "Login")[0]["description"] == "v2"
+    assert len(fake_llm.requests) == 2
+
+
+def test_key_depends_on_model_and_roles():
+    roles = [{"id": 1, "name": "Backend"}, {"id": 2, "name": "QA"}]
+    base = make_key("m1", "sys", "req", roles)
+    assert base == make_key("m1", "sys", "req", list(reversed(roles)))
+    assert base != make_key("m2", "sys", "req", roles)
+    assert base != make_key("m1", "sys", "req", roles[:1])
+
+
+def test_ttl_and_lru_eviction(client):
+    cache = LLMCache(ttl_seconds=60, max_entries=2)
+    db = SessionLocal()
+    try:
+        cache.clear(db)
+        cache.put(db, "a", "m", "{}")
+        time.sleep(0.01)
+        cache.put(db, "b", "m", "{}")
+        time.sleep(0.01)
+        assert cache.get(db, "a") == "{}"  # touch "a" so "b" is least recently used
+        cache.put(db, "c", "m", "{}")
+
+        assert cache.get(db, "b") is None
+        assert cache.get(db, "a") == "{}"
+        assert cache.evictions == 1
+
+        cache.ttl_seconds = 0
+        time.sleep(0.01)
+        assert cache.get(db, "c") is None
+        assert cache.stats(db)["entries"] == 1
+    finally:
+        db.close()
+
+
+def test_concurrent_puts_of_same_key(client):
+    cache = LLMCache()
+    barrier = threading.Barrier(8)
+    errors = []
+
+    def put(n):
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            cache.put(db, "same-key", "m", f"response {n}")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = [threading.Thread(target=put, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert errors == []
+    with SessionLocal() as db:
+        assert cache.get(db, "same-key").startswith("response ")
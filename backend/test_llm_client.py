@@ -0,0 +1,164 @@
+import asyncio
+import time
+
+import pytest
+import openai
+from openai import OpenAI
+
+import ai_service
+import metrics
+from fake_openai_server import FakeOpenAIServer
+from llm_client import CircuitBreaker, LLMUnavailableError, ResilientLLM
+
+MESSAGES = [{"role": "user", "content": "hola"}]
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(items=[{"role_id": 1, "description": "API", "hours": 8.0}]) as fake:
+        yield fake
+
+
+def _llm(server, models=("primary",), sleeps=None, **kwargs):
+    client = OpenAI(api_key="test-key", base_url=server.base_url, max_retries=0)
+    sleep = sleeps.append if sleeps is not None else (lambda s: None)
+    return ResilientLLM(client, models=list(models), sleep=sleep, **kwargs)
+
+
+def test_transient_errors_are_retried_with_backoff(server):
+    server.faults = [503, 429]
+    server.retry_after = 0.3
+    sleeps = []
+    retries_before = metrics.LLM_RETRIES.value(model="primary", reason="503")
+
+    model, response = _llm(server, sleeps=sleeps, max_retries=2).create(messages=MESSAGES)
+
+    assert model == "primary"
+    assert "API" in response.choices[0].message.content
+    assert len(server.requests) == 3
+    assert len(sleeps) == 2 and all(s >= 0.3 for s in sleeps) # Retry-After is a floor
+    assert metrics.LLM_RETRIES.value(model="primary", reason="503") == retries_before + 1
+
+
+def test_timeout_is_retried(server):
+    server.faults = ["timeout"]
+    server.hang_seconds = 2.0
+    started = time.perf_counter()
+    model, _ = _llm(server, timeout=0.3, max_retries=1).create(messages=MESSAGES)
+    assert model == "primary"
+    assert time.perf_counter() - started < 1.5
+
+
+def test_falls_back_to_next_model(server):
+    server.model_faults = {"primary": 503}
+    model, _ = _llm(server, models=("primary", "alternate"), max_retries=1).create(messages=MESSAGES)
+    assert model == "alternate"
+    assert [r["model"] for r in server.requests] == ["primary", "primary", "alternate"]
+
+
+def test_model_specific_error_skips_retries(server):
+    server.model_faults = {"primary": 404}
+    model, _ = _llm(server, models=("primary", "alternate"), max_retries=3).create(messages=MESSAGES)
+    assert model == "alternate"
+    assert [r["model"] for r in server.requests] == ["primary", "alternate"]
+
+
+def test_circuit_opens_fails_fast_and_recovers(server):
+    server.model_faults = {"primary": 503}
+    llm = _llm(server, max_retries=0, failure_threshold=2, reset_timeout=0.2)
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            llm.create(messages=MESSAGES)
+    assert llm.breakers["primary"].state == CircuitBreaker.OPEN
+    assert "llm_circuit_state{model=\"primary\"} 2.0" in metrics.registry.render()
+
+    # Open: no request reaches the provider
+    with pytest.raises(LLMUnavailableError):
+        llm.create(messages=MESSAGES)
+    assert len(server.requests) == 2
+
+    # After reset_timeout a single trial call closes it again
+    server.model_faults = {}
+    time.sleep(0.25)
+    llm.create(messages=MESSAGES)
+    assert llm.breakers["primary"].state == CircuitBreaker.CLOSED
+    assert len(server.requests) == 3
+
+
+def test_half_open_failure_reopens():
+    now = [0.0]
+    breaker = CircuitBreaker("m", failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert not breaker.allow()
+    now[0] = 11
+    assert breaker.allow()
+    assert not breaker.allow() # Only one trial in flight
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def _open_circuit(llm, server):
+    server.model_faults = {"primary": 503}
+    with pytest.raises(LLMUnavailableError):
+        llm.create(messages=MESSAGES)
+    assert llm.breakers["primary"].state == CircuitBreaker.OPEN
+    time.sleep(0.25)
+
+
+def test_trial_ending_in_auth_error_is_released(server):
+    llm = _llm(server, max_retries=0, failure_threshold=1, reset_timeout=0.2)
+    _open_circuit(llm, server)
+
+    server.model_faults = {"primary": 401}
+    with pytest.raises(openai.AuthenticationError):
+        llm.create(messages=MESSAGES)
+
+    # No verdict from the trial: the next call probes again instead of being rejected forever
+    server.model_faults = {}
+    assert llm.create(messages=MESSAGES)[0] == "primary"
+    assert llm.breakers["primary"].state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_trial_is_released(server):
+    class _Cancelled:
+        def with_options(self, **kwargs):
+            return self
+
+        @property
+        def chat(self):
+            return self
+
+        @property
+        def completions(self):
+            return self
+
+        async def create(self, **kwargs):
+            raise asyncio.CancelledError()
+
+    llm = _llm(server, max_retries=0, failure_threshold=1, reset_timeout=0.2)
+    _open_circuit(llm, server)
+
+    llm.async_client = _Cancelled()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(llm.acreate(messages=MESSAGES))
+
+    server.model_faults = {}
+    assert llm.create(messages=MESSAGES)[0] == "primary"
+
+
+def test_generate_scope_when_provider_is_down(client, fake_llm, seeded_quote, monkeypatch):
+    fake_llm.model_faults = {ai_service.DEFAULT_MODEL: 503}
+    monkeypatch.setattr(ai_service.llm, "sleep", lambda s: None)
+    body = {"requirements": "Caída", "role_ids": seeded_quote["role_ids"], "bypass_cache": True}
+    url = f"/quotes/{seeded_quote['quote_id']}/generate-scope"
+
+    # Default: placeholder estimate, counted in the metrics
+    static_before = metrics.LLM_FALLBACKS.value(kind="static")
+    resp = client.post(url, json=body)
+    assert resp.status_code == 200
+    assert all(item["manual_hours"] == 8.0 for item in resp.json())
+    assert metrics.LLM_FALLBACKS.value(kind="static") == static_before + 1
+
+    monkeypatch.setattr(ai_service, "STATIC_FALLBACK", False)
+    assert client.post(url, json=body).status_code == 503
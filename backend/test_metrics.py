@@ -0,0 +1,84 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+import database
+import metrics
+
+
+def _sample(text, prefix):
+    # Value of the first exposition line starting with prefix
+    for line in text.splitlines():
+        if line.startswith(prefix):
+            return float(line.rsplit(" ", 1)[1])
+    return None
+
+
+def test_route_latency_and_db_queries_are_recorded(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    before = metrics.HTTP_LATENCY.count(method="GET", route="/quotes/{quote_id}", status="200")
+
+    resp = client.get(f"/quotes/{quote_id}")
+    assert resp.status_code == 200
+    assert 'db;dur=' in resp.headers["Server-Timing"]
+    assert "queries" in resp.headers["Server-Timing"]
+
+    assert metrics.HTTP_LATENCY.count(method="GET", route="/quotes/{quote_id}", status="200") == before + 1
+    body = client.get("/metrics").text
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    # Label is the path template, not the concrete id
+    assert f'/quotes/{quote_id}"' not in body
+    assert _sample(body, 'http_request_db_queries_count{method="GET",route="/quotes/{quote_id}"}') >= 1
+    assert _sample(body, 'db_query_duration_seconds_count{operation="SELECT"}') >= 1
+
+
+def test_llm_latency_and_tokens(client, fake_llm, seeded_quote):
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "API", "hours": 8.0}]
+    model_labels = dict(model="gpt-4o-mini", kind="prompt")
+    calls_before = metrics.LLM_LATENCY.count(model="gpt-4o-mini", mode="json", outcome="ok")
+    tokens_before = metrics.LLM_TOKENS.value(**model_labels)
+
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": "Métricas", "role_ids": seeded_quote["role_ids"], "bypass_cache": True})
+    assert resp.status_code == 200
+
+    assert metrics.LLM_LATENCY.count(model="gpt-4o-mini", mode="json", outcome="ok") == calls_before + 1
+    assert metrics.LLM_TOKENS.value(**model_labels) > tokens_before
+
+
+def test_profile_header_is_opt_in(client, seeded_quote, monkeypatch):
+    url = f"/quotes/{seeded_quote['quote_id']}"
+    assert "id" in client.get(url, headers={"X-Profile": "1"}).json()
+
+    monkeypatch.setattr(metrics, "PROFILING_ENABLED", True)
+    resp = client.get(url, headers={"X-Profile": "1"})
+    assert resp.status_code == 200
+    assert resp.headers["X-Profiled-Status"] == "200"
+    assert "cumulative" in resp.text or "cumtime" in resp.text
+    assert "read_quote" in resp.text
+
+
+def test_histogram_exposition():
+    hist = metrics.Histogram("demo_seconds", "Demo", ("kind",), buckets=(0.1, 1.0))
+    hist.observe(0.05, kind="a")
+    hist.observe(0.5, kind="a")
+    hist.observe(5.0, kind="a")
+    lines = list(hist.render())
+    assert 'demo_seconds_bucket{kind="a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{kind="a",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{kind="a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_count{kind="a"} 3' in lines
+
+
+def test_failed_statements_do_not_leak_query_timers(tmp_path):
+    engine = database.build_engine(f"sqlite:///{tmp_path / 'errors.db'}")
+    metrics.instrument_engine(engine)
+    try:
+        with engine.connect() as conn:
+            for _ in range(3):
+                with pytest.raises(OperationalError):
+                    conn.execute(text("SELECT * FROM missing_table"))
+            conn.execute(text("SELECT 1"))
+            assert conn.info["query_started"] == []
+    finally:
+        engine.dispose()
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+
+from pricing import price_batch, quote_price
+
+
+def _quote_with_items(client, project_id, role_id, hours_list, **financials):
+    quote = client.post("/quotes/", json={"project_id": project_id, **financials}).json()
+    for hours in hours_list:
+        client.post(f"/quotes/{quote['id']}/items/", json={
+            "role_id": role_id, "description": "x", "manual_hours": hours, "hourly_rate": 100.0,
+        })
+    return quote["id"]
+
+
+@pytest.mark.parametrize("risk,margin,tax", [(0.1, 0.2, 0.16), (0.0, 1.2, 0.0), (0.2, -0.1, 0.19), (None, None, None)])
+def test_price_batch_matches_scalar_formula(risk, margin, tax):
+    subtotals = np.array([0.0, 10.0, 1234.5])
+    expected = [quote_price(s, risk, margin, tax) for s in subtotals]
+    assert np.allclose(price_batch(subtotals, risk, margin, tax), expected)
+
+
+def test_price_batch_endpoint_matches_stored_totals(client, seeded_quote):
+    role_id = seeded_quote["role_ids"][0]
+    other = _quote_with_items(client, seeded_quote["project_id"], role_id, [3.0], applied_margin=0.3)
+    client.post(f"/quotes/{seeded_quote['quote_id']}/items/", json={
+        "role_id": role_id, "description": "x", "manual_hours": 10.0, "hourly_rate": 100.0,
+    })
+
+    resp = client.post("/quotes/price-batch", json={})
+    assert resp.status_code == 200
+    priced = {q["quote_id"]: q for q in resp.json()["quotes"]}
+    for quote_id in (seeded_quote["quote_id"], other):
+        stored = client.get(f"/quotes/{quote_id}").json()
+        assert priced[quote_id]["total_cost"] == stored["total_cost"]
+        assert priced[quote_id]["total_price"] == stored["total_price"]
+
+
+def test_margin_sweep_and_role_rate_what_if(client, seeded_quote):
+    backend_id, qa_id = seeded_quote["role_ids"]
+    quote_id = seeded_quote["quote_id"]
+    for role_id in (backend_id, qa_id):
+        client.post(f"/quotes/{quote_id}/items/", json={
+            "role_id": role_id, "description": "x", "manual_hours": 10.0, "hourly_rate": 100.0,
+        })
+
+    resp = client.post("/quotes/price-batch", json={
+        "quote_ids": [quote_id],
+        "role_rates": {str(backend_id): 150.0},
+        "scenarios": [{"margin": 0.0}, {"margin": 0.5, "tax": 0.0}],
+    })
+    [result] = resp.json()["quotes"]
+    assert result["total_cost"] == 2500.0  # 10h * 150 + 10h * 100
+    assert result["total_price"] == round(quote_price(2500.0, 0.1, 0.2, 0.16), 2)
+    assert result["scenario_prices"] == [
+        round(quote_price(2500.0, 0.1, 0.0, 0.16), 2),
+        round(quote_price(2500.0, 0.1, 0.5, 0.0), 2),
+    ]
+    # What-if only: the stored quote is untouched
+    assert client.get(f"/quotes/{quote_id}").json()["total_cost"] == 2000.0
+
+
+def test_price_batch_empty_selection(client):
+    assert client.post("/quotes/price-batch", json={"quote_ids": [999]}).json() == {"quotes": []}
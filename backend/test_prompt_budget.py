@@ -0,0 +1,71 @@
+import ai_service
+import prompt_budget
+from prompt_budget import compact, count_tokens, dedupe_passages, fit_requirements
+
+
+def test_compact_removes_prompt_indentation():
+    text = """
+        REGLAS:
+            1.   Agrupa    funcionalidades.   
+
+
+        2. Responde en JSON.
+        """
+    assert compact(text) == "REGLAS:\n    1. Agrupa funcionalidades.\n\n2. Responde en JSON."
+    assert not ai_service.SYSTEM_PROMPT.startswith(" ") and "\n        " not in ai_service.SYSTEM_PROMPT
+
+
+def test_dedupe_drops_repeated_paragraphs_only():
+    boilerplate = "Documento confidencial de ACME, prohibida su distribución sin autorización."
+    text = f"## Login\nUsuarios con OAuth.\n\n{boilerplate}\n\n## Reportes\nExportar a Excel.\n\n{boilerplate.upper()}\n\nSí\n\nSí"
+    deduped, removed = dedupe_passages(text)
+    assert removed == 1
+    assert deduped.count("confidencial") == 1 and deduped.count("Sí") == 2
+
+
+def test_fit_keeps_whole_sections_in_order():
+    text = "\n\n".join(f"## Módulo {n}\n" + f"Detalle del módulo {n}. " * 30 for n in range(10))
+    fitted, truncated = fit_requirements(text, 600)
+    assert truncated and count_tokens(fitted) <= 600
+    assert fitted.startswith("## Módulo 0") and "## Módulo 9" not in fitted
+    assert fitted.endswith(prompt_budget.TRUNCATION_NOTE.format(omitted=10 - fitted.count("## Módulo")))
+    assert fit_requirements("Login", 600) == ("Login", False)
+
+
+def test_generation_is_logged_per_quote(client, fake_llm, seeded_quote):
+    role_id = seeded_quote["role_ids"][0]
+    fake_llm.items = [{"role_id": role_id, "description": "Login", "hours": 8.0}]
+    paragraph = "El sistema debe permitir a los usuarios iniciar sesión con su cuenta corporativa."
+    requirements = f"   {paragraph}\n\n\n\n{paragraph}\n\n   Reportes de ventas   mensuales."
+
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": requirements, "role_ids": [role_id]})
+    assert resp.status_code == 200
+    sent = fake_llm.requests[-1]["messages"][1]["content"]
+    assert sent.count("iniciar sesión") == 1 and "Reportes de ventas mensuales." in sent
+
+    logs = client.get(f"/quotes/{seeded_quote['quote_id']}/ai-generations").json()
+    assert len(logs) == 1
+    log = logs[0]
+    assert (log["source"], log["mode"], log["llm_calls"], log["removed_passages"]) == ("llm", "single", 1, 1)
+    assert log["input_tokens"] > 0 and log["output_tokens"] > 0 and log["estimated_input_tokens"] > 0
+
+    # Served from the response cache: logged without LLM calls
+    client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope", json={"requirements": requirements, "role_ids": [role_id]})
+    usage = client.get("/ai/usage").json()
+    assert [(u["generations"], u["llm_calls"], u["input_tokens"]) for u in usage] == [(2, 1, log["input_tokens"])]
+
+
+def test_over_budget_prompt_is_truncated(client, fake_llm, seeded_quote, monkeypatch):
+    monkeypatch.setattr(ai_service, "INPUT_TOKEN_BUDGET", 700)
+    role_id = seeded_quote["role_ids"][0]
+    fake_llm.items = [{"role_id": role_id, "description": "Todo", "hours": 40.0}]
+    requirements = "\n\n".join(f"## Módulo {n}\n" + f"Detalle {n} del módulo. " * 40 for n in range(8))
+
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": requirements, "role_ids": [role_id], "mode": "single"})
+    assert resp.status_code == 200
+    messages = fake_llm.requests[-1]["messages"]
+    assert count_tokens(messages[0]["content"]) + count_tokens(messages[1]["content"]) <= 700
+    assert "omitidas por límite de tokens" in messages[1]["content"]
+    assert client.get(f"/quotes/{seeded_quote['quote_id']}/ai-generations").json()[0]["truncated"] is True
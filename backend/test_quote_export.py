@@ -0,0 +1,93 @@
+import io
+import re
+import zipfile
+import zlib
+
+import metrics
+import quote_export
+
+
+def _add_item(client, quote_id, role_id, description="Login con OAuth", hours=10.0, rate=50.0):
+    return client.post(f"/quotes/{quote_id}/items/", json={
+        "role_id": role_id, "description": description, "manual_hours": hours, "hourly_rate": rate,
+    }).json()
+
+
+def _pdf_text(data: bytes) -> bytes:
+    streams = re.findall(rb"stream\n(.*?)\nendstream", data, re.S)
+    return b"".join(zlib.decompress(s) for s in streams)
+
+
+def test_pdf_export(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    _add_item(client, quote_id, role_id, description="Módulo de reportes (PDF)")
+
+    resp = client.get(f"/quotes/{quote_id}/export?format=pdf")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == "application/pdf"
+    assert f"cotizacion-{quote_id}-v1.pdf" in resp.headers["content-disposition"]
+    assert resp.content.startswith(b"%PDF-1.4") and resp.content.rstrip().endswith(b"%%EOF")
+
+    text = _pdf_text(resp.content)
+    assert b"Backend Developer" in text
+    assert "(Módulo de reportes \\(PDF\\))".encode("cp1252") in text
+    # 500 * 1.1 / 0.8 * 1.16
+    assert b"($797.50)" in text
+
+
+def test_pdf_paginates_long_quotes():
+    payload = {
+        "quote_id": 1, "version": 1, "project_name": "P", "client_name": "C",
+        "applied_margin": 0.0, "applied_risk": 0.0, "applied_tax": 0.0,
+        "items": [{"role": "QA", "description": "Caso de prueba " * 20, "hours": 1.0, "hourly_rate": 1.0, "subtotal": 1.0}] * 60,
+        "totals": {"subtotal_cost": 60.0, "risk_amount": 0.0, "margin_amount": 0.0, "price_before_tax": 60.0,
+                   "tax_amount": 0.0, "total_price": 60.0},
+    }
+    data = quote_export.render_pdf(payload)
+    pages = int(re.search(rb"/Count (\d+)", data).group(1))
+    assert pages > 1
+    assert f"Página {pages} de {pages}".encode("cp1252") in _pdf_text(data)
+    assert data == quote_export.render_pdf(payload) # Deterministic
+
+
+def test_xlsx_export(client, seeded_quote):
+    quote_id, role_ids = seeded_quote["quote_id"], seeded_quote["role_ids"]
+    _add_item(client, quote_id, role_ids[0])
+    _add_item(client, quote_id, role_ids[1], description="Pruebas <E2E> & regresión", hours=5.0, rate=40.0)
+
+    resp = client.get(f"/quotes/{quote_id}/export?format=xlsx")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"] == quote_export.FORMATS["xlsx"]
+
+    with zipfile.ZipFile(io.BytesIO(resp.content)) as archive:
+        assert "xl/workbook.xml" in archive.namelist()
+        sheet = archive.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert "QA Engineer" in sheet and "Pruebas &lt;E2E&gt; &amp; regresión" in sheet
+    assert "<f>C7*D7</f>" in sheet and "<f>SUM(E7:E8)</f>" in sheet
+    assert "<v>1116.5</v>" in sheet # (500 + 200) * 1.1 / 0.8 * 1.16
+
+
+def test_export_is_cached_by_content(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    item = _add_item(client, quote_id, role_id)
+    hits = lambda: metrics.EXPORT_REQUESTS.value(format="pdf", cache="hit")
+
+    first = client.get(f"/quotes/{quote_id}/export")
+    before = hits()
+    second = client.get(f"/quotes/{quote_id}/export")
+    assert hits() == before + 1
+    assert second.content == first.content and second.headers["etag"] == first.headers["etag"]
+
+    not_modified = client.get(f"/quotes/{quote_id}/export", headers={"If-None-Match": first.headers["etag"]})
+    assert not_modified.status_code == 304
+
+    # Any item change is a new document
+    client.put(f"/quotes/items/{item['id']}", json={**item, "manual_hours": 12.0})
+    third = client.get(f"/quotes/{quote_id}/export")
+    assert third.headers["etag"] != first.headers["etag"]
+    assert b"($957.00)" in _pdf_text(third.content) # 600 * 1.1 / 0.8 * 1.16
+
+
+def test_export_unknown_quote(client):
+    assert client.get("/quotes/999/export").status_code == 404
+    assert client.get("/quotes/999/export?format=docx").status_code == 422
@@ -0,0 +1,62 @@
+from database import count_queries
+
+
+def _item(role_id, description, hours, **extra):
+    return {"role_id": role_id, "description": description, "manual_hours": hours, "hourly_rate": 50.0, **extra}
+
+
+def test_replace_inserts_updates_deletes_and_reorders(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    role_id = seeded_quote["role_ids"][0]
+    first = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, "A", 1.0, ai_suggested_hours=3.0)).json()
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, "B", 2.0)).json()
+
+    resp = client.put(f"/quotes/{quote_id}/items", json={"items": [
+        _item(role_id, "Nuevo", 5.0),
+        _item(role_id, "A editado", 10.0, id=first["id"]),
+    ]})
+
+    assert resp.status_code == 200
+    items = resp.json()
+    assert [(i["description"], i["sequence"]) for i in items] == [("Nuevo", 0), ("A editado", 1)]
+    assert items[1]["id"] == first["id"]
+    assert items[1]["ai_suggested_hours"] == 3.0  # untouched when not sent
+    assert "B" not in {i["description"] for i in items}
+
+    quote = client.get(f"/quotes/{quote_id}").json()
+    assert [i["description"] for i in quote["items"]] == ["Nuevo", "A editado"]
+
+
+def test_replace_is_constant_statement_count(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    role_id = seeded_quote["role_ids"][0]
+    payload = {"items": [_item(role_id, f"Item {n}", float(n)) for n in range(12)]}
+
+    with count_queries() as queries:
+        resp = client.put(f"/quotes/{quote_id}/items", json=payload)
+
+    assert len(resp.json()) == 12
+    # quote lookup + existing ids + bulk insert + final read
+    assert queries.count <= 5, queries.statements
+
+
+def test_replace_rejects_foreign_item_ids(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    role_id = seeded_quote["role_ids"][0]
+    other = client.post("/quotes/", json={"project_id": seeded_quote["project_id"]}).json()
+    foreign = client.post(f"/quotes/{other['id']}/items/", json=_item(role_id, "Otro", 1.0)).json()
+
+    resp = client.put(f"/quotes/{quote_id}/items", json={"items": [_item(role_id, "X", 1.0, id=foreign["id"])]})
+    assert resp.status_code == 400
+    assert len(client.get(f"/quotes/{other['id']}").json()["items"]) == 1
+    assert client.put("/quotes/999/items", json={"items": []}).status_code == 404
+
+
+def test_generate_scope_uses_bulk_insert(client, fake_llm, seeded_quote):
+    role_id = seeded_quote["role_ids"][0]
+    fake_llm.items = [{"role_id": role_id, "description": f"Módulo {n}", "hours": 8.0} for n in range(12)]
+
+    items = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                        json={"requirements": "ERP", "role_ids": [role_id]}).json()
+    assert [i["sequence"] for i in items] == list(range(12))
+    assert all(i["hourly_rate"] == 50.0 for i in items)
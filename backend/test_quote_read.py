@@ -0,0 +1,43 @@
+from database import count_queries
+
+
+def test_read_quote_is_a_single_query(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    backend_id, qa_id = seeded_quote["role_ids"]
+    # Inserted out of order: the response must follow sequence, then id
+    for seq, role_id, desc in [(2, qa_id, "Pruebas"), (0, backend_id, "API"), (1, backend_id, "Reportes")]:
+        client.post(f"/quotes/{quote_id}/items/", json={
+            "role_id": role_id, "description": desc, "manual_hours": 10.0, "hourly_rate": 50.0, "sequence": seq,
+        })
+
+    with count_queries() as queries:
+        resp = client.get(f"/quotes/{quote_id}")
+
+    assert resp.status_code == 200
+    assert queries.count == 1, queries.statements
+    data = resp.json()
+    assert [i["description"] for i in data["items"]] == ["API", "Reportes", "Pruebas"]
+    assert data["project_name"] == "Portal Clientes"
+    assert data["client_name"] == "ACME"
+    assert data["total_cost"] == 1500.0
+
+
+def test_read_quote_without_items(client, seeded_quote):
+    with count_queries() as queries:
+        data = client.get(f"/quotes/{seeded_quote['quote_id']}").json()
+    assert queries.count == 1
+    assert data["items"] == []
+    assert data["total_price"] == 0.0
+
+
+def test_read_missing_quote(client):
+    assert client.get("/quotes/12345").status_code == 404
+
+
+def test_writes_to_missing_parents_are_404(client, seeded_quote):
+    # Foreign keys are enforced: a missing parent must be a 404, not an IntegrityError (500)
+    item = {"role_id": seeded_quote["role_ids"][0], "description": "API", "manual_hours": 8.0, "hourly_rate": 50.0}
+    assert client.post("/quotes/12345/items/", json=item).status_code == 404
+    assert client.put("/quotes/12345/items", json={"items": [item]}).status_code == 404
+    assert client.post("/quotes/", json={"project_id": 12345}).status_code == 404
+    assert client.post("/quotes/12345/versions").status_code == 404
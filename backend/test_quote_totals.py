@@ -0,0 +1,77 @@
+import pytest
+
+import crud, manage
+from database import SessionLocal
+from pricing import quote_price
+
+
+def _item(role_id, hours, rate, **extra):
+    return {"role_id": role_id, "description": "Tarea", "manual_hours": hours, "hourly_rate": rate, **extra}
+
+
+def _stored(quote_id):
+    with SessionLocal() as db:
+        quote = crud.get_quote(db, quote_id)
+        return round(quote.total_cost, 2), round(quote.total_price, 2)
+
+
+def test_totals_follow_item_changes(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    role_id = seeded_quote["role_ids"][0]
+
+    # Cost 1000, risk 10% -> 1100, margin 20% -> 1375, tax 16% -> 1595
+    item = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, 10.0, 100.0)).json()
+    assert _stored(quote_id) == (1000.0, 1595.0)
+
+    client.put(f"/quotes/items/{item['id']}", json=_item(role_id, 20.0, 100.0))
+    assert _stored(quote_id) == (2000.0, 3190.0)
+
+    extra = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, 1.0, 50.0)).json()
+    client.delete(f"/quotes/items/{extra['id']}")
+    assert _stored(quote_id) == (2000.0, 3190.0)
+
+    client.put(f"/quotes/{quote_id}/items", json={"items": [_item(role_id, 5.0, 100.0)]})
+    assert _stored(quote_id) == (500.0, 797.5)
+
+    data = client.get(f"/quotes/{quote_id}").json()
+    assert (data["total_cost"], data["total_price"]) == (500.0, 797.5)
+
+
+def test_totals_follow_financials(client, seeded_quote):
+    quote_id = seeded_quote["quote_id"]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(seeded_quote["role_ids"][0], 10.0, 100.0))
+
+    with SessionLocal() as db:
+        crud.update_quote_financials(db, quote_id, margin=1.5, risk=0.0, tax=0.0)
+    assert _stored(quote_id) == (1000.0, round(quote_price(1000.0, 0.0, 1.5, 0.0), 2))
+
+    with SessionLocal() as db:
+        crud.update_quote_financials(db, quote_id, margin=0.0, risk=0.0, tax=0.0)
+    assert _stored(quote_id) == (1000.0, 1000.0)
+
+
+@pytest.mark.parametrize("risk,margin,tax", [(0.1, 0.2, 0.16), (0.0, -0.5, 0.0), (0.3, 1.0, 0.19), (None, None, None)])
+def test_sql_formula_matches_python(client, seeded_quote, risk, margin, tax):
+    quote_id = seeded_quote["quote_id"]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(seeded_quote["role_ids"][0], 7.5, 33.3))
+    with SessionLocal() as db:
+        quote = crud.get_quote(db, quote_id)
+        quote.applied_risk, quote.applied_margin, quote.applied_tax = risk, margin, tax
+        db.commit()
+        crud.recompute_quote_totals(db)
+        quote = crud.get_quote(db, quote_id)
+        assert quote.total_price == pytest.approx(quote_price(7.5 * 33.3, risk, margin, tax))
+
+
+def test_consistency_commands(client, seeded_quote, capsys):
+    quote_id = seeded_quote["quote_id"]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(seeded_quote["role_ids"][0], 10.0, 100.0))
+    with SessionLocal() as db:
+        crud.get_quote(db, quote_id).total_cost = 1.0
+        db.commit()
+
+    assert manage.main(["check-totals"]) == 1
+    assert f"Quote {quote_id}" in capsys.readouterr().out
+    assert manage.main(["recompute-totals"]) == 0
+    assert manage.main(["check-totals"]) == 0
+    assert _stored(quote_id) == (1000.0, 1595.0)
@@ -0,0 +1,65 @@
+from database import count_queries
+
+
+def _add_items(client, quote_id, role_id, n):
+    return [client.post(f"/quotes/{quote_id}/items/", json={
+        "role_id": role_id, "description": f"Item {i}", "manual_hours": float(i + 1), "hourly_rate": 50.0, "sequence": i,
+    }).json() for i in range(n)]
+
+
+def test_clone_copies_items_in_one_statement(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    _add_items(client, quote_id, role_id, 200)
+    original = client.get(f"/quotes/{quote_id}").json()
+
+    with count_queries() as q:
+        resp = client.post(f"/quotes/{quote_id}/versions")
+    assert resp.status_code == 200
+    assert sum("INSERT INTO quote_items" in s for s in q.statements) == 1
+
+    clone = resp.json()
+    assert clone["id"] != quote_id
+    assert clone["version"] == 2 and clone["parent_quote_id"] == quote_id
+    assert [(i["description"], i["manual_hours"]) for i in clone["items"]] == \
+        [(i["description"], i["manual_hours"]) for i in original["items"]]
+    assert clone["total_price"] == original["total_price"]
+
+    # Editing the new version leaves the original untouched
+    client.put(f"/quotes/items/{clone['items'][0]['id']}", json={**clone["items"][0], "manual_hours": 99.0})
+    assert client.get(f"/quotes/{quote_id}").json()["items"][0]["manual_hours"] == 1.0
+
+
+def test_clone_with_new_financials_is_repriced(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    _add_items(client, quote_id, role_id, 2) # cost = (1 + 2) * 50
+    clone = client.post(f"/quotes/{quote_id}/versions", json={"applied_margin": 0.5}).json()
+    assert clone["applied_margin"] == 0.5 and clone["applied_risk"] == 0.1
+    assert clone["total_price"] == round(150 * 1.1 / 0.5 * 1.16, 2)
+
+    versions = client.get(f"/quotes/{clone['id']}/versions").json()
+    assert [(v["id"], v["version"]) for v in versions] == [(quote_id, 1), (clone["id"], 2)]
+    assert client.post("/quotes/9999/versions").status_code == 404
+
+
+def test_diff_matches_items_by_lineage(client, seeded_quote):
+    quote_id, (backend, qa) = seeded_quote["quote_id"], seeded_quote["role_ids"]
+    _add_items(client, quote_id, backend, 3)
+    v2 = client.post(f"/quotes/{quote_id}/versions").json()
+    first, second, third = v2["items"]
+
+    client.put(f"/quotes/items/{first['id']}", json={**first, "manual_hours": 10.0, "role_id": qa})
+    client.delete(f"/quotes/items/{second['id']}")
+    client.post(f"/quotes/{v2['id']}/items/", json={"role_id": qa, "description": "Nuevo", "manual_hours": 4.0, "hourly_rate": 40.0})
+
+    # A third version (with a new margin) keeps the lineage of the first one
+    v3 = client.post(f"/quotes/{v2['id']}/versions", json={"applied_margin": 0.3}).json()
+    diff = client.get(f"/quotes/{quote_id}/diff/{v3['id']}").json()
+
+    assert [i["description"] for i in diff["added"]] == ["Nuevo"]
+    assert [i["description"] for i in diff["removed"]] == ["Item 1"]
+    assert len(diff["changed"]) == 1
+    assert diff["changed"][0]["changes"] == {"role_id": [backend, qa], "manual_hours": [1.0, 10.0]}
+    assert diff["unchanged"] == 1
+    assert diff["financials"] == {"applied_margin": [0.2, 0.3]}
+    assert diff["total_cost"][0] != diff["total_cost"][1]
+    assert client.get(f"/quotes/{quote_id}/diff/9999").status_code == 404
@@ -0,0 +1,63 @@
+from database import SessionLocal, count_queries
+import crud, schemas
+from reference_cache import reference_cache
+
+
+def test_roles_etag_and_304(client):
+    client.post("/roles/", json={"name": "Backend", "hourly_rate": 50.0})
+    first = client.get("/roles/")
+    etag = first.headers["ETag"]
+    assert [r["name"] for r in first.json()] == ["Backend"]
+
+    with count_queries() as queries:
+        cached = client.get("/roles/", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.headers["ETag"] == etag
+    assert queries.count == 0
+
+    client.put(f"/roles/{first.json()[0]['id']}", json={"name": "Backend Sr", "hourly_rate": 70.0})
+    changed = client.get("/roles/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert changed.json()[0]["hourly_rate"] == 70.0
+
+
+def test_role_create_and_delete_invalidate(client):
+    role = client.post("/roles/", json={"name": "QA", "hourly_rate": 40.0}).json()
+    assert len(client.get("/roles/").json()) == 1
+    client.post("/roles/", json={"name": "PM", "hourly_rate": 60.0})
+    assert len(client.get("/roles/").json()) == 2
+    client.delete(f"/roles/{role['id']}")
+    assert [r["name"] for r in client.get("/roles/").json()] == ["PM"]
+    assert client.get("/roles/", params={"skip": 1}).json() == []
+
+
+def test_config_cache(client):
+    client.post("/config/", json={"key": "default_margin", "value_float": 0.2})
+    first = client.get("/config/")
+    assert client.get("/config/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    client.post("/config/", json={"key": "default_margin", "value_float": 0.3})
+    second = client.get("/config/", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert second.json()[0]["value_float"] == 0.3
+
+
+def test_roles_by_id_is_shared_until_invalidated(client):
+    with SessionLocal() as db:
+        role = crud.create_role(db, schemas.RoleCreate(name="Dev", hourly_rate=10.0))
+        by_id = reference_cache.roles_by_id(db)
+        assert by_id[role.id].hourly_rate == 10.0
+        assert reference_cache.roles_by_id(db) is by_id
+
+        crud.update_role(db, role.id, schemas.RoleCreate(name="Dev", hourly_rate=12.0))
+        assert reference_cache.roles_by_id(db)[role.id].hourly_rate == 12.0
+
+
+def test_generate_scope_uses_current_rate(client, fake_llm, seeded_quote):
+    backend_id = seeded_quote["role_ids"][0]
+    client.put(f"/roles/{backend_id}", json={"name": "Backend Developer", "hourly_rate": 90.0})
+    fake_llm.items = [{"role_id": backend_id, "description": "API", "hours": 5.0}]
+    items = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                        json={"requirements": "API", "role_ids": [backend_id]}).json()
+    assert items[0]["hourly_rate"] == 90.0
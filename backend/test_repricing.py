@@ -0,0 +1,108 @@
+import time
+
+from sqlalchemy import update
+
+import models
+import repricing
+from database import SessionLocal
+
+
+def _item(role_id, hours=10.0, rate=50.0):
+    return {"role_id": role_id, "description": "API de login", "manual_hours": hours, "hourly_rate": rate}
+
+
+def _sent_quote(client, role_id):
+    """A second quote whose project was already sent to the client."""
+    project = client.post("/projects/", json={"name": "Intranet", "client_name": "ACME", "raw_requirements": "Portal"}).json()
+    quote = client.post("/quotes/", json={"project_id": project["id"], "applied_margin": 0.2, "applied_risk": 0.1,
+                                          "applied_tax": 0.16}).json()
+    client.post(f"/quotes/{quote['id']}/items/", json=_item(role_id))
+    client.post(f"/projects/{project['id']}/finalize")
+    return quote["id"]
+
+
+def _wait_for(client, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("DONE", "FAILED"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_preview_reports_deltas_without_writing(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id))
+    sent_id = _sent_quote(client, role_id)
+    client.put(f"/roles/{role_id}", json={"name": "Backend Developer", "hourly_rate": 60.0})
+
+    report = client.post(f"/roles/{role_id}/reprice/preview").json()
+    assert report["dry_run"] and report["hourly_rate"] == 60.0
+    assert [q["quote_id"] for q in report["quotes"]] == [quote_id] # The SENT quote keeps its rates
+    assert report["items"] == 1 and report["cost_delta"] == 100.0
+    before = client.get(f"/quotes/{quote_id}").json()
+    assert report["quotes"][0]["total_price"] == before["total_price"]
+    assert report["price_delta"] > 0
+    assert before["items"][0]["hourly_rate"] == 50.0
+    assert client.get(f"/quotes/{sent_id}").json()["items"][0]["hourly_rate"] == 50.0
+
+    assert client.post("/roles/999/reprice/preview").status_code == 404
+
+
+def test_job_reprices_draft_quotes_and_totals(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id))
+    client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, rate=75.0)) # Negotiated by hand
+    sent_id = _sent_quote(client, role_id)
+    sent_before = client.get(f"/quotes/{sent_id}").json()
+    client.put(f"/roles/{role_id}", json={"name": "Backend Developer", "hourly_rate": 60.0})
+    preview = client.post(f"/roles/{role_id}/reprice/preview", json={"only_rate": 50.0}).json()
+
+    job = client.post(f"/roles/{role_id}/reprice", json={"only_rate": 50.0})
+    assert job.status_code == 202
+    job = _wait_for(client, job.json()["id"])
+    assert job["status"] == "DONE" and job["result"]["items"] == 1 and not job["result"]["dry_run"]
+
+    quote = client.get(f"/quotes/{quote_id}").json()
+    assert sorted(i["hourly_rate"] for i in quote["items"]) == [60.0, 75.0]
+    assert quote["total_cost"] == 10.0 * 60.0 + 10.0 * 75.0
+    assert quote["total_price"] == preview["quotes"][0]["new_total_price"]
+    assert client.get(f"/quotes/{sent_id}").json() == sent_before
+
+    updated = [e for e in client.get(f"/quotes/{quote_id}/events").json() if e["event_type"] == "item.updated"]
+    assert [e["data"] for e in updated] == [{"hourly_rate": [50.0, 60.0]}]
+    assert client.post(f"/roles/{role_id}/reprice/preview").json()["items"] == 1 # Only the 75.0 item is left
+
+
+def test_items_without_a_rate_are_repriced(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    item_id = client.post(f"/quotes/{quote_id}/items/", json=_item(role_id)).json()["id"]
+    with SessionLocal() as db:
+        # Older rows can have no rate at all (the API always sets one)
+        db.execute(update(models.QuoteItem).where(models.QuoteItem.id == item_id).values(hourly_rate=None))
+        db.commit()
+
+    report = client.post(f"/roles/{role_id}/reprice/preview").json()
+    assert report["items"] == 1 and report["cost_delta"] == 500.0
+
+    with SessionLocal() as db:
+        repricing.apply(db, role_id)
+    assert [i["hourly_rate"] for i in client.get(f"/quotes/{quote_id}").json()["items"]] == [50.0]
+
+
+def test_apply_commits_in_batches(client, seeded_quote, monkeypatch):
+    role_id = seeded_quote["role_ids"][1]
+    quote_ids = [seeded_quote["quote_id"]]
+    for _ in range(2):
+        quote_ids.append(client.post("/quotes/", json={"project_id": seeded_quote["project_id"]}).json()["id"])
+    for quote_id in quote_ids:
+        client.post(f"/quotes/{quote_id}/items/", json=_item(role_id, rate=40.0))
+    monkeypatch.setattr(repricing, "BATCH_QUOTES", 2)
+
+    messages = []
+    with SessionLocal() as db:
+        result = repricing.apply(db, role_id, hourly_rate=45.0, progress=messages.append)
+    assert result["items"] == 3 and len(result["quotes"]) == 3
+    assert messages[-2:] == ["Cotizaciones actualizadas: 2/3", "Cotizaciones actualizadas: 3/3"]
+    assert all(client.get(f"/quotes/{q}").json()["items"][0]["hourly_rate"] == 45.0 for q in quote_ids)
@@ -0,0 +1,90 @@
+import json
+import time
+
+import ai_service
+import metrics
+from scope_chunking import merge_tasks, split_requirements
+
+
+def _document(sections: int, body_chars: int = 400) -> str:
+    return "\n\n".join(f"## Módulo {n}\n" + ("Requerimiento detallado. " * (body_chars // 25)) for n in range(sections))
+
+
+def test_split_keeps_sections_whole_and_in_order():
+    doc = _document(6)
+    chunks = split_requirements(doc, max_chars=900)
+    assert len(chunks) == 3
+    assert all(len(c) <= 900 for c in chunks)
+    assert chunks[0].startswith("## Módulo 0") and "## Módulo 1" in chunks[0]
+    assert chunks[-1].rstrip().endswith("Requerimiento detallado.")
+    assert "".join(chunks).count("## Módulo") == 6
+
+
+def test_split_oversized_section_and_short_text():
+    assert split_requirements("Login", max_chars=100) == ["Login"]
+    assert split_requirements("", max_chars=100) == []
+    chunks = split_requirements("x" * 250, max_chars=100)
+    assert [len(c) for c in chunks] == [100, 100, 50]
+
+
+def test_merge_tasks_dedupes_and_caps_items():
+    tasks = [
+        {"role_id": 1, "description": "Autenticación", "hours": 10},
+        {"role_id": 1, "description": "autenticación.", "hours": 16}, # same feature, other section
+    ] + [{"role_id": 2, "description": f"Reporte {n}", "hours": n + 1} for n in range(14)]
+    merged = merge_tasks(tasks, max_items=12)
+    assert len(merged) == 12
+    assert [t["hours"] for t in merged if t["role_id"] == 1] == [16]
+    assert sum(t["hours"] for t in merged if t["role_id"] == 2) == sum(range(1, 15))
+
+
+class _MapReduceLLM:
+    """Answers section prompts with one item per section and the merge prompt with a fixed summary."""
+
+    def __init__(self, server, role_id):
+        self.role_id = role_id
+        server.completion_content = self.content
+
+    def content(self, payload):
+        system, user = (m["content"] for m in payload["messages"])
+        if system == ai_service.MERGE_SYSTEM_PROMPT:
+            partial = json.loads(user.split("POR SECCIÓN:", 1)[1].split("ROLES DISPONIBLES", 1)[0])
+            hours = sum(t["hours"] for t in partial)
+            return json.dumps({"items": [{"role_id": self.role_id, "description": "Consolidado", "hours": hours}]})
+        section = user.split("SECCIÓN ", 1)[1].split(" ", 1)[0]
+        return json.dumps({"items": [{"role_id": self.role_id, "description": f"Sección {section}", "hours": 5.0}]})
+
+
+def test_chunked_generation_runs_sections_in_parallel(client, fake_llm, seeded_quote, monkeypatch):
+    monkeypatch.setattr(ai_service, "CHUNK_MAX_CHARS", 900)
+    monkeypatch.setattr(ai_service, "CHUNK_CONCURRENCY", 3)
+    _MapReduceLLM(fake_llm, seeded_quote["role_ids"][0])
+    fake_llm.delay = 0.3
+
+    started = time.perf_counter()
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": _document(12), "role_ids": seeded_quote["role_ids"], "mode": "chunked"})
+    elapsed = time.perf_counter() - started
+
+    assert resp.status_code == 200
+    assert resp.json() == [{**resp.json()[0], "description": "Consolidado", "manual_hours": 30.0}]
+    # 6 sections + 1 merge pass; sections overlap, bounded by CHUNK_CONCURRENCY
+    assert len(fake_llm.requests) == 7
+    assert fake_llm.max_in_flight == 3
+    assert elapsed < 6 * 0.3
+
+
+def test_failed_merge_falls_back_to_local_merge(client, fake_llm, seeded_quote, monkeypatch):
+    monkeypatch.setattr(ai_service, "CHUNK_MAX_CHARS", 900)
+    llm = _MapReduceLLM(fake_llm, seeded_quote["role_ids"][0])
+    original = llm.content
+    fake_llm.completion_content = lambda payload: (
+        "no es JSON" if payload["messages"][0]["content"] == ai_service.MERGE_SYSTEM_PROMPT else original(payload)
+    )
+    failures_before = metrics.AI_SECTION_FAILURES.value(stage="reduce")
+
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": _document(4), "role_ids": seeded_quote["role_ids"], "mode": "chunked"})
+    assert resp.status_code == 200
+    assert sorted(i["description"] for i in resp.json()) == ["Sección 1", "Sección 2"]
+    assert metrics.AI_SECTION_FAILURES.value(stage="reduce") == failures_before + 1
@@ -0,0 +1,81 @@
+import time
+
+import jobs
+
+
+def _wait_for(client, job_id, timeout=5.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] in ("DONE", "FAILED"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"Job {job_id} did not finish")
+
+
+def test_submit_job_returns_immediately_and_completes(client, fake_llm, seeded_quote):
+    backend_id, qa_id = seeded_quote["role_ids"]
+    fake_llm.items = [
+        {"role_id": backend_id, "description": "API de autenticación", "hours": 24.0},
+        {"role_id": qa_id, "description": "Pruebas funcionales", "hours": 8.0},
+    ]
+    fake_llm.delay = 0.3
+
+    started = time.time()
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope/jobs",
+                       json={"requirements": "Login", "role_ids": seeded_quote["role_ids"]})
+    assert resp.status_code == 202
+    assert time.time() - started < fake_llm.delay
+    assert resp.json()["status"] in ("PENDING", "RUNNING")
+
+    job = _wait_for(client, resp.json()["id"])
+    assert job["status"] == "DONE"
+    assert [i["description"] for i in job["result"]] == ["API de autenticación", "Pruebas funcionales"]
+    assert job["result"][0]["hourly_rate"] == 50.0
+
+    quote = client.get(f"/quotes/{seeded_quote['quote_id']}").json()
+    assert len(quote["items"]) == 2
+
+
+def test_job_events_stream_until_done(client, fake_llm, seeded_quote):
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "Backend", "hours": 10.0}]
+    job = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope/jobs",
+                      json={"requirements": "API", "role_ids": seeded_quote["role_ids"]}).json()
+
+    with client.stream("GET", f"/jobs/{job['id']}/events") as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        body = "".join(resp.iter_text())
+
+    assert "event: progress" in body
+    assert "event: done" in body
+
+
+def test_concurrency_cap_is_respected(client, fake_llm, seeded_quote, monkeypatch):
+    monkeypatch.setattr(jobs, "job_manager", jobs.JobManager(max_workers=2))
+    import main
+    monkeypatch.setattr(main, "job_manager", jobs.job_manager)
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "Backend", "hours": 4.0}]
+    fake_llm.delay = 0.2
+
+    ids = [
+        client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope/jobs",
+                    json={"requirements": "API", "role_ids": seeded_quote["role_ids"]}).json()["id"]
+        for _ in range(5)
+    ]
+    for job_id in ids:
+        assert _wait_for(client, job_id)["status"] == "DONE"
+    assert fake_llm.max_in_flight == 2
+
+
+def test_sync_endpoint_still_returns_items(client, fake_llm, seeded_quote):
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][1], "description": "QA", "hours": 6.0}]
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": "QA", "role_ids": seeded_quote["role_ids"]})
+    assert resp.status_code == 200
+    assert resp.json()[0]["manual_hours"] == 6.0
+
+
+def test_unknown_quote_and_job_return_404(client):
+    assert client.post("/quotes/999/generate-scope/jobs", json={"requirements": "x", "role_ids": [1]}).status_code == 404
+    assert client.post("/quotes/999/generate-scope", json={"requirements": "x", "role_ids": [1]}).status_code == 404
+    assert client.get("/jobs/nope").status_code == 404
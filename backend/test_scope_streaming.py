@@ -0,0 +1,95 @@
+import json
+import time
+
+from ai_service import ScopeItemParser
+
+
+def _read_events(resp):
+    """Parse an SSE response into [(event, data)]."""
+    events, event, data = [], None, []
+    for line in resp.iter_lines():
+        if line.startswith("event: "):
+            event = line[len("event: "):]
+        elif line.startswith("data: "):
+            data.append(line[len("data: "):])
+        elif not line and event:
+            events.append((event, "\n".join(data)))
+            event, data = None, []
+    return events
+
+
+def test_parser_emits_items_as_they_complete():
+    payload = json.dumps({"items": [
+        {"role_id": 1, "description": "Login con {llaves} y \"comillas\"", "hours": 8},
+        {"role_id": 2, "description": "Reportes", "hours": 4.5},
+    ]}, ensure_ascii=False)
+    parser = ScopeItemParser()
+    completed_at = []
+    for pos, ch in enumerate(payload):
+        for item in parser.feed(ch):
+            completed_at.append((pos, item))
+
+    assert [item["role_id"] for _, item in completed_at] == [1, 2]
+    assert completed_at[0][1]["description"] == 'Login con {llaves} y "comillas"'
+    # The first item is available at its own closing brace, not at the end of the payload
+    assert completed_at[0][0] == payload.index('"hours": 8}') + len('"hours": 8}') - 1
+    assert parser.done
+
+
+def test_stream_endpoint_emits_and_persists_each_item(client, fake_llm, seeded_quote):
+    backend_id, qa_id = seeded_quote["role_ids"]
+    fake_llm.items = [
+        {"role_id": backend_id, "description": f"Módulo {n} " + "detalle " * 10, "hours": 8.0 + n}
+        for n in range(5)
+    ] + [{"role_id": qa_id, "description": "Pruebas", "hours": 6.0}]
+    fake_llm.chunk_size = 12
+    fake_llm.chunk_delay = 0.01
+
+    with client.stream("POST", f"/quotes/{seeded_quote['quote_id']}/generate-scope/stream",
+                       json={"requirements": "ERP", "role_ids": seeded_quote["role_ids"]}) as resp:
+        assert resp.headers["content-type"].startswith("text/event-stream")
+        events = _read_events(resp)
+
+    items = [json.loads(data) for event, data in events if event == "item"]
+    assert [i["sequence"] for i in items] == list(range(6))
+    assert items[-1]["role_id"] == qa_id and items[-1]["hourly_rate"] == 40.0
+    assert events[-1][0] == "done"
+    assert fake_llm.requests[-1]["stream"] is True
+
+    saved = client.get(f"/quotes/{seeded_quote['quote_id']}").json()
+    assert [i["id"] for i in saved["items"]] == [i["id"] for i in items]
+    assert saved["total_cost"] == sum(i["manual_hours"] * i["hourly_rate"] for i in items)
+
+
+def test_first_item_arrives_before_completion_ends(client, fake_llm, seeded_quote):
+    from database import SessionLocal
+    import crud
+    from ai_service import AIService
+
+    role_id = seeded_quote["role_ids"][0]
+    fake_llm.items = [{"role_id": role_id, "description": f"Módulo {n}", "hours": 4.0} for n in range(8)]
+    fake_llm.chunk_size = 10
+    fake_llm.chunk_delay = 0.01
+
+    with SessionLocal() as db:
+        quote = crud.get_quote(db, seeded_quote["quote_id"])
+        started = time.time()
+        arrivals = [time.time() - started for _ in AIService.stream_scope(db, quote.project, quote.id, "ERP", [role_id])]
+
+    assert len(arrivals) == 8
+    assert arrivals[0] < arrivals[-1] / 4
+
+
+def test_stream_is_cached_for_repeat_requests(client, fake_llm, seeded_quote):
+    fake_llm.items = [{"role_id": seeded_quote["role_ids"][0], "description": "API", "hours": 3.0}]
+    body = {"requirements": "API", "role_ids": seeded_quote["role_ids"]}
+    for _ in range(2):
+        with client.stream("POST", f"/quotes/{seeded_quote['quote_id']}/generate-scope/stream", json=body) as resp:
+            events = _read_events(resp)
+        assert [e for e, _ in events if e == "item"] == ["item"]
+    assert len(fake_llm.requests) == 1
+
+
+def test_stream_unknown_quote(client):
+    resp = client.post("/quotes/404/generate-scope/stream", json={"requirements": "x", "role_ids": [1]})
+    assert resp.status_code == 404
@@ -0,0 +1,54 @@
+import search
+from database import engine
+
+
+def _project(client, name, requirements, client_name="ACME"):
+    return client.post("/projects/", json={"name": name, "client_name": client_name,
+                                           "raw_requirements": requirements}).json()
+
+
+def test_search_is_accent_insensitive_prefix_and_ranked(client):
+    portal = _project(client, "Portal de autenticación", "Inicio de sesión con OAuth")
+    intranet = _project(client, "Intranet", "Módulo de autenticacion para empleados", client_name="Globex")
+    for name in ("Tienda", "Blog", "CRM"):
+        _project(client, name, "Carrito y pagos")
+
+    hits = client.get("/search", params={"q": "AUTENT", "kind": "projects"}).json()["projects"]
+    assert [h["id"] for h in hits] == [portal["id"], intranet["id"]] # A match in the name ranks higher
+    assert hits[0]["score"] > hits[1]["score"]
+    assert "<mark>autenticacion</mark>" in hits[1]["snippet"]
+
+    # Every word must match, each one as a prefix
+    hits = client.get("/search", params={"q": "modulo emplead"}).json()["projects"]
+    assert [h["id"] for h in hits] == [intranet["id"]]
+    assert client.get("/search", params={"q": "¿?"}).status_code == 400
+
+
+def test_index_follows_writes(client, seeded_quote):
+    quote_id, role_id = seeded_quote["quote_id"], seeded_quote["role_ids"][0]
+    item = client.post(f"/quotes/{quote_id}/items/", json={
+        "role_id": role_id, "description": "Integración <b>facturación</b> electrónica", "manual_hours": 8.0,
+        "hourly_rate": 50.0}).json()
+
+    hits = client.get("/search", params={"q": "facturacion", "kind": "items"}).json()["items"]
+    assert [(h["id"], h["quote_id"], h["project_name"]) for h in hits] == [(item["id"], quote_id, "Portal Clientes")]
+    assert "&lt;b&gt;<mark>facturación</mark>&lt;/b&gt;" in hits[0]["snippet"]
+
+    client.put(f"/quotes/items/{item['id']}", json={"role_id": role_id, "description": "Reportes", "manual_hours": 8.0,
+                                                    "hourly_rate": 50.0})
+    assert client.get("/search", params={"q": "facturacion"}).json()["items"] == []
+    assert len(client.get("/search", params={"q": "report"}).json()["items"]) == 1
+
+    client.delete(f"/quotes/items/{item['id']}")
+    assert client.get("/search", params={"q": "report", "kind": "items"}).json()["items"] == []
+
+
+def test_install_indexes_existing_rows(client, seeded_quote):
+    with engine.begin() as conn:
+        conn.exec_driver_sql("DROP TRIGGER projects_fts_ai")
+        conn.exec_driver_sql("INSERT INTO projects (name, client_name, status) VALUES ('Migrado', 'ACME', 'DRAFT')")
+    assert client.get("/search", params={"q": "migrado"}).json()["projects"] == []
+
+    assert search.install(engine) == ["projects_fts"] # Missing trigger: recreated and the index rebuilt
+    assert [h["name"] for h in client.get("/search", params={"q": "migrado"}).json()["projects"]] == ["Migrado"]
+    assert search.install(engine) == []
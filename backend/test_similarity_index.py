@@ -0,0 +1,89 @@
+from similarity_index import SimilarityIndex, tokenize
+
+
+def _finalized_project(client, role_ids, requirements, items):
+    project = client.post("/projects/", json={"name": "Histórico", "client_name": "ACME",
+                                              "raw_requirements": requirements}).json()
+    quote = client.post("/quotes/", json={"project_id": project["id"]}).json()
+    for role_id, description, hours in items:
+        client.post(f"/quotes/{quote['id']}/items/", json={"role_id": role_id, "description": description,
+                                                           "manual_hours": hours, "hourly_rate": 50.0})
+    assert client.post(f"/projects/{project['id']}/finalize").status_code == 200
+    return project["id"]
+
+
+def test_tokenize_folds_accents_and_plurals():
+    assert tokenize("Autenticación de Usuarios") == tokenize("autenticacion usuario") == \
+        ["autenticacion", "usuario", "autenticacion_usuario"]
+
+
+def test_finalize_indexes_incrementally_and_persists(client, seeded_quote, tmp_path):
+    backend, qa = seeded_quote["role_ids"]
+    project_id = _finalized_project(client, [backend], "Portal con login", [
+        (backend, "Sistema de autenticación y perfiles", 24.0),
+        (qa, "Pruebas de reportes PDF", 10.0),
+    ])
+    found = client.post("/ai/similar-items", json={"requirements": "autenticacion de usuarios y perfiles",
+                                                   "role_ids": [backend]}).json()
+    assert found[0]["text"] == "Sistema de autenticación y perfiles"
+    assert found[0]["hours"] == 24.0 and found[0]["project_id"] == project_id
+
+    # Re-finalizing replaces the project's documents instead of duplicating them
+    client.post(f"/projects/{project_id}/finalize")
+    from similarity_index import similarity_index
+    assert similarity_index.stats()["documents"] == 3
+
+    reloaded = SimilarityIndex(similarity_index.path)
+    assert reloaded.stats() == similarity_index.stats()
+    assert reloaded.search("pruebas reportes")[0]["role_id"] == qa
+
+
+def test_history_examples_reach_the_prompt(client, fake_llm, seeded_quote):
+    backend, qa = seeded_quote["role_ids"]
+    _finalized_project(client, [backend], "Tienda en línea", [(backend, "Carrito de compras y checkout", 40.0)])
+    fake_llm.items = [{"role_id": backend, "description": "Checkout", "hours": 30.0}]
+
+    resp = client.post(f"/quotes/{seeded_quote['quote_id']}/generate-scope",
+                       json={"requirements": "Necesitamos carrito de compras", "role_ids": [backend, qa]})
+    assert resp.status_code == 200
+    prompt = fake_llm.requests[-1]["messages"][1]["content"]
+    assert "REFERENCIAS HISTÓRICAS" in prompt and "Carrito de compras y checkout" in prompt
+
+
+def test_near_identical_requirements_reuse_items_without_llm(client, fake_llm, seeded_quote):
+    backend, qa = seeded_quote["role_ids"]
+    requirements = "Portal de clientes con autenticación, panel de administración y reportes mensuales en PDF"
+    _finalized_project(client, [backend, qa], requirements, [
+        (backend, "Autenticación y panel de administración", 32.0),
+        (qa, "Pruebas de reportes", 12.0),
+    ])
+    url = f"/quotes/{seeded_quote['quote_id']}/generate-scope"
+
+    resp = client.post(url, json={"requirements": requirements + ".", "role_ids": [backend, qa]})
+    assert resp.status_code == 200
+    assert fake_llm.requests == []
+    assert sorted((i["description"], i["manual_hours"]) for i in resp.json()) == [
+        ("Autenticación y panel de administración", 32.0), ("Pruebas de reportes", 12.0)]
+
+    # A past item whose role was not requested would be lost: go to the model instead
+    fake_llm.items = [{"role_id": backend, "description": "Portal", "hours": 20.0}]
+    resp = client.post(url, json={"requirements": requirements, "role_ids": [backend]})
+    assert len(fake_llm.requests) == 1
+
+    # bypass_cache also skips reuse
+    client.post(url, json={"requirements": requirements, "role_ids": [backend, qa], "bypass_cache": True})
+    assert len(fake_llm.requests) == 2
+
+
+def test_rebuild_from_database(client, seeded_quote):
+    from database import SessionLocal
+    from similarity_index import similarity_index
+
+    backend, _ = seeded_quote["role_ids"]
+    _finalized_project(client, [backend], "Intranet", [(backend, "Gestor documental", 16.0)])
+    similarity_index.clear()
+    assert similarity_index.search("gestor documental") == []
+
+    with SessionLocal() as db:
+        assert similarity_index.rebuild(db) == 2
+    assert similarity_index.search("gestor documental")[0]["hours"] == 16.0